@@ -1,15 +1,26 @@
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 import torch.optim as optim
 import numpy as np
-import random
 import os
+from replay_buffer import ReplayBuffer, PrioritizedReplayBuffer, NStepAccumulator
+from game_state import GameState, get_game_state_for_dqn  # get_game_state_for_dqn re-exported for existing imports
+from targeting import skill_params_for_board, board_types, select_targets
 
 ACTION_MAP_AGENT = {
     0: "normal_attack", 1: "horizontal_shot", 2: "vertical_shot", 3: "heal", 4: "ultimate"
 }
 NUM_ACTIONS = len(ACTION_MAP_AGENT)
+_ACTION_INDEX = {key: idx for idx, key in ACTION_MAP_AGENT.items()}
 STATE_SIZE = 9  # (boss_hp, boss_rage, cd_hshot, cd_vshot, cd_heal, tank, knight, ad, round)
+STATE_DTYPE = np.uint8  # every feature is a small non-negative int (boss HP <= 70), used for replay storage
+
+def available_mask(available_skill_keys):
+    # Boss.get_available_skills_keys() -> bool mask over ACTION_MAP_AGENT
+    mask = np.zeros(NUM_ACTIONS, dtype=bool)
+    mask[[_ACTION_INDEX[key] for key in available_skill_keys if key in _ACTION_INDEX]] = True
+    return mask
 
 class DQNNet(nn.Module):
     def __init__(self, state_size=STATE_SIZE, num_actions=NUM_ACTIONS, hidden_size=64):
@@ -22,9 +33,15 @@ class DQNNet(nn.Module):
         x = self.relu(x)
         x = self.fc2(x)
         return x
+    def forward_inference(self, x):
+        # forward() without the nn.Module call overhead, for single-state latency
+        return F.linear(torch.relu(F.linear(x, self.fc1.weight, self.fc1.bias)), self.fc2.weight, self.fc2.bias)
 
 class DQNAgent:
-    def __init__(self, state_size=STATE_SIZE, num_actions=NUM_ACTIONS, lr=1e-3, gamma=0.7, epsilon=1.0, epsilon_decay=0.9999, epsilon_min=0.05, model_file="Model/dqn_agent.pt"):
+    def __init__(self, state_size=STATE_SIZE, num_actions=NUM_ACTIONS, lr=1e-3, gamma=0.7, epsilon=1.0, epsilon_decay=0.9999, epsilon_min=0.05, model_file="Model/dqn_agent.pt", device=None, batch_size=64, max_memory=10000,
+                 prioritized_replay=False, per_alpha=0.6, per_beta=0.4, per_beta_increment=1e-5,
+                 target_update=None, target_update_every=1000, tau=0.005, double_dqn=False, n_step=1, seed=None,
+                 inference="torch"):
         self.state_size = state_size
         self.num_actions = num_actions
         self.gamma = gamma
@@ -32,16 +49,59 @@ class DQNAgent:
         self.epsilon_decay = epsilon_decay
         self.epsilon_min = epsilon_min
         self.model_file = model_file
+        self.rng = np.random.default_rng(seed) # exploration and targeting draws
 
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = torch.device(device)
         self.policy_net = DQNNet(state_size, num_actions).to(self.device)
         self.optimizer = optim.Adam(self.policy_net.parameters(), lr=lr)
+        # Frozen target network: None (bootstrap from policy_net), "hard" copy every
+        # target_update_every gradient steps, or "soft" Polyak averaging with tau.
+        # Double DQN picks the next action with policy_net and evaluates it with target_net.
+        if double_dqn and target_update is None:
+            target_update = "hard"
+        if target_update not in (None, "hard", "soft"):
+            raise ValueError(f"Unknown target_update mode: {target_update}")
+        self.target_update = target_update
+        self.target_update_every = target_update_every
+        self.tau = tau
+        self.double_dqn = double_dqn
+        self.train_steps = 0
+        self.target_net = None
+        if target_update is not None:
+            self.target_net = DQNNet(state_size, num_actions).to(self.device)
+            self.target_net.load_state_dict(self.policy_net.state_dict())
+            self.target_net.eval()
         self.loss_fn = nn.MSELoss()
-        self.memory = []
-        self.batch_size = 64
-        self.max_memory = 10000
+        self.batch_size = batch_size
+        self.max_memory = max_memory
+        self.prioritized_replay = prioritized_replay
+        if prioritized_replay:
+            self.memory = PrioritizedReplayBuffer(max_memory, state_size, state_dtype=STATE_DTYPE,
+                                                  alpha=per_alpha, beta=per_beta, beta_increment=per_beta_increment)
+        else:
+            self.memory = ReplayBuffer(max_memory, state_size, state_dtype=STATE_DTYPE)
+        # n-step returns are folded in when transitions are stored (see remember/end_episode)
+        self.n_step = n_step
+        self.n_step_buffer = NStepAccumulator(n_step, gamma) if n_step > 1 else None
+        # Single-state Q-values for choose_action: "torch" runs policy_net under inference_mode on
+        # one reused input tensor, "numpy" runs the same MLP on weights exported from policy_net
+        # (re-exported whenever training or load() changed them)
+        if inference not in ("torch", "numpy"):
+            raise ValueError(f"Unknown inference mode: {inference}")
+        self.inference = inference
+        self._state_buf = torch.zeros((1, state_size), dtype=torch.float32, device=self.device)
+        self._state_buf_np = self._state_buf.numpy() if self.device.type == "cpu" else None # shares memory
+        self.weights_version = 0 # bumped by load(); with train_steps it tells when exported weights are stale
+        self._np_weights = None
+        self._np_weights_key = None
 
     def _state_to_vec(self, state_dict):
+        if isinstance(state_dict, GameState):
+            return state_dict.vec # already the 9-float vector, no copy
+        if isinstance(state_dict, np.ndarray):
+            return state_dict.astype(np.float32, copy=False)
         boss_hp = state_dict["boss_hp"]
         boss_rage = state_dict["boss_rage"]
         cd_hshot = state_dict["skill_cooldowns"]["horizontal_shot"]
@@ -53,97 +113,205 @@ class DQNAgent:
         round_idx = state_dict["current_round"]
         return np.array([boss_hp, boss_rage, cd_hshot, cd_vshot, cd_heal, tank, knight, ad, round_idx], dtype=np.float32)
 
-    def choose_action(self, state_dict, available_skill_keys, grid_units_for_targeting):
+    def choose_action(self, state_dict, available_skill_keys, grid_units_for_targeting, rng=None):
+        # Exploration draws from self.rng, targets from rng when given (the game's targeting stream)
         state_vec = self._state_to_vec(state_dict)
-        available_action_indices = [idx for idx, sk_key in ACTION_MAP_AGENT.items() if sk_key in available_skill_keys]
-        if not available_action_indices:
+        mask = available_mask(available_skill_keys)
+        if not mask.any():
             return None, [], None
-        if random.random() < self.epsilon:
-            action_idx = random.choice(available_action_indices)
+        if self.rng.random() < self.epsilon:
+            action_idx = int(self.rng.choice(np.flatnonzero(mask)))
         else:
-            state_tensor = torch.tensor(state_vec, dtype=torch.float32).unsqueeze(0).to(self.device)
-            q_values = self.policy_net(state_tensor).detach().cpu().numpy()[0]
-            masked_q = np.full(NUM_ACTIONS, -np.inf)
-            for idx in available_action_indices:
-                masked_q[idx] = q_values[idx]
-            action_idx = int(np.argmax(masked_q))
+            action_idx = int(np.argmax(np.where(mask, self.q_values(state_vec), -np.inf)))
         chosen_skill_key = ACTION_MAP_AGENT[action_idx]
-        skill_params = self._get_heuristic_skill_params(chosen_skill_key, grid_units_for_targeting)
+        skill_params = self._get_heuristic_skill_params(chosen_skill_key, grid_units_for_targeting, rng)
         return chosen_skill_key, skill_params, action_idx
 
-    def _get_heuristic_skill_params(self, skill_key, grid_units):
-        # Copy logic từ QTableAgent nếu cần
-        player_unit_positions=[]; ads_positions=[]; knights_positions=[]; tanks_positions=[]
-        grid_h = len(grid_units); grid_w = len(grid_units[0]) if grid_h > 0 else 0
-        for r_loop in range(grid_h):
-            for c_loop in range(grid_w):
-                unit = grid_units[r_loop][c_loop]
-                if unit:
-                    player_unit_positions.append((r_loop,c_loop))
-                    if unit.name=="AD": ads_positions.append((r_loop,c_loop))
-                    elif unit.name=="Knight": knights_positions.append((r_loop,c_loop))
-                    elif unit.name=="Tank": tanks_positions.append((r_loop,c_loop))
-        params = {}
-        if skill_key=="normal_attack":
-            target_list_normal = []
-            if ads_positions: target_list_normal = [random.choice(ads_positions)]
-            elif knights_positions: target_list_normal = [random.choice(knights_positions)]
-            elif tanks_positions: target_list_normal = [random.choice(tanks_positions)]
-            elif player_unit_positions: target_list_normal = [random.choice(player_unit_positions)]
-            return target_list_normal
-        elif skill_key=="horizontal_shot":
-            best_row,max_targets=-1,-1
-            for r_idx in range(grid_h):
-                count=sum(1 for c_idx in range(grid_w) if grid_units[r_idx][c_idx] and grid_units[r_idx][c_idx].name in ["AD","Knight"])
-                if count>max_targets:max_targets=count;best_row=r_idx
-            params["line_idx"] = best_row if best_row != -1 else (random.randint(0,grid_h-1) if grid_h > 0 else 0)
-            params["direction"] = random.choice(["ltr", "rtl"])
-        elif skill_key=="vertical_shot":
-            best_col,max_targets=-1,-1
-            for c_idx in range(grid_w):
-                count=sum(1 for r_idx in range(grid_h) if grid_units[r_idx][c_idx] and grid_units[r_idx][c_idx].name in ["AD","Knight"])
-                if count>max_targets:max_targets=count;best_col=c_idx
-            params["line_idx"] = best_col if best_col != -1 else (random.randint(0,grid_w-1) if grid_w > 0 else 0)
-            params["direction"] = random.choice(["ttb", "btt"])
-        elif skill_key=="ultimate":
-            target_list_ulti = []
-            targets_ulti_temp = ads_positions+knights_positions+tanks_positions; random.shuffle(targets_ulti_temp)
-            if len(targets_ulti_temp)<6:
-                empty_cells=[(r_loop,c_loop) for r_loop in range(grid_h) for c_loop in range(grid_w) if grid_units[r_loop][c_loop] is None]
-                random.shuffle(empty_cells); targets_ulti_temp.extend(empty_cells[:6-len(targets_ulti_temp)])
-            target_list_ulti = targets_ulti_temp[:6]
-            return target_list_ulti
-        return params
+    def q_values(self, state_vec):
+        """Q-values of one state vector as a NumPy array (no autograd)."""
+        if self.inference == "numpy":
+            w1, b1, w2, b2 = self._numpy_weights()
+            hidden = state_vec @ w1 + b1
+            np.maximum(hidden, 0, out=hidden)
+            return hidden @ w2 + b2
+        if self._state_buf_np is not None:
+            self._state_buf_np[0] = state_vec
+        else:
+            self._state_buf[0].copy_(torch.as_tensor(state_vec))
+        with torch.inference_mode():
+            return self.policy_net.forward_inference(self._state_buf)[0].cpu().numpy()
+
+    def q_values_batch(self, states):
+        """Q-values of a (B, state_size) float32 array in one forward pass."""
+        if self.inference == "numpy":
+            w1, b1, w2, b2 = self._numpy_weights()
+            hidden = states @ w1 + b1
+            np.maximum(hidden, 0, out=hidden)
+            return hidden @ w2 + b2
+        with torch.inference_mode():
+            return self.policy_net.forward_inference(torch.as_tensor(states, device=self.device)).cpu().numpy()
+
+    def choose_actions_batch(self, states, available, boards=None):
+        """Epsilon-greedy actions for B games with one DQNNet forward pass.
+
+        states: (B, state_size) array or B GameStates/state dicts.
+        available: (B, NUM_ACTIONS) bool mask or B lists from Boss.get_available_skills_keys().
+        boards: optional (B, N) unit type array (BatchedGameEngine.flat_type) or B Bitboards/grid_units.
+        Returns (action_idx, targets): action_idx is (B,) with -1 where no skill is available,
+        targets is select_targets() output for boards (None without boards); use
+        targeting.to_skill_params(skill_key, targets, i, grid_size) for one game's skill_params.
+        Exploration is drawn per row from self.rng.
+        """
+        if not isinstance(states, np.ndarray):
+            states = np.stack([self._state_to_vec(state) for state in states])
+        states = np.asarray(states, dtype=np.float32)
+        if not isinstance(available, np.ndarray):
+            available = np.stack([available_mask(keys) for keys in available])
+        B = len(states)
+        explore = self.rng.random(B) < self.epsilon
+        random_keys = np.where(available, self.rng.random(available.shape), -1.0)
+        action_idx = random_keys.argmax(axis=1)
+        if not explore.all():
+            greedy = ~explore
+            q = self.q_values_batch(states[greedy])
+            action_idx[greedy] = np.where(available[greedy], q, -np.inf).argmax(axis=1)
+        action_idx = np.where(available.any(axis=1), action_idx, -1)
+        if boards is None:
+            return action_idx, None
+        if not isinstance(boards, np.ndarray):
+            boards = np.stack([board_types(board) for board in boards])
+        grid_size = int(round(np.sqrt(boards.shape[1])))
+        return action_idx, select_targets(boards, grid_size, action_idx, self.rng)
+
+    def _numpy_weights(self):
+        if self._np_weights_key != (self.train_steps, self.weights_version):
+            self.refresh_inference_weights()
+        return self._np_weights
+
+    def refresh_inference_weights(self):
+        # Call directly after editing policy_net outside train/load (e.g. rollout workers)
+        net = self.policy_net
+        with torch.no_grad():
+            self._np_weights = tuple(np.ascontiguousarray(t.detach().cpu().numpy(), dtype=np.float32).copy()
+                                     for t in (net.fc1.weight.T, net.fc1.bias, net.fc2.weight.T, net.fc2.bias))
+        self._np_weights_key = (self.train_steps, self.weights_version)
+
+    def _get_heuristic_skill_params(self, skill_key, grid_units, rng=None):
+        # Shared with the other agent, the fallback AI and the batched envs (targeting.py)
+        return skill_params_for_board(skill_key, grid_units, self.rng if rng is None else rng)
 
     def remember(self, state, action, reward, next_state, done):
-        if len(self.memory) >= self.max_memory:
-            self.memory.pop(0)
-        self.memory.append((state, action, reward, next_state, done))
+        if self.n_step_buffer is None:
+            self.memory.add(state, action, reward, next_state, done, 0.0 if done else self.gamma)
+            return
+        for transition in self.n_step_buffer.push(state, action, reward, next_state, done):
+            self.memory.add(*transition)
+
+    def end_episode(self):
+        # Episodes can end without done (round limit), close pending n-step returns
+        if self.n_step_buffer is not None:
+            for transition in self.n_step_buffer.flush():
+                self.memory.add(*transition)
+
+    def remember_states(self, state_dict, action_idx, reward, next_state_dict, done):
+        self.remember(self._state_to_vec(state_dict), action_idx, reward, self._state_to_vec(next_state_dict), done)
 
     def learn(self, state_dict, action_idx, reward, next_state_dict, done):
-        state_vec = self._state_to_vec(state_dict)
-        next_state_vec = self._state_to_vec(next_state_dict)
-        self.remember(state_vec, action_idx, reward, next_state_vec, done)
-        if len(self.memory) < self.batch_size:
+        # Store the transition and do one gradient step. Epsilon is not touched here,
+        # callers decide the exploration schedule with decay_epsilon().
+        self.remember_states(state_dict, action_idx, reward, next_state_dict, done)
+        self.replay()
+
+    def decay_epsilon(self):
+        if self.epsilon > self.epsilon_min:
+            self.epsilon = max(self.epsilon * self.epsilon_decay, self.epsilon_min)
+
+    def replay(self, num_steps=1, batch_size=None):
+        # num_steps gradient steps, each on a fresh random batch from memory
+        batch_size = batch_size or self.batch_size
+        if len(self.memory) < batch_size:
             return
-        batch = random.sample(self.memory, self.batch_size)
-        states, actions, rewards, next_states, dones = zip(*batch)
-        states = torch.tensor(states, dtype=torch.float32).to(self.device)
-        actions = torch.tensor(actions, dtype=torch.int64).unsqueeze(1).to(self.device)
-        rewards = torch.tensor(rewards, dtype=torch.float32).unsqueeze(1).to(self.device)
-        next_states = torch.tensor(next_states, dtype=torch.float32).to(self.device)
-        dones = torch.tensor(dones, dtype=torch.float32).unsqueeze(1).to(self.device)
+        for _ in range(num_steps):
+            self._train_step(batch_size)
+
+    def _train_step(self, batch_size):
+        idx = self.memory.sample_indices(batch_size)
+        states, actions, rewards, next_states, _dones, discounts = self.memory.get(idx)
+        q_values, q_target = self._q_and_targets(states, actions, rewards, next_states, discounts)
+        if self.prioritized_replay:
+            # Importance-sampling weights correct the bias of non-uniform sampling
+            weights = torch.from_numpy(self.memory.importance_weights(idx)).unsqueeze(1).to(self.device)
+            td_errors = q_target - q_values
+            loss = (weights * td_errors.pow(2)).mean()
+        else:
+            loss = self.loss_fn(q_values, q_target)
+        self._gradient_step(loss)
+        if self.prioritized_replay:
+            self.memory.update_priorities(idx, td_errors.detach().abs().cpu().numpy().ravel())
+
+    def _q_and_targets(self, states, actions, rewards, next_states, discounts):
+        # Q(s, a) of policy_net (with grad) and the bootstrapped targets, from NumPy batches
+        states = torch.as_tensor(states, dtype=torch.float32, device=self.device)
+        actions = torch.as_tensor(actions, dtype=torch.int64, device=self.device).unsqueeze(1)
+        rewards = torch.as_tensor(rewards, dtype=torch.float32, device=self.device).unsqueeze(1)
+        next_states = torch.as_tensor(next_states, dtype=torch.float32, device=self.device)
+        discounts = torch.as_tensor(discounts, dtype=torch.float32, device=self.device).unsqueeze(1)
 
         q_values = self.policy_net(states).gather(1, actions)
         with torch.no_grad():
-            q_next = self.policy_net(next_states).max(1)[0].unsqueeze(1)
-            q_target = rewards + self.gamma * q_next * (1 - dones)
-        loss = self.loss_fn(q_values, q_target)
+            bootstrap_net = self.target_net if self.target_net is not None else self.policy_net
+            if self.double_dqn:
+                next_actions = self.policy_net(next_states).argmax(1, keepdim=True)
+                q_next = bootstrap_net(next_states).gather(1, next_actions)
+            else:
+                q_next = bootstrap_net(next_states).max(1)[0].unsqueeze(1)
+            q_target = rewards + discounts * q_next
+        return q_values, q_target
+
+    def _gradient_step(self, loss):
         self.optimizer.zero_grad()
         loss.backward()
         self.optimizer.step()
-        if self.epsilon > self.epsilon_min:
-            self.epsilon *= self.epsilon_decay
+        self.train_steps += 1
+        self._update_target_net()
+
+    def train_on_batch(self, states, actions, rewards, next_states, dones):
+        """One gradient step on a given batch (offline training), same targets as replay(). Returns the loss."""
+        discounts = np.where(dones, 0.0, self.gamma)
+        loss = self.loss_fn(*self._q_and_targets(states, actions, rewards, next_states, discounts))
+        self._gradient_step(loss)
+        return loss.item()
+
+    def td_loss(self, states, actions, rewards, next_states, dones):
+        # Same loss as train_on_batch, without training (validation)
+        with torch.no_grad():
+            discounts = np.where(dones, 0.0, self.gamma)
+            return self.loss_fn(*self._q_and_targets(states, actions, rewards, next_states, discounts)).item()
+
+    def train_bc_on_batch(self, states, actions):
+        """Behavior cloning step: cross-entropy of the Q-values (as logits) against the logged actions."""
+        logits = self.policy_net(torch.as_tensor(states, dtype=torch.float32, device=self.device))
+        loss = F.cross_entropy(logits, torch.as_tensor(actions, dtype=torch.int64, device=self.device))
+        self._gradient_step(loss)
+        return loss.item()
+
+    def _update_target_net(self):
+        if self.target_update == "hard":
+            if self.train_steps % self.target_update_every == 0:
+                self.target_net.load_state_dict(self.policy_net.state_dict())
+        elif self.target_update == "soft":
+            with torch.no_grad():
+                for target_param, param in zip(self.target_net.parameters(), self.policy_net.parameters()):
+                    target_param.mul_(1 - self.tau).add_(param, alpha=self.tau)
+
+    def describe_target_mode(self):
+        if self.target_update is None:
+            mode = "single"
+        elif self.target_update == "hard":
+            mode = f"hard/{self.target_update_every}"
+        else:
+            mode = f"soft/{self.tau:g}"
+        return mode + ("+double" if self.double_dqn else "")
 
     def save(self, filepath=None):
         if filepath is None:
@@ -156,27 +324,7 @@ class DQNAgent:
             filepath = self.model_file
         if os.path.exists(filepath):
             self.policy_net.load_state_dict(torch.load(filepath, map_location=self.device))
+            if self.target_net is not None:
+                self.target_net.load_state_dict(self.policy_net.state_dict())
+            self.weights_version += 1
             print(f"DQN model loaded from {filepath}")
-
-def get_game_state_for_dqn(game_logic_instance):
-    # Copy logic từ get_game_state_for_q_table nếu cần
-    boss=game_logic_instance.boss
-    grid=game_logic_instance.grid_units
-    state_dict={}
-    state_dict["boss_hp"]=boss.current_hp
-    state_dict["boss_max_hp"]=boss.max_hp
-    state_dict["boss_rage"]=boss.current_rage
-    state_dict["skill_cooldowns"]={
-        "horizontal_shot":boss.skills["horizontal_shot"]["cd_timer"],
-        "vertical_shot":boss.skills["vertical_shot"]["cd_timer"],
-        "heal":boss.skills["heal"]["cd_timer"],
-    }
-    unit_counts={"Tank":0,"Knight":0,"AD":0}
-    for r_loop in range(game_logic_instance.grid_size):
-        for c_loop in range(game_logic_instance.grid_size):
-            unit=grid[r_loop][c_loop]
-            if unit and unit.name in unit_counts:
-                unit_counts[unit.name]+=1
-    state_dict["unit_counts"]=unit_counts
-    state_dict["current_round"]=game_logic_instance.current_round
-    return state_dict
\ No newline at end of file
@@ -1,25 +1,55 @@
+import os
+import json
 import numpy as np
 import pickle
-import random
+from array_file import write_arrays, read_arrays, is_array_file
+from experience_log import ExperienceLog, is_experience_log
+from game_state import GameState, STATE_SIZE
+from targeting import skill_params_for_board
+from state_space import StateSpace
 
 ACTION_MAP_AGENT = {
     0: "normal_attack", 1: "horizontal_shot", 2: "vertical_shot", 3: "heal", 4: "ultimate"
 }
 NUM_ACTIONS = len(ACTION_MAP_AGENT)
+DICT_QTABLE_FILE = "qtable.pkl"
+DENSE_QTABLE_FILE = "qtable.qtb" # array_file.py container, memory-mappable
 
 class QTableAgent:
-    def __init__(self, learning_rate=0.1, discount_factor=0.7, exploration_rate=1.0, exploration_decay=0.9999, min_exploration_rate=0.05, qtable_file="qtable.pkl"):
+    """Tabular boss agent.
+
+    By default self.qtable is a dict from state tuples to Q arrays. With dense=True
+    the Q-values live in one (StateSpace.size, NUM_ACTIONS) float32 array indexed
+    by StateSpace.index(); the few states outside the space (e.g. logged between
+    phases, with a cooldown not ticked yet) go to the self.overflow dict.
+    Dense tables are saved as raw arrays that load() memory-maps, and
+    checkpoint() only rewrites the rows learn() changed since the last write.
+    """
+    def __init__(self, learning_rate=0.1, discount_factor=0.7, exploration_rate=1.0, exploration_decay=0.9999, min_exploration_rate=0.05, qtable_file=None, seed=None, dense=False, state_space=None):
         self.lr = learning_rate
         self.gamma = discount_factor  # Ưu tiên reward tức thời
         self.epsilon = exploration_rate
         self.epsilon_decay = exploration_decay
         self.epsilon_min = min_exploration_rate
-        self.qtable = dict()
-        self.qtable_file = qtable_file
+        self.dense = dense
+        if dense:
+            self.space = state_space or StateSpace()
+            # np.zeros pages are only committed once written, untouched states cost nothing
+            self.qtable = np.zeros((self.space.size, NUM_ACTIONS), dtype=np.float32)
+            self.overflow = dict()
+            self._dirty_rows = set() # rows changed since the last save/checkpoint
+            self._full_save_needed = False # overflow changed, or the table was replaced
+            self._mapped_file = None # (st_dev, st_ino) of the file an "r+" table maps
+        else:
+            self.qtable = dict()
+        self.qtable_file = qtable_file or (DENSE_QTABLE_FILE if dense else DICT_QTABLE_FILE)
+        self.rng = np.random.default_rng(seed) # exploration and targeting draws
 
     def _state_to_key(self, state_dict):
         # Chuyển state dict thành tuple để làm key cho Q-table
         # (hp, rage, cd_hshot, cd_vshot, cd_heal, tank, knight, ad, round)
+        if isinstance(state_dict, GameState):
+            return tuple(int(x) for x in state_dict.vec)
         boss_hp = state_dict["boss_hp"]
         boss_rage = state_dict["boss_rage"]
         cd_hshot = state_dict["skill_cooldowns"]["horizontal_shot"]
@@ -31,97 +61,274 @@ class QTableAgent:
         round_idx = state_dict["current_round"]
         return (boss_hp, boss_rage, cd_hshot, cd_vshot, cd_heal, tank, knight, ad, round_idx)
 
-    def choose_action(self, state_dict, available_skill_keys, grid_units_for_targeting):
+    def _q_row(self, state_key, create=False, will_write=False):
+        # Q array of one state (a view into the dense table when possible), None if unseen
+        if self.dense:
+            idx = self.space.index(state_key)
+            if idx >= 0:
+                if will_write:
+                    self._dirty_rows.add(idx)
+                return self.qtable[idx]
+            table = self.overflow
+            self._full_save_needed |= will_write
+        else:
+            table = self.qtable
+        if create and state_key not in table:
+            table[state_key] = np.zeros(NUM_ACTIONS)
+        return table.get(state_key)
+
+    def choose_action(self, state_dict, available_skill_keys, grid_units_for_targeting, rng=None):
+        # Exploration draws from self.rng, targets from rng when given (the game's targeting stream)
         state_key = self._state_to_key(state_dict)
         available_action_indices = [idx for idx, sk_key in ACTION_MAP_AGENT.items() if sk_key in available_skill_keys]
         if not available_action_indices:
             return None, [], None
-        if random.random() < self.epsilon:
-            action_idx = random.choice(available_action_indices)
+        if self.rng.random() < self.epsilon:
+            action_idx = available_action_indices[int(self.rng.integers(len(available_action_indices)))]
         else:
-            q_values = self.qtable.get(state_key, np.zeros(NUM_ACTIONS))
+            q_values = self._q_row(state_key)
+            if q_values is None:
+                q_values = np.zeros(NUM_ACTIONS)
             masked_q = np.full(NUM_ACTIONS, -np.inf)
             for idx in available_action_indices:
                 masked_q[idx] = q_values[idx]
             action_idx = int(np.argmax(masked_q))
         chosen_skill_key = ACTION_MAP_AGENT[action_idx]
-        skill_params = self._get_heuristic_skill_params(chosen_skill_key, grid_units_for_targeting)
+        skill_params = self._get_heuristic_skill_params(chosen_skill_key, grid_units_for_targeting, rng)
         return chosen_skill_key, skill_params, action_idx
 
-    def _get_heuristic_skill_params(self, skill_key, grid_units):
-        # Copy từ agent.py, giữ nguyên logic chọn mục tiêu
-        player_unit_positions=[]; ads_positions=[]; knights_positions=[]; tanks_positions=[]
-        grid_h = len(grid_units); grid_w = len(grid_units[0]) if grid_h > 0 else 0
-        for r_loop in range(grid_h):
-            for c_loop in range(grid_w):
-                unit = grid_units[r_loop][c_loop]
-                if unit:
-                    player_unit_positions.append((r_loop,c_loop))
-                    if unit.name=="AD": ads_positions.append((r_loop,c_loop))
-                    elif unit.name=="Knight": knights_positions.append((r_loop,c_loop))
-                    elif unit.name=="Tank": tanks_positions.append((r_loop,c_loop))
-        params = {}
-        if skill_key=="normal_attack":
-            target_list_normal = []
-            if ads_positions: target_list_normal = [random.choice(ads_positions)]
-            elif knights_positions: target_list_normal = [random.choice(knights_positions)]
-            elif tanks_positions: target_list_normal = [random.choice(tanks_positions)]
-            elif player_unit_positions: target_list_normal = [random.choice(player_unit_positions)]
-            return target_list_normal
-        elif skill_key=="horizontal_shot":
-            best_row,max_targets=-1,-1
-            for r_idx in range(grid_h):
-                count=sum(1 for c_idx in range(grid_w) if grid_units[r_idx][c_idx] and grid_units[r_idx][c_idx].name in ["AD","Knight"])
-                if count>max_targets:max_targets=count;best_row=r_idx
-            params["line_idx"] = best_row if best_row != -1 else (random.randint(0,grid_h-1) if grid_h > 0 else 0)
-            params["direction"] = random.choice(["ltr", "rtl"])
-        elif skill_key=="vertical_shot":
-            best_col,max_targets=-1,-1
-            for c_idx in range(grid_w):
-                count=sum(1 for r_idx in range(grid_h) if grid_units[r_idx][c_idx] and grid_units[r_idx][c_idx].name in ["AD","Knight"])
-                if count>max_targets:max_targets=count;best_col=c_idx
-            params["line_idx"] = best_col if best_col != -1 else (random.randint(0,grid_w-1) if grid_w > 0 else 0)
-            params["direction"] = random.choice(["ttb", "btt"])
-        elif skill_key=="ultimate":
-            target_list_ulti = []
-            targets_ulti_temp = ads_positions+knights_positions+tanks_positions; random.shuffle(targets_ulti_temp)
-            if len(targets_ulti_temp)<6:
-                empty_cells=[(r_loop,c_loop) for r_loop in range(grid_h) for c_loop in range(grid_w) if grid_units[r_loop][c_loop] is None]
-                random.shuffle(empty_cells); targets_ulti_temp.extend(empty_cells[:6-len(targets_ulti_temp)])
-            target_list_ulti = targets_ulti_temp[:6]
-            return target_list_ulti
-        return params
+    def _get_heuristic_skill_params(self, skill_key, grid_units, rng=None):
+        # Shared with the other agent, the fallback AI and the batched envs (targeting.py)
+        return skill_params_for_board(skill_key, grid_units, self.rng if rng is None else rng)
 
     def learn(self, state_dict, action_idx, reward, next_state_dict, done):
         state_key = self._state_to_key(state_dict)
-        next_state_key = self._state_to_key(next_state_dict)
-        if state_key not in self.qtable:
-            self.qtable[state_key] = np.zeros(NUM_ACTIONS)
-        if next_state_key not in self.qtable:
-            self.qtable[next_state_key] = np.zeros(NUM_ACTIONS)
-        q_predict = self.qtable[state_key][action_idx]
+        if not self.dense:
+            # Dict mode keeps a (zero) row for every state seen; the dense table already has
+            # one for every decision state and post-action states outside it are never read
+            self._q_row(self._state_to_key(next_state_dict), create=True)
         q_target = reward  # reward tức thời, gamma=0
-        self.qtable[state_key][action_idx] += self.lr * (q_target - q_predict)
+        self._update(state_key, action_idx, q_target)
         if self.epsilon > self.epsilon_min:
             self.epsilon *= self.epsilon_decay
 
+    def _update(self, state_key, action_idx, q_target):
+        q_row = self._q_row(state_key, create=True, will_write=True)
+        q_row[action_idx] += self.lr * (q_target - q_row[action_idx])
+
+    def learn_batch(self, states, actions, rewards, next_states=None, dones=None, bootstrap=False):
+        """Same result as calling learn() on every row in order, in a few array operations (dense mode).
+
+        states/next_states: (B, STATE_SIZE) arrays in GameState.vec layout, or lists of
+        state dicts. The k updates hitting one (state, action) collapse to
+            q <- (1 - lr)^k * q + sum_i lr * (1 - lr)^(k-1-i) * target_i
+        so duplicates are exact. bootstrap=True uses reward + gamma * max Q(next_state)
+        (Q from before the batch) instead of learn()'s immediate reward.
+        Dict mode loops over the rows.
+        """
+        states = _state_array(states)
+        actions = np.asarray(actions, dtype=np.int64)
+        targets = np.asarray(rewards, dtype=np.float64)
+        if next_states is not None:
+            next_states = _state_array(next_states)
+        if bootstrap:
+            not_done = 1.0 - np.asarray(dones, dtype=np.float64)
+            targets = targets + self.gamma * not_done * self._max_q_batch(next_states)
+        if not self.dense:
+            for i, state_key in enumerate(map(tuple, states.astype(np.int64).tolist())):
+                if next_states is not None:
+                    self._q_row(tuple(int(x) for x in next_states[i]), create=True)
+                self._update(state_key, actions[i], targets[i])
+        else:
+            idx = self.space.index_batch(states)
+            for i in np.flatnonzero(idx < 0): # overflow states, rare: one by one
+                self._update(tuple(int(x) for x in states[i]), actions[i], targets[i])
+            inside = idx >= 0
+            cells = idx[inside] * NUM_ACTIONS + actions[inside]
+            order = np.argsort(cells, kind="stable") # keeps log order within a cell
+            cells, cell_targets = cells[order], targets[inside][order]
+            starts = np.flatnonzero(np.r_[True, cells[1:] != cells[:-1]])
+            counts = np.diff(np.r_[starts, len(cells)])
+            later = np.repeat(starts + counts, counts) - 1 - np.arange(len(cells)) # updates after this one in its cell
+            keep = 1.0 - self.lr
+            group = np.repeat(np.arange(len(starts)), counts)
+            contrib = np.bincount(group, weights=self.lr * keep ** later * cell_targets, minlength=len(starts))
+            flat = self.qtable.reshape(-1)
+            unique_cells = cells[starts]
+            flat[unique_cells] = keep ** counts * flat[unique_cells] + contrib
+            self._dirty_rows.update((unique_cells // NUM_ACTIONS).tolist())
+        self._decay_epsilon(len(actions))
+
+    def _decay_epsilon(self, steps):
+        # Same as `steps` learn() calls: decays until it first drops to epsilon_min or below
+        if steps <= 0 or self.epsilon <= self.epsilon_min:
+            return
+        if 0 < self.epsilon_decay < 1 and self.epsilon_min > 0:
+            steps = min(steps, int(np.ceil(np.log(self.epsilon_min / self.epsilon) / np.log(self.epsilon_decay))))
+        self.epsilon *= self.epsilon_decay ** steps
+
+    def _max_q_batch(self, states):
+        if self.dense:
+            idx = self.space.index_batch(states)
+            max_q = self.qtable[np.maximum(idx, 0)].max(axis=1).astype(np.float64)
+            outside = np.flatnonzero(idx < 0)
+        else:
+            max_q = np.zeros(len(states))
+            outside = range(len(states))
+        for i in outside:
+            q_values = self._q_row(tuple(int(x) for x in states[i]))
+            max_q[i] = q_values.max() if q_values is not None else 0.0
+        return max_q
+
+    def to_dict(self):
+        # Dict-mode table (only states with a non-zero row in dense mode)
+        if not self.dense:
+            return self.qtable
+        table = dict(self.overflow)
+        rows = np.flatnonzero(self.qtable.any(axis=1))
+        for key, q_values in zip(self.space.states_at(rows).astype(np.int64).tolist(), self.qtable[rows]):
+            table[tuple(key)] = q_values.astype(np.float64)
+        return table
+
+    def from_dict(self, table):
+        if not self.dense:
+            self.qtable = table
+            return
+        self.qtable = np.zeros(self.qtable.shape, dtype=self.qtable.dtype) # fresh lazily-committed pages
+        self.overflow = dict()
+        self._full_save_needed = True
+        for state_key, q_values in table.items():
+            idx = self.space.index(state_key)
+            if idx >= 0:
+                self.qtable[idx] = q_values
+            else:
+                self.overflow[state_key] = q_values
+
     def save(self, filepath=None):
         if filepath is None:
             filepath = self.qtable_file
-        with open(filepath, "wb") as f:
-            pickle.dump(self.qtable, f)
+        if self.dense:
+            self._write_dense(filepath)
+        else:
+            with open(filepath, "wb") as f:
+                pickle.dump(self.qtable, f)
         print(f"Q-table saved to {filepath}")
 
-    def load(self, filepath=None):
+    def _write_dense(self, filepath):
+        # write_arrays replaces the file: an "r+" table mapping it must follow to the new one
+        remap = self._maps_file(filepath)
+        keys = [key for key, q_values in self.overflow.items() if np.any(q_values)] # zero rows = unseen
+        write_arrays(filepath, {
+            "q": self.qtable,
+            "overflow_keys": np.array(keys, dtype=np.int32).reshape(len(keys), STATE_SIZE),
+            "overflow_q": np.array([self.overflow[key] for key in keys], dtype=np.float32).reshape(len(keys), NUM_ACTIONS),
+        }, meta={"state_space": self.space.describe(), "actions": [ACTION_MAP_AGENT[i] for i in range(NUM_ACTIONS)]})
+        if remap:
+            self.qtable = read_arrays(filepath, mode="r+")[0]["q"]
+            self._mapped_file = _file_id(filepath)
+        self._dirty_rows.clear()
+        self._full_save_needed = False
+
+    def _maps_file(self, filepath):
+        # True when learn() writes straight into filepath's current inode (compared by inode:
+        # after os.replace the old path still names a file, just not the mapped one)
+        return (isinstance(self.qtable, np.memmap) and self.qtable.mode == "r+"
+                and os.path.exists(filepath) and _file_id(filepath) == self._mapped_file)
+
+    def checkpoint(self, filepath=None):
+        """Dense mode: write only the rows learn() changed since the last save/checkpoint
+        into an existing file. Falls back to save() (dict mode, new file, overflow changes)."""
+        if filepath is None:
+            filepath = self.qtable_file
+        if not self.dense or self._full_save_needed or not os.path.exists(filepath) or not is_array_file(filepath):
+            return self.save(filepath)
+        if self._maps_file(filepath):
+            self.qtable.flush() # learn() already wrote into the file's pages
+        else:
+            arrays, meta = read_arrays(filepath, mode="r+")
+            if meta.get("state_space") != self.space.describe():
+                return self.save(filepath)
+            rows = np.array(sorted(self._dirty_rows), dtype=np.int64)
+            arrays["q"][rows] = self.qtable[rows]
+            arrays["q"].flush()
+        print(f"Q-table checkpoint: {len(self._dirty_rows)} rows written to {filepath}")
+        self._dirty_rows.clear()
+
+    def load(self, filepath=None, mmap_mode="c"):
+        """Loads a pickled dict or a dense array file (either mode converts).
+
+        mmap_mode for array files: "c" maps copy-on-write (instant start, learn() works,
+        the file is untouched), "r" read-only (evaluators share the pages), "r+" writes
+        learn() updates straight to the file, None reads it into memory.
+        """
         if filepath is None:
             filepath = self.qtable_file
         try:
-            with open(filepath, "rb") as f:
-                self.qtable = pickle.load(f)
+            if is_array_file(filepath):
+                self._load_dense(filepath, mmap_mode)
+            else:
+                with open(filepath, "rb") as f:
+                    self.from_dict(pickle.load(f))
             print(f"Q-table loaded from {filepath}")
         except Exception as e:
             print(f"Could not load Q-table: {e}")
 
+    def _load_dense(self, filepath, mmap_mode):
+        arrays, meta = read_arrays(filepath, mode=mmap_mode)
+        space = StateSpace.from_description(meta["state_space"])
+        overflow = {tuple(key): q_values.astype(np.float64)
+                    for key, q_values in zip(arrays["overflow_keys"].tolist(), arrays["overflow_q"])}
+        if not self.dense:
+            rows = np.flatnonzero(arrays["q"].any(axis=1))
+            self.qtable = {tuple(key): q_values.astype(np.float64)
+                           for key, q_values in zip(space.states_at(rows).astype(np.int64).tolist(), arrays["q"][rows])}
+            self.qtable.update(overflow)
+            return
+        if space.describe() != self.space.describe():
+            raise ValueError(f"{filepath} was saved for a different state space")
+        self.qtable = arrays["q"]
+        self._mapped_file = _file_id(filepath) if mmap_mode == "r+" else None
+        self.overflow = overflow
+        self._dirty_rows.clear()
+        self._full_save_needed = False
+
+def _file_id(path):
+    st = os.stat(path)
+    return st.st_dev, st.st_ino
+
+def _state_array(states):
+    if isinstance(states, np.ndarray):
+        return states
+    return np.stack([(s if isinstance(s, GameState) else GameState.from_dict(s)).vec for s in states])
+
+
+def load_boss_action_log(path="Model/boss_actions.csv"):
+    """(states, actions, rewards, next_states, dones) arrays of a boss action log: the JSONL
+    written by main.log_boss_action, or its columnar form (experience_log.py, no parsing)."""
+    if is_experience_log(path):
+        log = ExperienceLog(path)
+        known = np.asarray(log["action"]) >= 0
+        return (np.asarray(log["state"])[known], log["action"][known].astype(np.int64), log["reward"][known].astype(np.float64),
+                np.asarray(log["next_state"])[known], np.asarray(log["done"])[known])
+    action_idx = {name: idx for idx, name in ACTION_MAP_AGENT.items()}
+    states, actions, rewards, next_states, dones = [], [], [], [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry["action"] not in action_idx:
+                continue
+            states.append(GameState.from_dict(json.loads(entry["state"])).vec)
+            actions.append(action_idx[entry["action"]])
+            rewards.append(entry["reward"])
+            next_states.append(GameState.from_dict(json.loads(entry["next_state"])).vec)
+            dones.append(entry["done"])
+    empty = np.zeros((0, STATE_SIZE), dtype=np.float32)
+    return (np.stack(states) if states else empty, np.array(actions, dtype=np.int64), np.array(rewards, dtype=np.float64),
+            np.stack(next_states) if next_states else empty, np.array(dones, dtype=bool))
+
+
 def get_game_state_for_q_table(game_logic_instance):
     boss=game_logic_instance.boss
     grid=game_logic_instance.grid_units
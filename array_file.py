@@ -0,0 +1,72 @@
+# array_file.py
+# Small container for named NumPy arrays that can be memory-mapped back:
+#   8-byte magic | uint64 header length | JSON header | arrays, each at a 64-byte aligned offset
+# The header holds free-form "meta" plus dtype/shape/offset of every array.
+import json
+import os
+import numpy as np
+
+MAGIC = b"TGARR01\0"
+ALIGN = 64
+_PREFIX_SIZE = len(MAGIC) + 8
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write_arrays(path, arrays, meta=None):
+    """Write {name: array} (C order) to path atomically (temp file + rename)."""
+    specs = [(name, np.ascontiguousarray(arr)) for name, arr in arrays.items()]
+    entries = {name: {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": 10**18} for name, arr in specs}
+    header = {"meta": meta or {}, "arrays": entries}
+    # Size the header with worst-case offsets, then lay the arrays out behind it
+    header_size = _align(_PREFIX_SIZE + len(json.dumps(header).encode())) - _PREFIX_SIZE
+    offset = _PREFIX_SIZE + header_size
+    for name, arr in specs:
+        offset = _align(offset)
+        entries[name]["offset"] = offset
+        offset += arr.nbytes
+    header_bytes = json.dumps(header).encode()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(np.uint64(header_size).tobytes())
+        f.write(header_bytes.ljust(header_size, b" "))
+        for name, arr in specs:
+            f.seek(entries[name]["offset"])
+            arr.tofile(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def is_array_file(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an array file")
+        header_size = int(np.frombuffer(f.read(8), dtype=np.uint64)[0])
+        return json.loads(f.read(header_size).decode())
+
+
+def read_arrays(path, mode="r"):
+    """({name: array}, meta). mode "r"/"r+"/"c" memory-maps the arrays (read-only / in place /
+    copy-on-write), None loads them into memory."""
+    header = read_header(path)
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        if mode is None:
+            with open(path, "rb") as f:
+                f.seek(spec["offset"])
+                arrays[name] = np.fromfile(f, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+        elif int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype) # np.memmap refuses empty maps
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode=mode, offset=spec["offset"], shape=shape)
+    return arrays, header["meta"]
@@ -0,0 +1,123 @@
+# async_logger.py
+# Append-only line logs written by a background thread, so the game/UI thread never
+# waits on disk I/O. Records go through a bounded queue and are formatted, written and
+# flushed in batches with the file handles kept open.
+import atexit
+import os
+import queue
+import threading
+import time
+
+DEFAULT_MAX_QUEUE = 100000
+DEFAULT_BATCH_SIZE = 512
+
+
+class AsyncLineLogger:
+    """Background writer for line-oriented log files.
+
+    log(path, format_line, *args) enqueues one record without blocking; the writer
+    thread calls format_line(*args) -> str (one line, no newline) and appends it to
+    path. When the queue is full the record is dropped and counted in self.dropped
+    rather than stalling the caller.
+
+    Flush policy: the writer flushes its buffers whenever it has drained the queue,
+    and at least every flush_interval seconds under sustained load; fsync=True also
+    fsyncs after each flush (durable but slower). flush() waits until everything
+    logged so far is written, close() (also run at exit) drains the queue and
+    closes the files.
+    """
+    def __init__(self, max_queue=DEFAULT_MAX_QUEUE, batch_size=DEFAULT_BATCH_SIZE, flush_interval=1.0, fsync=False):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.dropped = 0
+        self.written = 0
+        self.errors = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._files = {}
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="AsyncLineLogger", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def log(self, path, format_line, *args):
+        if self._closed:
+            return
+        try:
+            self._queue.put_nowait((path, format_line, args))
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=None):
+        """Blocks until every record logged before this call is written and flushed.
+
+        With a timeout it waits at most that long (also for room in a full queue) and
+        returns False when the writer has not caught up yet.
+        """
+        if self._closed or not self._thread.is_alive():
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        done = threading.Event()
+        try:
+            self._queue.put((None, done, ()), timeout=timeout) # marker, blocking put so it cannot be dropped
+        except queue.Full:
+            return False
+        return done.wait(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+    def close(self):
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join()
+        atexit.unregister(self.close)
+
+    def _run(self):
+        last_flush = time.monotonic()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = batch[-1] is None
+            markers = []
+            for path, format_line, args in (batch[:-1] if stop else batch):
+                if path is None:
+                    markers.append(format_line)
+                else:
+                    self._write(path, format_line, args)
+            # Flush once the queue is drained; under sustained load at least every flush_interval
+            if stop or markers or self._queue.empty() or time.monotonic() - last_flush >= self.flush_interval:
+                self._flush_files()
+                last_flush = time.monotonic()
+            for done in markers:
+                done.set()
+            if stop:
+                break
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+    def _write(self, path, format_line, args):
+        try:
+            f = self._files.get(path)
+            if f is None:
+                f = self._files[path] = open(path, "a", encoding="utf-8")
+            f.write(format_line(*args) + "\n")
+            self.written += 1
+        except Exception as e:
+            self.errors += 1
+            print(f"[Logger] Error writing to {path}: {e}")
+
+    def _flush_files(self):
+        for path, f in self._files.items():
+            try:
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            except Exception as e:
+                self.errors += 1
+                print(f"[Logger] Error flushing {path}: {e}")
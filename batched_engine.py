@@ -0,0 +1,340 @@
+# batched_engine.py
+# Vectorized NumPy version of GameLogic that steps B boards at once.
+# Same rules and rewards as game_logic.py, in the training turn order:
+#   reset -> [place units -> player_attack -> boss_step -> next_round] * rounds
+import numpy as np
+from units import PLAYER_UNIT_SPECS
+from boss import Boss
+from shot_table import get_shot_table, CELL_STATES, CELL_CODE, SHOT_INSTANCES
+from game_constants import (UNIT_TYPE_NAMES, UNIT_TYPE_IDS, ACTION_KEYS, NORMAL_ATTACK, HORIZONTAL_SHOT,
+                            VERTICAL_SHOT, HEAL, ULTIMATE, ULTIMATE_MAX_TARGETS)
+
+TANK = UNIT_TYPE_IDS["Tank"]
+_UNIT_PROTOS = [spec["class"]() for spec in PLAYER_UNIT_SPECS.values()]
+UNIT_MAX_HP = np.array([0] + [u.max_hp for u in _UNIT_PROTOS], dtype=np.int8)
+UNIT_ATTACK = np.array([0] + [u.attack_power for u in _UNIT_PROTOS], dtype=np.int16)
+UNIT_MAX_STOCK = np.array([spec["max_accumulation"] for spec in PLAYER_UNIT_SPECS.values()], dtype=np.int8)
+
+COOLDOWN_KEYS = ("horizontal_shot", "vertical_shot", "heal")  # columns of cooldowns
+
+# Board (type id, hp) <-> shot_table cell code
+_CELL_CODE_LUT = np.zeros((len(UNIT_TYPE_NAMES), int(UNIT_MAX_HP.max()) + 1), dtype=np.uint8)
+for (_name, _hp), _code in CELL_CODE.items():
+    _CELL_CODE_LUT[UNIT_TYPE_IDS[_name], _hp] = _code
+_CODE_TYPE = np.array([UNIT_TYPE_IDS[st[0]] if st else 0 for st in CELL_STATES], dtype=np.int8)
+_CODE_HP = np.array([st[1] if st else 0 for st in CELL_STATES], dtype=np.int8)
+
+
+class BatchedGameEngine:
+    """Holds B independent boards as NumPy arrays.
+
+    Board cells are addressed by flat index r * grid_size + c. Boards that are
+    game over are left untouched by every step until reset() is called on them.
+    """
+    def __init__(self, num_boards, grid_size=4, max_rounds=9, rng=None):
+        self.num_boards = num_boards
+        self.grid_size = grid_size
+        self.num_cells = grid_size * grid_size
+        self.max_rounds = max_rounds
+        self.rng = rng if rng is not None else np.random.default_rng()
+
+        boss = Boss()
+        self.boss_max_hp = boss.max_hp
+        self.boss_max_rage = boss.max_rage
+        self.skill_cds = np.array([boss.skills[k]["cd"] for k in COOLDOWN_KEYS], dtype=np.int8)
+        self.heal_amount = boss.skills["heal"]["heal_amount"]
+        self.ultimate_rage_cost = boss.skills["ultimate"]["rage_cost"]
+        self.normal_damage = boss.skills["normal_attack"]["damage"]
+        self.shot_damage = boss.skills["horizontal_shot"]["damage"]
+        self.ultimate_damage = boss.skills["ultimate"]["damage"]
+        self.shot_table = get_shot_table(grid_size, self.shot_damage)
+        self._shot_powers = np.array(self.shot_table.powers, dtype=np.int64)
+        self.max_units_to_place_round_1 = 7
+        self.max_units_to_place_later_rounds = 2
+
+        B, G = num_boards, grid_size
+        self.unit_type = np.zeros((B, G, G), dtype=np.int8)
+        self.unit_hp = np.zeros((B, G, G), dtype=np.int8)
+        self.boss_hp = np.zeros(B, dtype=np.int16)
+        self.rage = np.zeros(B, dtype=np.int8)
+        self.cooldowns = np.zeros((B, len(COOLDOWN_KEYS)), dtype=np.int8)
+        self.round = np.zeros(B, dtype=np.int16)
+        self.stock = np.zeros((B, len(UNIT_MAX_STOCK)), dtype=np.int8)
+        self.units_placed = np.zeros(B, dtype=np.int8)
+        self.ultimate_count = np.zeros(B, dtype=np.int16)
+        self.game_over = np.ones(B, dtype=bool)
+        self._boards = np.arange(B)
+
+    # --- Views / queries ---
+    @property
+    def flat_type(self):
+        return self.unit_type.reshape(self.num_boards, self.num_cells)
+
+    @property
+    def flat_hp(self):
+        return self.unit_hp.reshape(self.num_boards, self.num_cells)
+
+    def unit_counts(self):
+        """(B, 3) counts of Tank, Knight, AD on each board."""
+        flat = self.flat_type
+        return np.stack([(flat == t).sum(axis=1) for t in range(1, len(UNIT_TYPE_NAMES))], axis=1)
+
+    def get_states(self):
+        """(B, 9) float32 state vectors, same layout as DQNAgent._state_to_vec."""
+        states = np.empty((self.num_boards, 9), dtype=np.float32)
+        states[:, 0] = self.boss_hp
+        states[:, 1] = self.rage
+        states[:, 2:5] = self.cooldowns
+        states[:, 5:8] = self.unit_counts()
+        states[:, 8] = self.round
+        return states
+
+    def available_actions(self):
+        """(B, 5) bool mask, same rule as Boss.get_available_skills_keys."""
+        mask = np.ones((self.num_boards, len(ACTION_KEYS)), dtype=bool)
+        mask[:, HORIZONTAL_SHOT:HEAL + 1] = self.cooldowns == 0
+        mask[:, ULTIMATE] = self.rage >= self.ultimate_rage_cost
+        return mask
+
+    def max_units_to_place(self):
+        return np.where(self.round == 1, self.max_units_to_place_round_1, self.max_units_to_place_later_rounds)
+
+    def boss_won(self):
+        # Same outcome rule as the training loop: boss wins only by surviving the round limit
+        return (self.round >= self.max_rounds) & (self.boss_hp > 0)
+
+    # --- Episode control ---
+    def reset(self, mask=None):
+        """Starts a new game on the boards in mask (all boards by default)."""
+        if mask is None:
+            mask = np.ones(self.num_boards, dtype=bool)
+        self.unit_type[mask] = 0
+        self.unit_hp[mask] = 0
+        self.boss_hp[mask] = self.boss_max_hp
+        self.rage[mask] = 0
+        self.cooldowns[mask] = 0
+        self.round[mask] = 1
+        self.stock[mask] = UNIT_MAX_STOCK
+        self.units_placed[mask] = 0
+        self.ultimate_count[mask] = 0
+        self.game_over[mask] = False
+        return self.get_states()
+
+    def next_round(self):
+        """proceed_to_next_round for every live board. Returns the game_over mask."""
+        live = ~self.game_over
+        finished = live & (((self.round >= self.max_rounds) & (self.boss_hp > 0)) | (self.boss_hp <= 0))
+        self.game_over |= finished
+        advance = live & ~finished
+        self.round[advance] += 1
+        self.units_placed[advance] = 0
+        self.cooldowns[advance] = np.maximum(self.cooldowns[advance] - 1, 0)
+        self.stock[advance] = np.minimum(self.stock[advance] + 1, UNIT_MAX_STOCK)
+        return self.game_over.copy()
+
+    # --- Player phase ---
+    def place_units(self, unit_types, cells):
+        """Places at most one unit per board: unit_types (B,) ids (0 = skip), cells (B,) flat indices.
+
+        Returns a (B,) bool mask of successful placements (same checks as place_unit_from_stock).
+        """
+        b = self._boards
+        unit_types = np.asarray(unit_types)
+        cells = np.clip(np.asarray(cells), 0, self.num_cells - 1)
+        stock_idx = np.clip(unit_types - 1, 0, None)
+        ok = (~self.game_over) & (unit_types > 0) & (self.units_placed < self.max_units_to_place())
+        ok &= self.stock[b, stock_idx] > 0
+        ok &= self.flat_type[b, cells] == 0
+        bo, co, to = b[ok], cells[ok], unit_types[ok]
+        self.flat_type[bo, co] = to
+        self.flat_hp[bo, co] = UNIT_MAX_HP[to]
+        self.stock[bo, stock_idx[ok]] -= 1
+        self.units_placed[bo] += 1
+        return ok
+
+    def random_placement(self, rng=None):
+        """Vectorized random_player_policy: each placement draws a uniform unit type with
+        stock left and a uniform empty cell."""
+        rng = rng if rng is not None else self.rng
+        for _ in range(max(self.max_units_to_place_round_1, self.max_units_to_place_later_rounds)):
+            has_stock = self.stock > 0
+            empty = self.flat_type == 0
+            want = (~self.game_over) & (self.units_placed < self.max_units_to_place()) & has_stock.any(1) & empty.any(1)
+            if not want.any():
+                break
+            type_keys = np.where(has_stock, rng.random(has_stock.shape), -1.0)
+            cell_keys = np.where(empty, rng.random(empty.shape), -1.0)
+            unit_types = np.where(want, type_keys.argmax(axis=1) + 1, 0)
+            self.place_units(unit_types, cell_keys.argmax(axis=1))
+
+    def player_attack(self):
+        """process_player_attack for every live board. Returns (rewards, done)."""
+        live = ~self.game_over
+        damage = np.where(live, UNIT_ATTACK[self.flat_type].sum(axis=1), 0)
+        self.boss_hp = np.maximum(self.boss_hp - damage, 0).astype(np.int16)
+        rewards = -damage.astype(np.float32)
+        died = live & (damage > 0) & (self.boss_hp <= 0)
+        rewards[died] -= 100
+        self.game_over |= died
+        return rewards, died
+
+    # --- Boss phase ---
+    def boss_step(self, actions, targets):
+        """process_boss_attack for every live board.
+
+        actions: (B,) action ids (-1 = no action, board is skipped).
+        targets: dict of (B,...) arrays, only the entries for the used skills are read:
+          "cell"     flat cell for normal_attack (-1 = no target)
+          "line"     row/column index for horizontal/vertical shot
+          "reverse"  bool, shot goes right-to-left / bottom-to-top
+          "ultimate" (B, K) flat cells for ultimate (-1 = padding)
+        Returns (rewards, done) with the same reward shaping as GameLogic.
+        """
+        B, N, G = self.num_boards, self.num_cells, self.grid_size
+        b = self._boards
+        actions = np.asarray(actions)
+        acting = (~self.game_over) & (actions >= 0)
+        rewards = np.zeros(B, dtype=np.float32)
+        done = np.zeros(B, dtype=bool)
+        destroyed = np.zeros(B, dtype=np.int16)
+        flat_type, flat_hp = self.flat_type, self.flat_hp
+
+        # Ultimate without enough rage fails like apply_skill_effect_and_cd returning False
+        is_ult = acting & (actions == ULTIMATE)
+        failed = is_ult & (self.rage < self.ultimate_rage_cost)
+        if failed.any():
+            survived_limit = (self.round >= self.max_rounds) & (self.boss_hp > 0)
+            rewards[failed] -= 10
+            rewards[failed & survived_limit] += 150
+            done[failed] = (survived_limit | (self.boss_hp <= 0))[failed]
+            acting &= ~failed
+            is_ult &= ~failed
+
+        is_normal = acting & (actions == NORMAL_ATTACK)
+        is_h = acting & (actions == HORIZONTAL_SHOT)
+        is_v = acting & (actions == VERTICAL_SHOT)
+        is_heal = acting & (actions == HEAL)
+
+        # Skill effects: heal, rage and cooldowns
+        self.boss_hp[is_heal] = np.minimum(self.boss_hp[is_heal] + self.heal_amount, self.boss_max_hp)
+        gains = acting & ~is_ult
+        self.rage[gains] = np.minimum(self.rage[gains] + 1, self.boss_max_rage)
+        self.rage[is_ult] -= self.ultimate_rage_cost
+        self.cooldowns[is_h, 0] = self.skill_cds[0]
+        self.cooldowns[is_v, 1] = self.skill_cds[1]
+        self.cooldowns[is_heal, 2] = self.skill_cds[2]
+
+        # Normal attack
+        if is_normal.any():
+            n_available = self.available_actions().sum(axis=1)
+            rewards[is_normal & (n_available > 2)] -= 5
+            cell = np.asarray(targets.get("cell", np.full(B, -1)))
+            cell_c = np.clip(cell, 0, N - 1)
+            t = flat_type[b, cell_c]
+            hit = is_normal & (cell >= 0) & (t > 0)
+            new_hp = flat_hp[b, cell_c] - self.normal_damage
+            killed = hit & (new_hp <= 0)
+            tank = t == TANK
+            rewards += np.where(killed, np.where(tank, -20, 1), 0)
+            rewards += np.where(hit & ~killed & tank, -10, 0)
+            rewards[is_normal & ~hit] -= 10
+            flat_hp[b[hit], cell_c[hit]] = np.maximum(new_hp[hit], 0)
+            flat_type[b[killed], cell_c[killed]] = 0
+            destroyed += killed
+
+        # Horizontal / vertical shots: encode each line in beam order and look the outcome up
+        is_shot = is_h | is_v
+        if is_shot.any():
+            s = np.nonzero(is_shot)[0]
+            line = np.clip(np.asarray(targets.get("line", np.zeros(B, dtype=np.int64)))[s], 0, G - 1)
+            reverse = np.asarray(targets.get("reverse", np.zeros(B, dtype=bool)), dtype=bool)[s]
+            steps = np.arange(G)
+            order = np.where(reverse[:, None], G - 1 - steps, steps)
+            line_cells = np.where(is_h[s, None], line[:, None] * G + order, order * G + line[:, None])
+            if self.shot_table.dense:
+                destroyed[s] += self._resolve_shots_lookup(s, line_cells, rewards)
+            else:
+                destroyed[s] += self._resolve_shots_walk(s, line_cells, rewards)
+
+        # Ultimate: unblockable damage on up to ULTIMATE_MAX_TARGETS distinct cells
+        if is_ult.any():
+            ult_cells = np.asarray(targets.get("ultimate", np.full((B, ULTIMATE_MAX_TARGETS), -1)))
+            rows, cols = np.nonzero(is_ult[:, None] & (ult_cells >= 0))
+            struck = np.zeros((B, N), dtype=bool)
+            struck[rows, ult_cells[rows, cols]] = True
+            occ = struck & (flat_type > 0)
+            new_hp = flat_hp - self.ultimate_damage * occ
+            killed = occ & (new_hp <= 0)
+            tank = flat_type == TANK
+            cell_rewards = np.where(killed, np.where(tank, -20, 25), np.where(occ, np.where(tank, -10, 8), 0))
+            rewards += cell_rewards.sum(axis=1)
+            rewards[is_ult & struck.any(axis=1)] -= 2  # units_hit_by_ulti_count is never incremented in GameLogic
+            flat_hp[occ] = np.maximum(new_hp[occ], 0)
+            flat_type[killed] = 0
+            destroyed += killed.sum(axis=1).astype(np.int16)
+            self.ultimate_count[is_ult] += 1
+            rewards[is_ult & (self.ultimate_count == 2)] += 50
+            rewards[is_ult & (self.round == self.max_rounds)] += 50
+
+        # Heal reward uses HP after healing
+        if is_heal.any():
+            hp = self.boss_hp
+            heal_reward = np.where(hp < self.boss_max_hp * 0.3, 10,
+                          np.where(hp < self.boss_max_hp * 0.6, 5,
+                          np.where(hp > self.boss_max_hp * 0.9, -10, 1)))
+            heal_reward = heal_reward - 30 * (self.round == 1)
+            rewards[is_heal] += heal_reward[is_heal]
+
+        # End of boss turn
+        wiped = acting & (destroyed > 0) & ~(flat_type > 0).any(axis=1)
+        rewards[wiped] += 100
+        done |= wiped
+        rest = acting & ~wiped
+        boss_dead = rest & (self.boss_hp <= 0)
+        rewards[boss_dead] -= 100
+        done |= boss_dead
+        survived_limit = rest & ~boss_dead & (self.round >= self.max_rounds)
+        rewards[survived_limit] += 150
+        rewards[rest & ~boss_dead & ~survived_limit] += 2
+        self.game_over |= done
+        return rewards, done
+
+    def _resolve_shots_lookup(self, s, line_cells, rewards):
+        # s: shooting boards, line_cells: (len(s), G) flat cells in beam order
+        flat_type, flat_hp = self.flat_type, self.flat_hp
+        rows = s[:, None]
+        cell_codes = _CELL_CODE_LUT[flat_type[rows, line_cells], flat_hp[rows, line_cells]]
+        codes = cell_codes.astype(np.int64) @ self._shot_powers
+        new_codes = self.shot_table.new_codes[codes]
+        flat_type[rows, line_cells] = _CODE_TYPE[new_codes]
+        flat_hp[rows, line_cells] = _CODE_HP[new_codes]
+        rewards[s] += self.shot_table.rewards[codes]
+        return self.shot_table.num_kills[codes]
+
+    def _resolve_shots_walk(self, s, line_cells, rewards):
+        # Grids too large for a dense shot table: walk the lines one beam position at a time
+        flat_type, flat_hp = self.flat_type, self.flat_hp
+        charges = np.full(len(s), SHOT_INSTANCES)
+        hit_any = np.zeros(len(s), dtype=bool)
+        destroyed = np.zeros(len(s), dtype=np.int16)
+        shot_rewards = np.zeros(len(s), dtype=np.float32)
+        for k in range(self.grid_size):
+            c = line_cells[:, k]
+            t = flat_type[s, c]
+            hp = flat_hp[s, c]
+            occ = (t > 0) & (charges > 0)
+            tank = occ & (t == TANK)
+            other = occ & ~tank
+            hits = np.where(tank, np.minimum(charges, -(-hp // self.shot_damage)), other.astype(np.int64))
+            new_hp = hp - hits * self.shot_damage
+            killed = occ & (new_hp <= 0)
+            shot_rewards += np.where(tank, -10 * hits - 20 * killed, 0)
+            shot_rewards += np.where(other, np.where(killed, 15, 5), 0)
+            charges = np.where(tank & ~killed, 0, charges - hits)
+            flat_hp[s[occ], c[occ]] = np.maximum(new_hp[occ], 0)
+            flat_type[s[killed], c[killed]] = 0
+            destroyed += killed
+            hit_any |= occ
+        shot_rewards[~hit_any] -= 2
+        rewards[s] += shot_rewards
+        return destroyed
@@ -0,0 +1,124 @@
+# bench_bitboard.py
+# Microbenchmark: nested-loop targeting (the old _get_heuristic_skill_params) vs targeting.py
+# on Bitboards (one board per call, as the agents use it) and on a whole batch of boards.
+# Usage: python bench_bitboard.py [--boards 2000] [--grid-sizes 4 8 16]
+import argparse
+import random
+import time
+import numpy as np
+from units import PLAYER_UNIT_SPECS
+from bitboard import Bitboard
+from game_constants import ACTION_KEYS
+from targeting import board_types, select_targets, skill_params_for_board
+
+SKILLS = ("normal_attack", "horizontal_shot", "vertical_shot", "ultimate")
+
+
+def nested_loop_params(skill_key, grid_units):
+    # Reference: the grid scan both agents used before the bitboard
+    player_unit_positions=[]; ads_positions=[]; knights_positions=[]; tanks_positions=[]
+    grid_h = len(grid_units); grid_w = len(grid_units[0]) if grid_h > 0 else 0
+    for r_loop in range(grid_h):
+        for c_loop in range(grid_w):
+            unit = grid_units[r_loop][c_loop]
+            if unit:
+                player_unit_positions.append((r_loop,c_loop))
+                if unit.name=="AD": ads_positions.append((r_loop,c_loop))
+                elif unit.name=="Knight": knights_positions.append((r_loop,c_loop))
+                elif unit.name=="Tank": tanks_positions.append((r_loop,c_loop))
+    params = {}
+    if skill_key=="normal_attack":
+        target_list_normal = []
+        if ads_positions: target_list_normal = [random.choice(ads_positions)]
+        elif knights_positions: target_list_normal = [random.choice(knights_positions)]
+        elif tanks_positions: target_list_normal = [random.choice(tanks_positions)]
+        elif player_unit_positions: target_list_normal = [random.choice(player_unit_positions)]
+        return target_list_normal
+    elif skill_key=="horizontal_shot":
+        best_row,max_targets=-1,-1
+        for r_idx in range(grid_h):
+            count=sum(1 for c_idx in range(grid_w) if grid_units[r_idx][c_idx] and grid_units[r_idx][c_idx].name in ["AD","Knight"])
+            if count>max_targets:max_targets=count;best_row=r_idx
+        params["line_idx"] = best_row if best_row != -1 else (random.randint(0,grid_h-1) if grid_h > 0 else 0)
+        params["direction"] = random.choice(["ltr", "rtl"])
+    elif skill_key=="vertical_shot":
+        best_col,max_targets=-1,-1
+        for c_idx in range(grid_w):
+            count=sum(1 for r_idx in range(grid_h) if grid_units[r_idx][c_idx] and grid_units[r_idx][c_idx].name in ["AD","Knight"])
+            if count>max_targets:max_targets=count;best_col=c_idx
+        params["line_idx"] = best_col if best_col != -1 else (random.randint(0,grid_w-1) if grid_w > 0 else 0)
+        params["direction"] = random.choice(["ttb", "btt"])
+    elif skill_key=="ultimate":
+        targets_ulti_temp = ads_positions+knights_positions+tanks_positions; random.shuffle(targets_ulti_temp)
+        if len(targets_ulti_temp)<6:
+            empty_cells=[(r_loop,c_loop) for r_loop in range(grid_h) for c_loop in range(grid_w) if grid_units[r_loop][c_loop] is None]
+            random.shuffle(empty_cells); targets_ulti_temp.extend(empty_cells[:6-len(targets_ulti_temp)])
+        return targets_ulti_temp[:6]
+    return params
+
+
+def random_grid(grid_size, fill, rng):
+    classes = [spec["class"] for spec in PLAYER_UNIT_SPECS.values()]
+    return [[rng.choice(classes)() if rng.random() < fill else None for _ in range(grid_size)] for _ in range(grid_size)]
+
+
+def bench(fn, boards, reps):
+    start = time.perf_counter()
+    for _ in range(reps):
+        for skill_key in SKILLS:
+            for board in boards:
+                fn(skill_key, board)
+    return (time.perf_counter() - start) / (reps * len(SKILLS) * len(boards)) * 1e6
+
+
+def bench_batch(types, grid_size, reps, rng):
+    start = time.perf_counter()
+    for _ in range(reps):
+        for skill_key in SKILLS:
+            select_targets(types, grid_size, np.full(len(types), ACTION_KEYS.index(skill_key)), rng)
+    return (time.perf_counter() - start) / (reps * len(SKILLS) * len(types)) * 1e6
+
+
+def check_same_choices(grid, board, rng):
+    # Draws differ (random vs np.random.Generator); the deterministic parts must not
+    types = board_types(board)[None]
+    for skill_key in ("horizontal_shot", "vertical_shot"):
+        expected = nested_loop_params(skill_key, grid)["line_idx"]
+        assert expected == skill_params_for_board(skill_key, board, rng)["line_idx"]
+        assert expected == select_targets(types, len(grid), [ACTION_KEYS.index(skill_key)], rng)["line"][0]
+    expected = nested_loop_params("normal_attack", grid)
+    got = skill_params_for_board("normal_attack", board, rng)
+    assert [grid[r][c].name for r, c in expected] == [grid[r][c].name for r, c in got]
+    units = {(r, c) for r, row in enumerate(grid) for c, unit in enumerate(row) if unit}
+    got = skill_params_for_board("ultimate", board, rng)
+    assert len(set(got)) == len(got) == min(6, len(grid) ** 2)
+    assert set(got) <= units if len(units) >= 6 else units <= set(got)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nested-loop vs bitboard targeting microbenchmark.")
+    parser.add_argument("--boards", type=int, default=2000)
+    parser.add_argument("--reps", type=int, default=3)
+    parser.add_argument("--fill", type=float, default=0.4, help="Fraction of occupied cells")
+    parser.add_argument("--grid-sizes", type=int, nargs="+", default=[4, 8, 16])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    np_rng = np.random.default_rng(0)
+    for grid_size in args.grid_sizes:
+        grids = [random_grid(grid_size, args.fill, rng) for _ in range(args.boards)]
+        bitboards = [Bitboard.from_grid(g) for g in grids]
+        for g, b in zip(grids[:200], bitboards[:200]):
+            check_same_choices(g, b, np_rng)
+        loop_us = bench(nested_loop_params, grids, args.reps)
+        # Bitboards maintained by GameLogic, one board per call
+        single_us = bench(lambda skill_key, b: skill_params_for_board(skill_key, b, np_rng), bitboards, args.reps)
+        types = np.stack([board_types(b) for b in bitboards])
+        batch_us = bench_batch(types, grid_size, args.reps, np_rng)
+        print(f"grid {grid_size:>2}x{grid_size:<2}  nested loops {loop_us:7.2f} us/board | "
+              f"targeting.py per board {single_us:6.2f} us | batch of {len(types)} {batch_us:6.3f} us/board "
+              f"({loop_us / batch_us:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# bench_inference.py
+# Per-decision latency of DQNAgent.choose_action for each inference mode, on states
+# collected from real games, and the amortized cost of choose_actions_batch.
+# Usage: python bench_inference.py [--decisions 20000] [--batch-size 256]
+import argparse
+import time
+import numpy as np
+import torch
+from agent_dqn import DQNAgent, ACTION_MAP_AGENT, NUM_ACTIONS, available_mask
+from targeting import board_types
+from episode_runner import EpisodeRunner
+
+
+def legacy_choose_action(agent, state_dict, available_skill_keys, grid_units_for_targeting):
+    # Reference: choose_action before the inference fast path (epsilon = 0)
+    state_vec = agent._state_to_vec(state_dict)
+    available_action_indices = [idx for idx, sk_key in ACTION_MAP_AGENT.items() if sk_key in available_skill_keys]
+    if not available_action_indices:
+        return None, [], None
+    state_tensor = torch.tensor(state_vec, dtype=torch.float32).unsqueeze(0).to(agent.device)
+    q_values = agent.policy_net(state_tensor).detach().cpu().numpy()[0]
+    masked_q = np.full(NUM_ACTIONS, -np.inf)
+    for idx in available_action_indices:
+        masked_q[idx] = q_values[idx]
+    action_idx = int(np.argmax(masked_q))
+    chosen_skill_key = ACTION_MAP_AGENT[action_idx]
+    return chosen_skill_key, agent._get_heuristic_skill_params(chosen_skill_key, grid_units_for_targeting), action_idx
+
+
+def collect_decisions(n):
+    # (state, available keys, bitboard) at every boss decision of random-policy games
+    decisions = []
+    agent = DQNAgent(device="cpu", seed=0)
+    runner = EpisodeRunner(agent=agent, seed=0)
+    original = agent.choose_action
+    def record(state, available_skill_keys, board, rng=None):
+        decisions.append((state, list(available_skill_keys), board.__class__(board.grid_size, board.masks)))
+        return original(state, available_skill_keys, board, rng)
+    agent.choose_action = record
+    while len(decisions) < n:
+        runner.run_episode()
+    return decisions[:n]
+
+
+def measure(choose, decisions):
+    latencies = np.empty(len(decisions))
+    for i, (state, keys, board) in enumerate(decisions):
+        start = time.perf_counter_ns()
+        choose(state, keys, board)
+        latencies[i] = time.perf_counter_ns() - start
+    return latencies / 1000.0
+
+
+def measure_batch(agent, decisions, batch_size):
+    # One choose_actions_batch call per batch_size decisions, inputs already stacked like a batched env
+    states = np.stack([agent._state_to_vec(state) for state, _keys, _board in decisions])
+    masks = np.stack([available_mask(keys) for _state, keys, _board in decisions])
+    boards = np.stack([board_types(board) for _state, _keys, board in decisions])
+    latencies = []
+    for i in range(0, len(decisions) - batch_size + 1, batch_size):
+        start = time.perf_counter_ns()
+        agent.choose_actions_batch(states[i:i + batch_size], masks[i:i + batch_size], boards[i:i + batch_size])
+        latencies.append((time.perf_counter_ns() - start) / batch_size)
+    return np.array(latencies) / 1000.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="choose_action latency per inference mode.")
+    parser.add_argument("--decisions", type=int, default=20000)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--batch-size", type=int, default=256, help="Games per choose_actions_batch call")
+    args = parser.parse_args()
+
+    torch.set_num_threads(1) # latency of one decision, not throughput
+    decisions = collect_decisions(args.decisions)
+    agents = {mode: DQNAgent(device=args.device, epsilon=0.0, seed=0, inference=mode) for mode in ("torch", "numpy")}
+    agents["numpy"].policy_net.load_state_dict(agents["torch"].policy_net.state_dict())
+    legacy_agent = DQNAgent(device=args.device, epsilon=0.0, seed=0)
+    legacy_agent.policy_net.load_state_dict(agents["torch"].policy_net.state_dict())
+
+    # Same weights -> same greedy actions in every mode
+    for state, keys, board in decisions[:1000]:
+        expected = legacy_choose_action(legacy_agent, state, keys, board)[2]
+        assert all(agent.choose_action(state, keys, board)[2] == expected for agent in agents.values())
+
+    modes = [("legacy", lambda s, k, b: legacy_choose_action(legacy_agent, s, k, b))]
+    modes += [(mode, agent.choose_action) for mode, agent in agents.items()]
+    print(f"{len(decisions)} decisions on {args.device}, latency per choose_action call (us):")
+    for name, choose in modes:
+        measure(choose, decisions[:1000]) # warm-up
+        lat = measure(choose, decisions)
+        print(f"  {name:<7} p50 {np.percentile(lat, 50):7.1f}  p99 {np.percentile(lat, 99):7.1f}  mean {lat.mean():7.1f}")
+    print(f"choose_actions_batch, {args.batch_size} games per call (us per decision, amortized):")
+    for mode, agent in agents.items():
+        measure_batch(agent, decisions[:10 * args.batch_size], args.batch_size) # warm-up
+        lat = measure_batch(agent, decisions, args.batch_size)
+        print(f"  {mode:<7} p50 {np.percentile(lat, 50):7.2f}  p99 {np.percentile(lat, 99):7.2f}  mean {lat.mean():7.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+# bench_qtable_offline.py
+# One offline pass of QTableAgent over logged boss transitions: learn() row by row
+# (dict and dense tables) vs learn_batch() on the dense table, and checks they agree.
+# --check-checkpoints also checks that updates to an "r+"-mapped table survive full saves.
+# Usage: python bench_qtable_offline.py [--log Model/boss_actions.csv] [--episodes 2000] [--repeat 10]
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+from agent_qtable import QTableAgent, load_boss_action_log
+from episode_runner import EpisodeRunner
+from game_state import GameState
+
+
+def collect_transitions(episodes, seed=0):
+    # Transitions of epsilon-greedy games, same columns as load_boss_action_log()
+    agent = QTableAgent(dense=True, seed=seed, exploration_rate=1.0, exploration_decay=1.0)
+    rows = []
+    runner = EpisodeRunner(agent=agent, seed=seed)
+    for _ in range(episodes):
+        runner.run_episode(lambda s, a, r, n, d: rows.append((s.vec.copy(), a, r, n.vec.copy(), d)))
+    states, actions, rewards, next_states, dones = zip(*rows)
+    return (np.stack(states), np.array(actions, dtype=np.int64), np.array(rewards, dtype=np.float64),
+            np.stack(next_states), np.array(dones, dtype=bool))
+
+
+def replay_row_by_row(agent, states, actions, rewards, next_states, dones, boss_max_hp):
+    # What an offline replay did before learn_batch: one learn() per logged row
+    for i in range(len(actions)):
+        agent.learn(GameState(states[i], boss_max_hp), int(actions[i]), float(rewards[i]),
+                    GameState(next_states[i], boss_max_hp), bool(dones[i]))
+
+
+def check_checkpoints():
+    # load(mmap_mode="r+") -> overflow update -> checkpoint (full save replaces the file) ->
+    # update -> checkpoint -> reload: the second update must reach the new file
+    inside = GameState(np.array([50, 1, 0, 0, 0, 1, 1, 1, 2], dtype=np.float32), 70)
+    outside = GameState(np.array([500, 1, 0, 0, 0, 1, 1, 1, 2], dtype=np.float32), 70) # hp past the dense space
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "qtable.bin")
+        QTableAgent(dense=True, qtable_file=path).save()
+        agent = QTableAgent(dense=True, qtable_file=path, learning_rate=1.0, discount_factor=0.0)
+        agent.load(mmap_mode="r+")
+        agent.learn(outside, 0, 0.3, inside, True)
+        agent.checkpoint()
+        agent.learn(inside, 1, 0.7, inside, True)
+        agent.checkpoint()
+        reloaded = QTableAgent(dense=True, qtable_file=path)
+        reloaded.load(mmap_mode=None)
+        table = reloaded.to_dict()
+        assert np.isclose(table[tuple(int(x) for x in outside.vec)][0], 0.3), "overflow update lost"
+        assert np.isclose(table[tuple(int(x) for x in inside.vec)][1], 0.7), "update after a full save lost"
+    print("r+ checkpoints after a full save: ok")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Row-by-row learn() vs vectorized learn_batch() over a transition log.")
+    parser.add_argument("--log", default="Model/boss_actions.csv", help="JSONL log or its experience_log.py directory")
+    parser.add_argument("--episodes", type=int, default=0, help="Play this many games for the transitions instead of reading --log")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the transitions this many times (passes over the log)")
+    parser.add_argument("--check-checkpoints", action="store_true", help="Only check r+ checkpoints across full saves")
+    args = parser.parse_args()
+
+    if args.check_checkpoints:
+        check_checkpoints()
+        return
+
+    start = time.perf_counter()
+    columns = collect_transitions(args.episodes) if args.episodes else load_boss_action_log(args.log)
+    print(f"{len(columns[1])} transitions loaded in {time.perf_counter() - start:.2f}s")
+    states, actions, rewards, next_states, dones = (np.concatenate([c] * args.repeat) for c in columns)
+    n = len(actions)
+    boss_max_hp = int(states[:, 0].max()) if n else 0
+
+    timings = {}
+    agents = {}
+    for name, dense in (("learn() dict", False), ("learn() dense", True)):
+        agent = agents[name] = QTableAgent(dense=dense)
+        start = time.perf_counter()
+        replay_row_by_row(agent, states, actions, rewards, next_states, dones, boss_max_hp)
+        timings[name] = time.perf_counter() - start
+    agent = agents["learn_batch() dense"] = QTableAgent(dense=True)
+    start = time.perf_counter()
+    agent.learn_batch(states, actions, rewards, next_states, dones)
+    timings["learn_batch() dense"] = time.perf_counter() - start
+
+    reference = agents["learn() dict"].to_dict()
+    for name in ("learn() dense", "learn_batch() dense"):
+        table = agents[name].to_dict()
+        assert all(np.allclose(table.get(key, 0), q_values, rtol=1e-4, atol=1e-3) for key, q_values in reference.items()), name
+        assert np.isclose(agents[name].epsilon, agents["learn() dict"].epsilon)
+    base = timings["learn() dict"]
+    for name, seconds in timings.items():
+        print(f"{name:<20} {seconds:8.3f}s  {n / seconds:12.0f} rows/s  ({base / seconds:6.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
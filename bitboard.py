@@ -0,0 +1,88 @@
+# bitboard.py
+# Bitboard view of the grid: one int mask per unit type, bit r * grid_size + c.
+# Python ints are unbounded, so any grid_size works (a 4x4 board fits in 16 bits).
+from functools import lru_cache
+from units import PLAYER_UNIT_SPECS
+
+
+@lru_cache(maxsize=None)
+def row_masks(grid_size):
+    full_row = (1 << grid_size) - 1
+    return tuple(full_row << (r * grid_size) for r in range(grid_size))
+
+
+@lru_cache(maxsize=None)
+def col_masks(grid_size):
+    col0 = sum(1 << (r * grid_size) for r in range(grid_size))
+    return tuple(col0 << c for c in range(grid_size))
+
+
+def iter_bits(mask):
+    """Indices of the set bits, lowest first (= row-major cell order)."""
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class Bitboard:
+    __slots__ = ("grid_size", "masks")
+
+    def __init__(self, grid_size, masks=None):
+        self.grid_size = grid_size
+        self.masks = dict(masks) if masks else {name: 0 for name in PLAYER_UNIT_SPECS}
+
+    @classmethod
+    def from_grid(cls, grid_units):
+        board = cls(len(grid_units))
+        for r, row in enumerate(grid_units):
+            for c, unit in enumerate(row):
+                if unit:
+                    board.set(unit.name, r, c)
+        return board
+
+    def bit(self, r, c):
+        return 1 << (r * self.grid_size + c)
+
+    def set(self, unit_name, r, c):
+        self.masks[unit_name] |= self.bit(r, c)
+
+    def clear(self, unit_name, r, c):
+        self.masks[unit_name] &= ~self.bit(r, c)
+
+    @property
+    def occupied(self):
+        occ = 0
+        for m in self.masks.values():
+            occ |= m
+        return occ
+
+    @property
+    def empty(self):
+        return ((1 << (self.grid_size * self.grid_size)) - 1) & ~self.occupied
+
+    def mask_of(self, *unit_names):
+        m = 0
+        for name in unit_names:
+            m |= self.masks[name]
+        return m
+
+    def row_counts(self, mask):
+        return [(mask & rm).bit_count() for rm in row_masks(self.grid_size)]
+
+    def col_counts(self, mask):
+        return [(mask & cm).bit_count() for cm in col_masks(self.grid_size)]
+
+    def cells(self, mask):
+        """(r, c) of every set bit, in row-major order."""
+        return [divmod(i, self.grid_size) for i in iter_bits(mask)]
+
+    def __eq__(self, other):
+        return isinstance(other, Bitboard) and self.grid_size == other.grid_size and self.masks == other.masks
+
+
+def as_bitboard(grid_units_or_board):
+    # Agents accept either GameLogic's maintained Bitboard or a plain grid_units matrix
+    if isinstance(grid_units_or_board, Bitboard):
+        return grid_units_or_board
+    return Bitboard.from_grid(grid_units_or_board)
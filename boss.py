@@ -1,8 +1,10 @@
 # boss.py
-import random
+import numpy as np
+from bitboard import as_bitboard
+from targeting import skill_params_for_board
 
 class Boss:
-    def __init__(self, agent=None): 
+    def __init__(self, agent=None, rng=None): 
         self.max_hp = 70  # Tăng máu boss lên 70
         self.current_hp = self.max_hp
         self.max_rage = 3; self.current_rage = 0
@@ -14,6 +16,9 @@ class Boss:
             "ultimate": {"cd":0,"cd_timer":0,"rage_cost":3,"damage":2,"name":"Ultimate","unblockable":True}
         }
         self.last_skill_message = ""; self.agent = agent 
+        self.rng = rng if rng is not None else np.random.default_rng() # targeting draws (agents too)
+        self.policy_rng = np.random.default_rng() # fallback skill choices
+        # GameLogic replaces both with per-episode streams at every new game
 
     def take_damage(self, amount): # ... (Giữ nguyên)
         self.current_hp -= amount
@@ -60,7 +65,7 @@ class Boss:
             else:
                 state_input = current_game_state_dict_for_q_table
             chosen_skill_key, skill_params_dict, action_idx = self.agent.choose_action(
-                state_input, available_keys, grid_units_for_targeting
+                state_input, available_keys, grid_units_for_targeting, rng=self.rng
             )
 
             if chosen_skill_key:
@@ -87,7 +92,8 @@ class Boss:
             self.last_skill_message = "Boss has no available skills (fallback)."
             return None, {} # Return empty dict for params
 
-        player_unit_positions = [(r, c) for r in range(4) for c in range(4) if grid_units[r][c] is not None]
+        board = as_bitboard(grid_units) # GameLogic passes its live Bitboard, no grid scan
+        player_unit_positions = board.cells(board.occupied)
         chosen_skill_key = ""
         # ... (rest of fallback AI logic to choose chosen_skill_key) ...
         if "ultimate" in available_skills and len(player_unit_positions) >= 3: chosen_skill_key = "ultimate"
@@ -95,40 +101,28 @@ class Boss:
         else:
             damage_skills = [s for s in available_skills if s not in ["heal", "ultimate"] and player_unit_positions]
             if not damage_skills and "normal_attack" in available_skills and player_unit_positions: damage_skills.append("normal_attack")
-            damage_skills = list(set(damage_skills))
-            if damage_skills: chosen_skill_key = random.choice(damage_skills)
+            damage_skills = list(dict.fromkeys(damage_skills)) # dedupe, keeping a fixed order for seeded replays
+            if damage_skills: chosen_skill_key = damage_skills[int(self.policy_rng.integers(len(damage_skills)))]
             elif "heal" in available_skills and self.current_hp < self.max_hp: chosen_skill_key = "heal"
             elif "normal_attack" in available_skills and player_unit_positions: chosen_skill_key = "normal_attack"
-            elif available_skills: chosen_skill_key = random.choice(available_skills)
+            elif available_skills: chosen_skill_key = available_skills[int(self.policy_rng.integers(len(available_skills)))]
             else: self.last_skill_message = "Boss AI (fallback) could not decide."; return None, {}
 
 
-        skill_params_val = {} # Use dict for H/V shots, list for others
+        skill_params_val = skill_params_for_board(chosen_skill_key, board, self.rng, heuristic=False) # dict for H/V shots, list for others
         skill_name_display = self.skills[chosen_skill_key]['name']
 
         if chosen_skill_key == "normal_attack":
-            temp_list_params = []
-            if player_unit_positions:
-                target_pos = random.choice(player_unit_positions); temp_list_params = [target_pos]
+            if skill_params_val:
+                target_pos = skill_params_val[0]
                 self.last_skill_message = f"Boss (fallback) uses {skill_name_display} on ({target_pos[0]},{target_pos[1]})."
             else: self.last_skill_message = f"Boss (fallback) tries {skill_name_display}, no targets."; return "normal_attack", {} 
-            skill_params_val = temp_list_params # Assign list
         elif chosen_skill_key == "horizontal_shot":
-            skill_params_val["line_idx"] = random.randint(0, 3)
-            skill_params_val["direction"] = random.choice(["ltr", "rtl"])
             self.last_skill_message = f"Boss (fallback) uses {skill_name_display} on row {skill_params_val['line_idx']} ({skill_params_val['direction']})."
         elif chosen_skill_key == "vertical_shot":
-            skill_params_val["line_idx"] = random.randint(0, 3)
-            skill_params_val["direction"] = random.choice(["ttb", "btt"])
             self.last_skill_message = f"Boss (fallback) uses {skill_name_display} on column {skill_params_val['line_idx']} ({skill_params_val['direction']})."
         elif chosen_skill_key == "ultimate":
-            temp_list_params_ulti = []
-            possible_targets = player_unit_positions[:] 
-            empty_cells = [(r,c) for r in range(4) for c in range(4) if grid_units[r][c] is None]
-            random.shuffle(possible_targets); random.shuffle(empty_cells)
-            temp_list_params_ulti = (possible_targets + empty_cells)[:6]
             self.last_skill_message = f"Boss (fallback) uses {skill_name_display}!"
-            skill_params_val = temp_list_params_ulti # Assign list
         elif chosen_skill_key == "heal":  
             self.last_skill_message = f"Boss (fallback) uses {skill_name_display}."
             skill_params_val = {} # Empty dict for heal
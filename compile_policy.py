@@ -0,0 +1,63 @@
+# compile_policy.py
+# Evaluates a trained DQNNet on every reachable decision state (state_space.py) and
+# writes the best available action per state, optionally with the Q-values, to a
+# memory-mappable table for PolicyTableAgent.
+# Usage: python compile_policy.py [--model Model/dqn_agent.pt] [--out Model/dqn_policy.tbl] [--with-q float16]
+import argparse
+import os
+import time
+import numpy as np
+import torch
+from agent_dqn import DQNAgent, ACTION_MAP_AGENT
+from array_file import write_arrays
+from game_state import STATE_FIELDS
+from state_space import StateSpace
+from policy_table_agent import DEFAULT_POLICY_FILE
+
+CHUNK_SIZE = 1 << 18 # states per forward pass
+
+
+def compile_policy(agent, space, q_dtype=None, chunk_size=CHUNK_SIZE):
+    """(policy, q): masked argmax action per state index, and Q-values if q_dtype is given."""
+    policy = np.empty(space.size, dtype=np.uint8)
+    q_table = np.empty((space.size, agent.num_actions), dtype=q_dtype) if q_dtype else None
+    for start in range(0, space.size, chunk_size):
+        stop = min(start + chunk_size, space.size)
+        states = space.states(start, stop)
+        q = agent.q_values_batch(states)
+        policy[start:stop] = np.where(space.available_actions(states), q, -np.inf).argmax(axis=1)
+        if q_table is not None:
+            q_table[start:stop] = q
+    return policy, q_table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a trained DQN into a dense decision table.")
+    parser.add_argument("--model", default="Model/dqn_agent.pt")
+    parser.add_argument("--out", default=DEFAULT_POLICY_FILE)
+    parser.add_argument("--with-q", choices=["float16", "float32"], help="Also store the Q-values")
+    parser.add_argument("--grid-size", type=int, default=4)
+    parser.add_argument("--max-rounds", type=int, default=9)
+    args = parser.parse_args()
+    if not os.path.exists(args.model):
+        parser.error(f"model file {args.model} not found")
+
+    agent = DQNAgent(model_file=args.model, device="cuda" if torch.cuda.is_available() else "cpu", epsilon=0.0)
+    agent.load()
+    space = StateSpace(grid_size=args.grid_size, max_rounds=args.max_rounds)
+    print(f"Evaluating {space.size} states ({len(space.combos)} round/unit combos x {space.inner_size})...")
+    start = time.perf_counter()
+    policy, q_table = compile_policy(agent, space, q_dtype=args.with_q)
+    elapsed = time.perf_counter() - start
+    arrays = {"policy": policy}
+    if q_table is not None:
+        arrays["q"] = q_table
+    meta = {"state_space": space.describe(), "state_fields": list(STATE_FIELDS),
+            "actions": [ACTION_MAP_AGENT[i] for i in range(len(ACTION_MAP_AGENT))], "model": args.model}
+    write_arrays(args.out, arrays, meta)
+    print(f"Compiled in {elapsed:.1f}s ({space.size / elapsed:.0f} states/s). "
+          f"Action counts: {np.bincount(policy, minlength=len(ACTION_MAP_AGENT)).tolist()}. Saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+# episode_record.py
+# Compact episode records: the episode seed, the player's placements and the boss's action
+# indices. GameLogic draws every random number of an episode from streams spawned from its
+# seed (game_logic.episode_rngs), so that is enough to rebuild every state. resimulate()
+# replays one record through GameLogic, resimulate_batch() many at once on a
+# BatchedGameEngine, both in the phase order the episode was played in (EpisodeRunner
+# attacks with the player first, the Qt window lets the boss act first). A record is ~190
+# bytes of JSON; the three JSONL logs hold ~19 KB of JSON states for the same episode.
+# Usage: python episode_record.py Model/episodes.jsonl [--limit N] [--verify N]
+#        python episode_record.py --self-check N
+import argparse
+import json
+import os
+import time
+import numpy as np
+from batched_engine import BatchedGameEngine
+from game_constants import ACTION_KEYS, UNIT_TYPE_IDS, UNIT_TYPE_NAMES
+from game_logic import GameLogic, episode_rngs, PLAYER_FIRST, BOSS_FIRST
+from episode_runner import EpisodeRunner
+from game_state import STATE_SIZE
+from targeting import empty_targets, set_skill_params, skill_params_for_board, type_bitboards
+
+EPISODE_LOG = "Model/episodes.jsonl"
+RECORD_VERSION = 1
+_TYPE_BITS = 2 # placement code = cell << _TYPE_BITS | unit type id (UNIT_TYPE_IDS)
+DEFAULT_CHUNK = 4096 # episodes re-simulated per BatchedGameEngine
+
+
+def episode_record(game, **extra):
+    """Record of game's current episode (normally called at game over) as a JSON-ready dict.
+
+    placements holds one list per round of codes cell << 2 | unit type id, boss one
+    ACTION_KEYS index per boss turn (-1: no skill), order the phase order the episode
+    was played in (game.phase_order). extra keys are stored as given.
+    """
+    G = game.grid_size
+    record = {"v": RECORD_VERSION, "seed": game.episode_seed, "grid": G, "rounds": game.max_rounds,
+              "fallback": game.boss.agent is None, "order": game.phase_order,
+              "placements": [[(r * G + c) << _TYPE_BITS | UNIT_TYPE_IDS[name] for name, r, c in placed]
+                             for placed in game.episode_placements],
+              "boss": [ACTION_KEYS.index(key) if key else -1 for key in game.episode_boss_actions]}
+    record.update(extra)
+    return record
+
+
+def record_line(record):
+    return json.dumps(record, separators=(",", ":"))
+
+
+def write_records(path, records):
+    with open(path, "a") as f:
+        for record in records:
+            f.write(record_line(record) + "\n")
+
+
+def read_records(path):
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class _RecordedBoss:
+    # Boss agent of a replay: plays the recorded skill of the current round, targets drawn
+    # from the game's targeting stream with the same rules as the original agent/fallback AI
+    def __init__(self, game, actions, heuristic):
+        self.game = game
+        self.actions = actions
+        self.heuristic = heuristic
+
+    def choose_action(self, state_dict, available_skill_keys, grid_units_for_targeting, rng=None):
+        action_idx = self.actions[self.game.current_round - 1]
+        if action_idx < 0:
+            return None, [], None
+        skill_key = ACTION_KEYS[action_idx]
+        if skill_key not in available_skill_keys:
+            raise ValueError(f"Recorded {skill_key} is not available in round {self.game.current_round}")
+        return skill_key, skill_params_for_board(skill_key, grid_units_for_targeting, rng, heuristic=self.heuristic), action_idx
+
+
+def _record_order(record):
+    # Records without "order" come from EpisodeRunner, which always played the player first
+    order = record.get("order", PLAYER_FIRST)
+    if order not in (PLAYER_FIRST, BOSS_FIRST):
+        raise ValueError(f"Unknown phase order {order!r} in episode record")
+    return order
+
+
+def resimulate(record, game=None):
+    """Replays record through GameLogic (game is reused when given) and returns its trajectory.
+
+    {column: array} with one row per round: state_before_player (round start, before the
+    placements), state_after_player, state_before_boss, state_after_boss ((rounds,
+    STATE_SIZE) float32), boss_action (-1 where the boss did not act, e.g. the player
+    finished it), reward_player, reward_boss, done_player, done_boss. The record's phase
+    order decides which attack comes first; with BOSS_FIRST state_after_player ends the round.
+    Raises ValueError when the record cannot be replayed (other engine rules).
+    """
+    if record.get("v") != RECORD_VERSION:
+        raise ValueError(f"Unsupported episode record version {record.get('v')}")
+    boss_first = _record_order(record) == BOSS_FIRST
+    G = record["grid"]
+    if game is None or game.grid_size != G or game.max_rounds != record["rounds"]:
+        game = GameLogic(grid_size=G, max_rounds=record["rounds"])
+    placements, actions = record["placements"], record["boss"]
+    game.boss.agent = _RecordedBoss(game, actions, heuristic=not record["fallback"])
+    n = len(placements)
+    # before player, after player, before boss, after boss
+    states = np.zeros((4, n, STATE_SIZE), dtype=np.float32)
+    boss_action = np.full(n, -1, dtype=np.int8)
+    rewards = np.zeros((2, n), dtype=np.float32) # player, boss
+    done = np.zeros((2, n), dtype=bool)
+
+    def player_phase(i, results):
+        states[1, i], rewards[0, i], done[0, i] = results[3].vec, results[4], results[5]
+        return results[0] == "game_over_boss_defeated"
+
+    def boss_phase(i):
+        results = game.process_boss_attack()
+        states[2, i], states[3, i], rewards[1, i], done[1, i] = results[6].vec, results[3].vec, results[4], results[5]
+        if game.episode_boss_actions[-1]:
+            boss_action[i] = actions[i]
+        return results[0] == "game_over_player_wiped"
+
+    # Same sequence of engine calls as EpisodeRunner.run_episode for the record's order
+    states[0, 0] = game.start_new_game(record["seed"]).vec
+    rounds = 0
+    for _ in range(game.max_rounds + 2):
+        # Only the player-first loop checks for game over before a round (so it never plays the last one)
+        if not boss_first and game.check_game_over_conditions()[0]:
+            break
+        if rounds == n:
+            raise ValueError(f"Record ends after {n} rounds but the game goes on")
+        i = rounds
+        rounds += 1
+        game.game_phase = "PLACEMENT"
+        for code in placements[i]:
+            cell = code >> _TYPE_BITS
+            ok, msg = game.place_unit_from_stock(UNIT_TYPE_NAMES[code & (1 << _TYPE_BITS) - 1], cell // G, cell % G)
+            if not ok:
+                raise ValueError(f"Round {i + 1} placement at cell {cell} failed: {msg}")
+        if boss_first:
+            if boss_phase(i):
+                states[1, i] = states[3, i]
+                break
+            if player_phase(i, game.process_player_attack()):
+                break
+        else:
+            if player_phase(i, game.end_placement_phase()):
+                states[2, i] = states[3, i] = states[1, i]
+                break
+            if boss_phase(i) or done[1, i]:
+                break
+        status, _msg, next_state = game.proceed_to_next_round()
+        if status == "game_over":
+            break
+        if rounds < n:
+            states[0, rounds] = next_state.vec
+    # The round limit ends the game right after the last round is set up, leaving it empty
+    if rounds != n and not (rounds == n - 1 and not placements[-1]):
+        raise ValueError(f"Record has {n} rounds, the replay ended after {rounds}")
+    return {"state_before_player": states[0, :rounds], "state_after_player": states[1, :rounds],
+            "state_before_boss": states[2, :rounds], "state_after_boss": states[3, :rounds],
+            "boss_action": boss_action[:rounds], "reward_player": rewards[0, :rounds],
+            "reward_boss": rewards[1, :rounds], "done_player": done[0, :rounds], "done_boss": done[1, :rounds]}
+
+
+def resimulate_batch(records):
+    """Replays many records (same grid, rounds and phase order) in lockstep on a BatchedGameEngine.
+
+    Same columns as resimulate() plus episode (index into records) and round, one
+    row per played round, ordered by episode then round. Only the per-episode
+    targeting draws run board by board; they use the same streams and rules as
+    GameLogic, so the trajectories are identical to resimulate()'s.
+    """
+    B = len(records)
+    G, R = records[0]["grid"], records[0]["rounds"]
+    order = _record_order(records[0])
+    if any(r.get("v") != RECORD_VERSION or r["grid"] != G or r["rounds"] != R or _record_order(r) != order for r in records):
+        raise ValueError("resimulate_batch needs records of one version, grid, round limit and phase order")
+    boss_first = order == BOSS_FIRST
+    engine = BatchedGameEngine(B, G, R)
+    engine.reset()
+    rngs = [episode_rngs(r["seed"], ("targeting",))["targeting"] for r in records]
+    heuristic = [not r["fallback"] for r in records]
+    n = max(len(r["placements"]) for r in records)
+    # Records padded to n rounds: placement codes (0 = none) and boss actions (-1 = none)
+    width = max([len(placed) for r in records for placed in r["placements"]] + [0])
+    codes = np.zeros((n, width, B), dtype=np.int64)
+    actions = np.full((n, B), -1, dtype=np.int64)
+    for b, r in enumerate(records):
+        for i, placed in enumerate(r["placements"]):
+            codes[i, :len(placed), b] = placed
+        actions[:len(r["boss"]), b] = r["boss"]
+
+    played = np.zeros((n, B), dtype=bool)
+    states = np.zeros((4, n, B, STATE_SIZE), dtype=np.float32)
+    boss_action = np.full((n, B), -1, dtype=np.int8)
+    rewards = np.zeros((2, n, B), dtype=np.float32)
+    done = np.zeros((2, n, B), dtype=bool)
+
+    def boss_phase(i):
+        states[2, i] = engine.get_states()
+        acting = np.flatnonzero(~engine.game_over & (actions[i] >= 0))
+        if (~engine.available_actions()[acting, actions[i, acting]]).any():
+            raise ValueError(f"Recorded boss action not available in round {i + 1}")
+        targets = empty_targets(B)
+        for b, board in zip(acting, type_bitboards(engine.flat_type[acting], G)):
+            skill_key = ACTION_KEYS[actions[i, b]]
+            set_skill_params(targets, b, skill_key, skill_params_for_board(skill_key, board, rngs[b], heuristic=heuristic[b]), G)
+        # A live board without a skill only gets GameLogic's -10 (and the round-limit
+        # bonus and done flag, reached in the last round of a boss-first game)
+        no_skill = ~engine.game_over & (actions[i] < 0)
+        at_limit = no_skill & (engine.round >= R)
+        rewards[1, i] = np.where(no_skill, -10, 0) + np.where(at_limit, 150, 0)
+        was_over = engine.game_over.copy()
+        had_units = (engine.flat_type > 0).any(axis=1)
+        step_actions = np.where(engine.game_over, -1, actions[i])
+        boss_rewards, boss_done = engine.boss_step(step_actions, targets)
+        rewards[1, i] += boss_rewards
+        done[1, i] = boss_done | at_limit
+        boss_action[i] = step_actions
+        states[3, i] = engine.get_states()
+        if boss_first:
+            # The window only stops on a wiped board (boss_step also ends boards at the round limit)
+            engine.game_over = was_over | (had_units & ~(engine.flat_type > 0).any(axis=1))
+
+    for i in range(n):
+        live = ~engine.game_over
+        if not live.any():
+            break
+        played[i] = live
+        states[0, i] = engine.get_states()
+        for j in range(width):
+            ok = engine.place_units(codes[i, j] & (1 << _TYPE_BITS) - 1, codes[i, j] >> _TYPE_BITS)
+            failed = np.flatnonzero(ok != (live & (codes[i, j] > 0)))
+            if len(failed):
+                raise ValueError(f"Round {i + 1} placement {j + 1} failed in episode {failed[0]}")
+        if boss_first:
+            boss_phase(i)
+            wiped = live & engine.game_over
+            rewards[0, i], done[0, i] = engine.player_attack()
+            states[1, i] = np.where(wiped[:, None], states[3, i], engine.get_states())
+        else:
+            rewards[0, i], done[0, i] = engine.player_attack()
+            states[1, i] = engine.get_states()
+            boss_phase(i)
+        engine.next_round()
+        if not boss_first:
+            # EpisodeRunner stops before playing the round that reaches the limit (GameLogic's game-over check)
+            engine.game_over |= (engine.round >= R) & (engine.boss_hp > 0)
+
+    # Same check as resimulate(): every recorded round played, except an empty last one
+    lengths = played.sum(axis=0)
+    recorded = np.array([len(r["placements"]) for r in records])
+    empty_last = np.array([bool(r["placements"]) and not r["placements"][-1] for r in records])
+    mismatch = np.flatnonzero((lengths != recorded) & ~((lengths == recorded - 1) & empty_last))
+    if len(mismatch):
+        b = mismatch[0]
+        raise ValueError(f"Episode {b} replayed {lengths[b]} rounds, its record has {recorded[b]}")
+    rows = played.T # (B, n): row-major gives episode then round order
+    return {"episode": np.nonzero(rows)[0].astype(np.int32), "round": (np.nonzero(rows)[1] + 1).astype(np.int16),
+            "state_before_player": states[0].transpose(1, 0, 2)[rows],
+            "state_after_player": states[1].transpose(1, 0, 2)[rows],
+            "state_before_boss": states[2].transpose(1, 0, 2)[rows],
+            "state_after_boss": states[3].transpose(1, 0, 2)[rows],
+            "boss_action": boss_action.T[rows], "reward_player": rewards[0].T[rows],
+            "reward_boss": rewards[1].T[rows], "done_player": done[0].T[rows], "done_boss": done[1].T[rows]}
+
+
+def _batch_key(record):
+    return record["grid"], record["rounds"], _record_order(record)
+
+
+def boss_transitions(records, chunk_size=DEFAULT_CHUNK):
+    """(states, actions, rewards, next_states, dones) of every boss action in records, the same
+    arrays as agent_qtable.load_boss_action_log, rebuilt by re-simulation."""
+    parts = []
+    chunk = []
+    for record in records:
+        if chunk and (len(chunk) == chunk_size or _batch_key(record) != _batch_key(chunk[0])):
+            parts.append(resimulate_batch(chunk))
+            chunk = []
+        chunk.append(record)
+    if chunk:
+        parts.append(resimulate_batch(chunk))
+    if not parts:
+        return (np.zeros((0, STATE_SIZE), dtype=np.float32), np.zeros(0, dtype=np.int64), np.zeros(0),
+                np.zeros((0, STATE_SIZE), dtype=np.float32), np.zeros(0, dtype=bool))
+    acted = [t["boss_action"] >= 0 for t in parts]
+    return (np.concatenate([t["state_before_boss"][a] for t, a in zip(parts, acted)]),
+            np.concatenate([t["boss_action"][a] for t, a in zip(parts, acted)]).astype(np.int64),
+            np.concatenate([t["reward_boss"][a] for t, a in zip(parts, acted)]).astype(np.float64),
+            np.concatenate([t["state_after_boss"][a] for t, a in zip(parts, acted)]),
+            np.concatenate([t["done_boss"][a] for t, a in zip(parts, acted)]))
+
+
+class _LoggingRunner(EpisodeRunner):
+    # Keeps every process_boss_attack result of the live episode
+    def play_boss_turn(self):
+        results = super().play_boss_turn()
+        self.boss_turns.append(results)
+        return results
+
+
+def self_check(num_episodes, order, seed=0):
+    """Plays num_episodes seeded games in order (BOSS_FIRST: the Qt window's sequence),
+    records them and replays the records with both re-simulators.
+
+    Returns the indices of the episodes whose replay differs from the live boss turns.
+    """
+    runner = _LoggingRunner(seed=seed, order=order)
+    records, live = [], []
+    for _ in range(num_episodes):
+        runner.boss_turns = []
+        runner.run_episode()
+        records.append(episode_record(runner.game))
+        live.append((runner.boss_turns, runner.game.boss.current_hp))
+    batched = resimulate_batch(records)
+    game = GameLogic(grid_size=records[0]["grid"], max_rounds=records[0]["rounds"])
+    diverged = []
+    for i, (record, (boss_turns, final_hp)) in enumerate(zip(records, live)):
+        reference = resimulate(record, game)
+        rows = batched["episode"] == i
+        # Rounds where the boss got its turn (a player-first game can end on the player's attack)
+        took_turn = np.ones(len(reference["done_player"]), dtype=bool) if order == BOSS_FIRST else ~reference["done_player"]
+        expected = (np.array([r[6].vec for r in boss_turns]).reshape(-1, STATE_SIZE),
+                    np.array([r[3].vec for r in boss_turns]).reshape(-1, STATE_SIZE),
+                    np.array([r[4] for r in boss_turns], dtype=np.float32), np.array([r[5] for r in boss_turns], dtype=bool))
+        replayed = (reference["state_before_boss"][took_turn], reference["state_after_boss"][took_turn],
+                    reference["reward_boss"][took_turn], reference["done_boss"][took_turn])
+        if (record.get("order", PLAYER_FIRST) != order or game.boss.current_hp != final_hp
+                or any(not np.array_equal(a, b) for a, b in zip(expected, replayed))
+                or any(not np.array_equal(reference[name], batched[name][rows]) for name in reference)):
+            diverged.append(i)
+    return diverged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-simulate compact episode records.")
+    parser.add_argument("path", nargs="?", default=EPISODE_LOG)
+    parser.add_argument("--limit", type=int, help="Only the first N records")
+    parser.add_argument("--verify", type=int, default=0, metavar="N",
+                        help="Also replay the first N records through GameLogic and compare")
+    parser.add_argument("--self-check", type=int, default=0, metavar="N",
+                        help="Play N seeded games in each phase order, replay their records and compare (no log needed)")
+    args = parser.parse_args()
+
+    if args.self_check:
+        for order in (PLAYER_FIRST, BOSS_FIRST):
+            diverged = self_check(args.self_check, order)
+            print(f"{order}: {args.self_check - len(diverged)}/{args.self_check} episodes replay their live boss turns"
+                  + (f" (first divergent episode {diverged[0]})" if diverged else ""))
+        return
+
+    records = list(read_records(args.path))[:args.limit]
+    start = time.perf_counter()
+    actions = boss_transitions(records)[1]
+    elapsed = time.perf_counter() - start
+    print(f"{len(records)} episodes in {args.path} ({os.path.getsize(args.path) / max(1, len(records)):.0f} bytes/episode)")
+    print(f"Re-simulated {len(actions)} boss transitions in {elapsed:.2f}s "
+          f"({len(records) / elapsed if elapsed > 0 else 0.0:.0f} episodes/s)")
+    if args.verify:
+        checked = records[:args.verify]
+        batched = resimulate_batch(checked) if checked else {}
+        game = GameLogic(grid_size=checked[0]["grid"], max_rounds=checked[0]["rounds"]) if checked else None
+        for i, record in enumerate(checked):
+            reference = resimulate(record, game)
+            rows = batched["episode"] == i
+            if any(not np.array_equal(reference[name], batched[name][rows]) for name in reference):
+                print(f"Episode {i} differs between GameLogic and the batched replay")
+                return
+        print(f"GameLogic and batched replays agree on {len(checked)} episodes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# episode_runner.py
+# Headless episode driver on top of GameLogic (no Qt needed).
+from game_logic import GameLogic, PLAYER_FIRST, BOSS_FIRST
+
+
+def random_player_policy(game):
+    """Places a random set of units from stock on random empty cells.
+
+    Same behaviour as the old TacticsGridWindow.execute_player_turn_for_training;
+    draws come from the episode's player stream (game.player_rng).
+    """
+    rng = game.player_rng
+    num_to_place = game.get_max_units_to_place_this_round()
+    placed_count = 0
+
+    # Filter available unit types (those with stock) and shuffle them
+    available_types = [utype for utype, count in game.player_current_accumulation.items() if count > 0]
+    rng.shuffle(available_types)
+
+    for _ in range(num_to_place):
+        if not game.can_place_more_units_this_round() or not available_types:
+            break # Stop if placement limit reached or no units left to place
+
+        unit_type = available_types[int(rng.integers(len(available_types)))] # Choose a random available unit type
+
+        if game.player_current_accumulation[unit_type] > 0:
+            empty_cells = [(r,c) for r in range(game.grid_size) for c in range(game.grid_size) if game.grid_units[r][c] is None]
+            if empty_cells:
+                r_place,c_place = empty_cells[int(rng.integers(len(empty_cells)))]
+                success,_ = game.place_unit_from_stock(unit_type,r_place,c_place)
+                if success:
+                    placed_count+=1
+                    # If a unit type's stock becomes 0, remove it from available_types list
+                    if game.player_current_accumulation[unit_type]==0:
+                        if unit_type in available_types:
+                            available_types.remove(unit_type)
+
+        # If no available types are left but we still need to place units,
+        # refresh available_types from current stock.
+        if not available_types and placed_count < num_to_place:
+            available_types = [utype for utype,count in game.player_current_accumulation.items() if count>0]
+            if not available_types: break # If still no units, break
+            else: rng.shuffle(available_types) # Shuffle for next attempts
+
+
+class EpisodeRunner:
+    """Plays full episodes (player turn -> boss turn -> next round) without any UI.
+
+    player_policy(game) must place units through game.place_unit_from_stock.
+    seed fixes the sequence of episode seeds (game.episode_seed) of a new GameLogic.
+    order=BOSS_FIRST plays rounds like the Qt window (placement -> boss turn -> player
+    attack -> next round, up to and including the last round).
+    """
+    def __init__(self, agent=None, player_policy=random_player_policy, game=None, seed=None, order=PLAYER_FIRST):
+        if order not in (PLAYER_FIRST, BOSS_FIRST):
+            raise ValueError(f"Unknown phase order {order!r}")
+        self.game = game if game is not None else GameLogic(agent_instance=agent, seed=seed)
+        self.player_policy = player_policy
+        self.order = order
+
+    def play_player_turn(self):
+        self.game.game_phase = "PLACEMENT" # Ensure game state is correct for internal logic
+        self.player_policy(self.game)
+        results_pa = self.game.end_placement_phase() # Process player attack phase
+        return results_pa[3], results_pa[4], results_pa[5] # next_state_dict, reward, done (for player phase)
+
+    def play_boss_turn(self):
+        return self.game.process_boss_attack()
+
+    def play_next_round(self):
+        return self.game.proceed_to_next_round()
+
+    def run_episode(self, on_boss_transition=None, seed=None):
+        """Runs one episode, returns (episode_reward, boss_won).
+
+        seed replays a given episode seed instead of drawing the next one.
+        on_boss_transition(state, action_idx, reward, next_state, done) is called
+        after every boss action taken by an agent (e.g. agent.learn).
+        """
+        game = self.game
+        game.start_new_game(seed)
+        if self.order == BOSS_FIRST:
+            episode_reward = self._run_boss_first(on_boss_transition)
+        else:
+            episode_reward = self._run_player_first(on_boss_transition)
+        # Boss only counts as winner when it survives the round limit (same as before)
+        final_is_game_over, _final_message = game.check_game_over_conditions()
+        boss_won = final_is_game_over and game.boss.current_hp > 0
+        return episode_reward, boss_won
+
+    def _boss_turn(self, on_boss_transition):
+        boss_turn_results = self.play_boss_turn()
+        next_state_dict_after_boss, reward_for_boss_this_action, done_after_boss = boss_turn_results[3], boss_turn_results[4], boss_turn_results[5]
+        state_dict_boss_acted_on, action_idx_boss_took = boss_turn_results[6], boss_turn_results[7]
+        if on_boss_transition is not None and action_idx_boss_took is not None and state_dict_boss_acted_on is not None:
+            on_boss_transition(state_dict_boss_acted_on, action_idx_boss_took, reward_for_boss_this_action, next_state_dict_after_boss, done_after_boss)
+        return boss_turn_results
+
+    def _run_player_first(self, on_boss_transition):
+        game = self.game
+        episode_reward = 0
+        for _ in range(game.max_rounds + 2):
+            is_game_over, _ = game.check_game_over_conditions()
+            if is_game_over:
+                break
+            # Player turn
+            _state_after_player, reward_player_phase, done_player_phase = self.play_player_turn()
+            episode_reward += reward_player_phase
+            if done_player_phase:
+                break
+            # Boss turn
+            boss_turn_results = self._boss_turn(on_boss_transition)
+            episode_reward += boss_turn_results[4]
+            if boss_turn_results[5]:
+                break
+            status_nr, _msg_nr, _next_state_dict_new_round = self.play_next_round()
+            if status_nr == "game_over":
+                break
+        return episode_reward
+
+    def _run_boss_first(self, on_boss_transition):
+        # Same calls and game-over checks as TacticsGridWindow: on_end_placement_clicked ->
+        # execute_boss_turn_and_then -> execute_player_attack_phase -> execute_end_of_round
+        game = self.game
+        episode_reward = 0
+        for _ in range(game.max_rounds + 1):
+            game.game_phase = "PLACEMENT"
+            self.player_policy(game)
+            boss_turn_results = self._boss_turn(on_boss_transition)
+            episode_reward += boss_turn_results[4]
+            if boss_turn_results[0] == "game_over_player_wiped":
+                break
+            results_pa = game.process_player_attack()
+            episode_reward += results_pa[4]
+            if results_pa[0] == "game_over_boss_defeated":
+                break
+            status_nr, _msg_nr, _next_state_dict_new_round = self.play_next_round()
+            if status_nr == "game_over":
+                break
+        return episode_reward
@@ -0,0 +1,264 @@
+# experience_log.py
+# Columnar binary experience logs: a directory with one raw little-endian file per
+# column (<name>.bin, fixed-width rows) plus meta.json (schema, committed row count,
+# string vocabularies). Readers memory-map the columns, no parsing at all.
+# Usage: python experience_log.py convert Model/boss_actions.csv Model/boss_actions.exp [--kind boss]
+import argparse
+import datetime
+import json
+import os
+import numpy as np
+from game_state import GameState, STATE_FIELDS, STATE_SIZE
+
+FORMAT = "tactics-grid-experience-1"
+META_FILE = "meta.json"
+DEFAULT_CHUNK_ROWS = 4096
+BOSS_ACTIONS = ("normal_attack", "horizontal_shot", "vertical_shot", "heal", "ultimate") # ACTION_MAP_AGENT order
+
+# Column name -> (dtype, per-row shape). "vocab" columns hold int16 codes of strings listed in meta.json.
+_STATE = ("<f4", (STATE_SIZE,))
+SCHEMAS = {
+    "boss": {  # Model/boss_actions.csv
+        "state": _STATE, "action": ("<i1", ()), "reward": ("<f4", ()), "next_state": _STATE,
+        "done": ("|b1", ()), "round": ("<i2", ()), "timestamp": ("<f8", ()),
+    },
+    "player": {  # Model/player_actions.csv
+        "state": _STATE, "action": ("vocab", ()), "round": ("<i2", ()), "timestamp": ("<f8", ()),
+    },
+    "transition": {  # Model/game_transitions.csv
+        "state_before_player": _STATE, "player_action": ("vocab", ()), "state_after_player": _STATE,
+        "boss_action": ("<i1", ()), "state_after_boss": _STATE, "reward_boss": ("<f4", ()),
+        "reward_player": ("<f4", ()), "done": ("|b1", ()), "round": ("<i2", ()), "timestamp": ("<f8", ()),
+    },
+}
+VOCAB_DTYPE = "<i2"
+
+
+def _column_dtype(dtype):
+    return np.dtype(VOCAB_DTYPE if dtype == "vocab" else dtype)
+
+
+def _write_meta(path, meta):
+    tmp_path = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+
+
+class ExperienceLogWriter:
+    """Appends rows to a columnar log, creating it if needed.
+
+    Rows are buffered and written chunk_rows at a time: every column file gets
+    the chunk appended and fsynced, then meta.json's row count is updated (atomically).
+    Rows past the committed count, e.g. after a crash mid-chunk, are cut off on reopen;
+    a column file shorter than the committed count raises ValueError.
+    """
+    def __init__(self, path, kind="boss", chunk_rows=DEFAULT_CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+            if self.meta["kind"] != kind:
+                raise ValueError(f"{path} holds '{self.meta['kind']}' rows, not '{kind}'")
+        else:
+            self.meta = {"format": FORMAT, "kind": kind, "rows": 0, "state_fields": list(STATE_FIELDS),
+                         "boss_actions": list(BOSS_ACTIONS),
+                         "columns": {name: {"dtype": dtype, "shape": list(shape)} for name, (dtype, shape) in SCHEMAS[kind].items()},
+                         "vocab": {name: [] for name, (dtype, _) in SCHEMAS[kind].items() if dtype == "vocab"}}
+            _write_meta(path, self.meta)
+        self._codes = {name: {s: i for i, s in enumerate(words)} for name, words in self.meta["vocab"].items()}
+        self._buffer = {name: [] for name in self.meta["columns"]}
+        self._files = {}
+        for name, spec in self.meta["columns"].items():
+            f = open(os.path.join(path, name + ".bin"), "ab")
+            self._files[name] = f
+            row_bytes = _column_dtype(spec["dtype"]).itemsize * int(np.prod(spec["shape"]))
+            size = os.fstat(f.fileno()).st_size
+            if size < self.meta["rows"] * row_bytes:
+                self.close()
+                raise ValueError(f"{path}: {name}.bin holds {size // row_bytes} rows, meta.json commits {self.meta['rows']}")
+            f.truncate(self.meta["rows"] * row_bytes) # drop an uncommitted tail
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _encode(self, name, value):
+        codes = self._codes[name]
+        if value not in codes:
+            codes[value] = len(codes)
+            self.meta["vocab"][name].append(value)
+        return codes[value]
+
+    def append(self, **row):
+        """One row; every schema column must be given (states as GameState, dict or vector)."""
+        for name, values in self._buffer.items():
+            value = row[name]
+            if name in self._codes:
+                value = self._encode(name, value)
+            elif self.meta["columns"][name]["shape"]:
+                value = _state_vec(value)
+            values.append(value)
+        if len(self._buffer["round"]) >= self.chunk_rows:
+            self.flush()
+
+    def append_columns(self, columns):
+        """Many rows at once: {name: array or list} with equal lengths."""
+        self.flush()
+        n = len(columns["round"])
+        for name, f in self._files.items():
+            values = columns[name]
+            if name in self._codes:
+                values = [self._encode(name, value) for value in values]
+            spec = self.meta["columns"][name]
+            np.asarray(values, dtype=_column_dtype(spec["dtype"])).reshape([n] + spec["shape"]).tofile(f)
+        self._commit(n)
+
+    def flush(self):
+        n = len(self._buffer["round"])
+        if not n:
+            return
+        for name, f in self._files.items():
+            spec = self.meta["columns"][name]
+            np.asarray(self._buffer[name], dtype=_column_dtype(spec["dtype"])).reshape([n] + spec["shape"]).tofile(f)
+            self._buffer[name].clear()
+        self._commit(n)
+
+    def _commit(self, n):
+        # The rows must be on disk before meta.json counts them
+        for f in self._files.values():
+            f.flush()
+            os.fsync(f.fileno())
+        self.meta["rows"] += n
+        _write_meta(self.path, self.meta)
+
+    def close(self):
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+
+class ExperienceLog:
+    """Read side: log["state"] is a (rows, STATE_SIZE) float32 memmap, log["action"] a (rows,) array, ...
+
+    Only committed rows are visible. decode(name, codes) maps vocab codes back to strings.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE)) as f:
+            self.meta = json.load(f)
+        if self.meta.get("format") != FORMAT:
+            raise ValueError(f"{path} is not an experience log")
+        self.kind = self.meta["kind"]
+        self.rows = self.meta["rows"]
+        self.columns = {}
+        for name, spec in self.meta["columns"].items():
+            dtype, shape = _column_dtype(spec["dtype"]), (self.rows, *spec["shape"])
+            if self.rows:
+                self.columns[name] = np.memmap(os.path.join(path, name + ".bin"), dtype=dtype, mode="r", shape=shape)
+            else:
+                self.columns[name] = np.zeros(shape, dtype=dtype) # np.memmap refuses empty maps
+
+    def __len__(self):
+        return self.rows
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def decode(self, name, codes):
+        words = self.meta["vocab"][name]
+        return [words[int(code)] for code in np.atleast_1d(codes)]
+
+
+def is_experience_log(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, META_FILE))
+
+
+def _state_vec(state):
+    if isinstance(state, GameState):
+        return state.vec
+    if isinstance(state, dict):
+        return GameState.from_dict(state).vec
+    return np.asarray(state, dtype=np.float32)
+
+
+def _boss_action_idx(name):
+    return BOSS_ACTIONS.index(name) if name in BOSS_ACTIONS else -1
+
+
+def _number(value):
+    return float("nan") if value is None else value # e.g. reward_player, not logged by main.py
+
+
+def _timestamp(iso):
+    return datetime.datetime.fromisoformat(iso).timestamp() if iso else float("nan")
+
+
+def _parse_line(kind, entry):
+    # One JSONL entry of main.py's logs -> a row of SCHEMAS[kind]
+    if kind == "boss":
+        return {"state": json.loads(entry["state"]), "action": _boss_action_idx(entry["action"]),
+                "reward": entry["reward"], "next_state": json.loads(entry["next_state"]), "done": entry["done"],
+                "round": entry["round"], "timestamp": _timestamp(entry.get("timestamp"))}
+    if kind == "player":
+        return {"state": json.loads(entry["state"]), "action": entry["action"], "round": entry["round"],
+                "timestamp": _timestamp(entry.get("timestamp"))}
+    return {"state_before_player": json.loads(entry["state_before_player"]), "player_action": str(entry["player_action"]),
+            "state_after_player": json.loads(entry["state_after_player"]), "boss_action": _boss_action_idx(entry["boss_action"]),
+            "state_after_boss": json.loads(entry["state_after_boss"]), "reward_boss": _number(entry["reward_boss"]),
+            "reward_player": _number(entry["reward_player"]), "done": entry["done"], "round": entry["round"],
+            "timestamp": _timestamp(entry.get("timestamp"))}
+
+
+def convert_jsonl(src, dst, kind, chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Appends every row of a JSONL log (main.py format) to the columnar log dst; returns the row count."""
+    count = 0
+    with open(src) as f, ExperienceLogWriter(dst, kind, chunk_rows) as writer:
+        for line in f:
+            if line.strip():
+                writer.append(**_parse_line(kind, json.loads(line)))
+                count += 1
+    return count
+
+
+def guess_kind(path):
+    name = os.path.basename(path)
+    if "player" in name:
+        return "player"
+    if "transition" in name:
+        return "transition"
+    return "boss"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar experience logs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    convert = sub.add_parser("convert", help="Append a JSONL log (Model/*.csv) to a columnar log")
+    convert.add_argument("src")
+    convert.add_argument("dst")
+    convert.add_argument("--kind", choices=sorted(SCHEMAS), help="Default: guessed from the file name")
+    info = sub.add_parser("info", help="Print the schema and row count of a columnar log")
+    info.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        kind = args.kind or guess_kind(args.src)
+        count = convert_jsonl(args.src, args.dst, kind)
+        print(f"Converted {count} '{kind}' rows from {args.src} into {args.dst} ({len(ExperienceLog(args.dst))} rows total)")
+    else:
+        log = ExperienceLog(args.path)
+        print(f"{args.path}: {log.kind}, {len(log)} rows")
+        for name, column in log.columns.items():
+            print(f"  {name:<20} {column.dtype} {column.shape[1:]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# experience_store.py
+# Optional SQLite (stdlib sqlite3) store of boss transitions for analysis and targeted
+# replay. Round, action, reward, boss HP and episode are indexed columns, so questions like
+# "boss actions in round 9 with rage 3" or per-action training batches are index lookups
+# instead of scans over the JSONL logs. States are stored as float32 blobs (GameState.vec).
+# Usage: python experience_store.py Model/experience.sqlite ["round = 9 AND boss_rage = 3"]
+import sqlite3
+import sys
+import time
+import numpy as np
+from game_state import GameState, STATE_SIZE
+
+EXPERIENCE_DB_FILE = "Model/experience.sqlite"
+STRATA = ("action", "round", "done") # columns sample_stratified() can balance on
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    source TEXT,
+    started REAL
+);
+CREATE TABLE IF NOT EXISTS transitions (
+    id INTEGER PRIMARY KEY,
+    episode_id INTEGER NOT NULL REFERENCES episodes(id),
+    step INTEGER NOT NULL,
+    round INTEGER NOT NULL,
+    action INTEGER NOT NULL,
+    reward REAL NOT NULL,
+    done INTEGER NOT NULL,
+    boss_hp INTEGER NOT NULL,
+    boss_rage INTEGER NOT NULL,
+    state BLOB NOT NULL,
+    next_state BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_round ON transitions(round, boss_rage);
+CREATE INDEX IF NOT EXISTS transitions_action ON transitions(action);
+CREATE INDEX IF NOT EXISTS transitions_reward ON transitions(reward);
+CREATE INDEX IF NOT EXISTS transitions_boss_hp ON transitions(boss_hp);
+CREATE INDEX IF NOT EXISTS transitions_episode ON transitions(episode_id, step);
+"""
+_COLUMNS = "episode_id, step, round, action, reward, done, boss_hp, boss_rage, state, next_state"
+
+
+def _vec(state):
+    if isinstance(state, GameState):
+        return state.vec
+    if isinstance(state, dict):
+        return GameState.from_dict(state).vec
+    return np.asarray(state, dtype=np.float32)
+
+
+class ExperienceStore:
+    """Transitions grouped by episode in one SQLite file.
+
+    Game/training loops call begin_episode(), record() per boss transition and
+    end_episode(), which inserts the episode's rows in a single transaction.
+    add_arrays() bulk-loads whole arrays (e.g. a converted log). select() and
+    sample_stratified() return the same (states, actions, rewards, next_states,
+    dones) arrays as the log loaders; where clauses are SQL over the columns
+    round, action, reward, done, boss_hp, boss_rage, episode_id and step.
+    """
+    def __init__(self, path=EXPERIENCE_DB_FILE, source="game"):
+        self.path = path
+        self.source = source # episodes started implicitly by record()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.episode_id = None
+        self._pending = []
+        # sample_stratified(): (by, where, params) -> [last id read, {stratum value: ids}]
+        self._strata_ids = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.end_episode()
+        self.conn.close()
+
+    def begin_episode(self, source=None):
+        self.end_episode()
+        with self.conn:
+            self.episode_id = self.conn.execute("INSERT INTO episodes (source, started) VALUES (?, ?)",
+                                                (source or self.source, time.time())).lastrowid
+        return self.episode_id
+
+    def record(self, state, action, reward, next_state, done):
+        if self.episode_id is None:
+            self.begin_episode()
+        vec = _vec(state)
+        self._pending.append((self.episode_id, len(self._pending), int(vec[8]), int(action), float(reward), int(bool(done)),
+                              int(vec[0]), int(vec[1]), vec.astype(np.float32).tobytes(),
+                              _vec(next_state).astype(np.float32).tobytes()))
+
+    def end_episode(self):
+        if self._pending:
+            with self.conn:
+                self.conn.executemany(f"INSERT INTO transitions ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+        self.episode_id = None
+
+    def add_arrays(self, states, actions, rewards, next_states, dones, source="import"):
+        """Bulk insert (one transaction) as a new episode; returns its id."""
+        episode_id = self.begin_episode(source)
+        states = np.asarray(states, dtype=np.float32)
+        next_states = np.asarray(next_states, dtype=np.float32)
+        rows = ((episode_id, step, int(s[8]), int(a), float(r), int(bool(d)), int(s[0]), int(s[1]), s.tobytes(), n.tobytes())
+                for step, (s, a, r, n, d) in enumerate(zip(states, actions, rewards, next_states, dones)))
+        with self.conn:
+            self.conn.executemany(f"INSERT INTO transitions ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self.episode_id = None
+        return episode_id
+
+    def count(self, where=None, params=()):
+        return self.conn.execute(f"SELECT COUNT(*) FROM transitions{_where(where)}", params).fetchone()[0]
+
+    def select(self, where=None, params=(), order_by="id", limit=None):
+        sql = f"SELECT state, action, reward, next_state, done FROM transitions{_where(where)} ORDER BY {order_by}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return _to_arrays(self.conn.execute(sql, params).fetchall())
+
+    def sample_stratified(self, batch_size, by="action", where=None, params=(), rng=None):
+        """batch_size rows split evenly over the values of `by` (uniform within each stratum,
+        with replacement when a stratum is small).
+
+        The ids of every stratum are kept between calls and only rows added since the
+        last call are read (transitions are only ever appended), so a batch costs
+        O(batch_size + new rows) instead of a scan over the whole table.
+        """
+        if by not in STRATA:
+            raise ValueError(f"Cannot stratify by {by!r}, expected one of {STRATA}")
+        rng = rng if rng is not None else np.random.default_rng()
+        strata = self._stratum_ids(by, where, tuple(params))
+        if not strata:
+            return _to_arrays([])
+        values = sorted(strata)
+        per_stratum = np.full(len(values), batch_size // len(values))
+        per_stratum[rng.permutation(len(values))[:batch_size % len(values)]] += 1
+        ids = []
+        for value, k in zip(values, per_stratum):
+            if k:
+                stratum_ids = strata[value]
+                ids.extend(stratum_ids[rng.integers(len(stratum_ids), size=int(k))].tolist() if k > len(stratum_ids)
+                           else rng.choice(stratum_ids, size=int(k), replace=False).tolist())
+        rows = {}
+        unique_ids = sorted(set(ids))
+        for start in range(0, len(unique_ids), 900): # stay under SQLite's bound-parameter limit
+            chunk = unique_ids[start:start + 900]
+            placeholders = ",".join("?" * len(chunk))
+            for row in self.conn.execute(f"SELECT id, state, action, reward, next_state, done FROM transitions WHERE id IN ({placeholders})", chunk):
+                rows[row[0]] = row[1:]
+        return _to_arrays([rows[i] for i in ids])
+
+    def _stratum_ids(self, by, where, params):
+        # {stratum value: int64 ids}, brought up to date with a primary-key range read of the new rows
+        cached = self._strata_ids.setdefault((by, where, params), [0, {}])
+        last_id, strata = cached
+        clause = (f"({where}) AND " if where else "") + "id > ?"
+        new = self.conn.execute(f"SELECT id, {by} FROM transitions WHERE {clause} ORDER BY id", (*params, last_id)).fetchall()
+        if new:
+            new = np.array(new, dtype=np.int64)
+            for value in np.unique(new[:, 1]).tolist():
+                ids = new[new[:, 1] == value, 0]
+                strata[value] = np.concatenate((strata[value], ids)) if value in strata else ids
+            cached[0] = int(new[-1, 0])
+        return strata
+
+
+def _where(where):
+    return f" WHERE {where}" if where else ""
+
+
+def _to_arrays(rows):
+    n = len(rows)
+    states = np.frombuffer(b"".join(r[0] for r in rows), dtype=np.float32).reshape(n, STATE_SIZE)
+    next_states = np.frombuffer(b"".join(r[3] for r in rows), dtype=np.float32).reshape(n, STATE_SIZE)
+    return (states, np.array([r[1] for r in rows], dtype=np.int64), np.array([r[2] for r in rows], dtype=np.float64),
+            next_states, np.array([r[4] for r in rows], dtype=bool))
+
+
+def main():
+    # Quick look at a store: row count and per-action stats, optionally filtered
+    path = sys.argv[1] if len(sys.argv) > 1 else EXPERIENCE_DB_FILE
+    where = sys.argv[2] if len(sys.argv) > 2 else None
+    with ExperienceStore(path) as store:
+        start = time.perf_counter()
+        stats = store.conn.execute(f"SELECT action, COUNT(*), AVG(reward) FROM transitions{_where(where)} GROUP BY action").fetchall()
+        elapsed = time.perf_counter() - start
+        print(f"{store.count()} transitions in {path}" + (f", {sum(c for _, c, _ in stats)} where {where}" if where else ""))
+        for action, count, avg_reward in stats:
+            print(f"  action {action}: {count} rows, avg reward {avg_reward:.2f}")
+        print(f"Query took {elapsed * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
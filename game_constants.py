@@ -0,0 +1,13 @@
+# game_constants.py
+# Ids shared by the engines, targeting, the agents and the episode records. Only depends
+# on units.py, so any module can import it at the top without an import cycle.
+from units import PLAYER_UNIT_SPECS
+
+# Unit type ids on the board (0 = empty cell), in PLAYER_UNIT_SPECS order
+UNIT_TYPE_NAMES = ("",) + tuple(PLAYER_UNIT_SPECS.keys())  # ("", "Tank", "Knight", "AD")
+UNIT_TYPE_IDS = {name: idx for idx, name in enumerate(UNIT_TYPE_NAMES) if name}
+
+# Boss action ids (same order as ACTION_MAP_AGENT in the agents)
+ACTION_KEYS = ("normal_attack", "horizontal_shot", "vertical_shot", "heal", "ultimate")
+NORMAL_ATTACK, HORIZONTAL_SHOT, VERTICAL_SHOT, HEAL, ULTIMATE = range(len(ACTION_KEYS))
+ULTIMATE_MAX_TARGETS = 6
@@ -1,16 +1,45 @@
 # game_logic.py
-import random
+import numpy as np
 from units import Unit, Tank, Knight, AD, PLAYER_UNIT_SPECS
 from boss import Boss
-# from agent_qtable import get_game_state_for_q_table
-from agent_dqn import get_game_state_for_dqn
+from game_state import get_game_state_for_dqn
+from bitboard import Bitboard
+from shot_table import get_shot_table, CELL_HP
+
+# Independent random streams of one episode, all spawned from its seed (see episode_rngs)
+EPISODE_STREAMS = ("targeting", "boss", "agent", "player")
+# Phase order of a round: EpisodeRunner attacks with the player first, the Qt window lets the boss act first
+PLAYER_FIRST = "player_first"
+BOSS_FIRST = "boss_first"
+
+def episode_rngs(seed, streams=EPISODE_STREAMS):
+    """{stream name: np.random.Generator} for one episode; the same seed gives the same draws.
+
+    Stream i is SeedSequence(seed).spawn(...)[i], so a subset (e.g. only "targeting" for a
+    replay) draws exactly what the full set would.
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    return {name: np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(EPISODE_STREAMS.index(name),)))
+            for name in streams}
 
 class GameLogic:
-    def __init__(self, grid_size=4, max_rounds=9, agent_instance=None):
+    def __init__(self, grid_size=4, max_rounds=9, agent_instance=None, debug_checks=False, seed=None):
         self.grid_size = grid_size
         self.max_rounds = max_rounds
-        self.grid_units = [[None for _ in range(grid_size)] for _ in range(grid_size)]
+        # Episode seeds come from this generator unless start_new_game gets one explicitly
+        self._seed_rng = np.random.default_rng(seed)
+        self.episode_seed = None
+        self.player_rng = np.random.default_rng() # random player placements (episode_runner)
+        # What episode_record.py needs to replay the current episode: placements per round, boss skill keys
+        self.episode_placements = []
+        self.episode_boss_actions = []
+        self.phase_order = PLAYER_FIRST # set by the first boss turn of an episode
+        self._player_attack_round = 0
+        # debug_checks: cross-check the running board counters against a full grid scan after every change
+        self.debug_checks = debug_checks
+        self._reset_board()
         self.boss = Boss(agent=agent_instance)
+        self.shot_table = get_shot_table(grid_size, self.boss.skills["horizontal_shot"]["damage"])
         self.current_round = 0
         self.player_max_accumulation = {name:spec["max_accumulation"] for name,spec in PLAYER_UNIT_SPECS.items()}
         self.player_current_accumulation = {}
@@ -21,9 +50,10 @@ class GameLogic:
         self.action_log = []
         self.units_destroyed_this_round_by_boss = 0
 
-    def start_new_game(self):
+    def start_new_game(self, seed=None):
+        self._seed_episode(seed)
         self._boss_ultimate_count = 0
-        self.grid_units = [[None for _ in range(self.grid_size)] for _ in range(self.grid_size)]
+        self._reset_board()
         self.boss.current_hp = self.boss.max_hp
         self.boss.current_rage = 0
         for skill_key in self.boss.skills: self.boss.skills[skill_key]["cd_timer"] = 0
@@ -33,6 +63,63 @@ class GameLogic:
         self._setup_new_round()
         return get_game_state_for_dqn(self)
 
+    def _seed_episode(self, seed):
+        # Every random draw of the episode (targeting, fallback AI, agent exploration, random
+        # player) comes from its own stream, so the seed plus the recorded choices replay it exactly
+        self.episode_seed = int(self._seed_rng.integers(2**63)) if seed is None else int(seed)
+        rngs = episode_rngs(self.episode_seed)
+        self.boss.rng = rngs["targeting"]
+        self.boss.policy_rng = rngs["boss"]
+        if hasattr(self.boss.agent, "rng"):
+            self.boss.agent.rng = rngs["agent"]
+        self.player_rng = rngs["player"]
+        self.episode_placements = []
+        self.episode_boss_actions = []
+        self.phase_order = PLAYER_FIRST
+        self._player_attack_round = 0
+
+    # --- Board bookkeeping: every unit enters/leaves the grid through these ---
+    def _reset_board(self):
+        self.grid_units = [[None for _ in range(self.grid_size)] for _ in range(self.grid_size)]
+        self.unit_counts = {name: 0 for name in PLAYER_UNIT_SPECS}
+        self.total_player_attack = 0
+        self.occupied_cells = set()
+        self.bitboard = Bitboard(self.grid_size) # per-type masks for targeting
+
+    def _add_unit(self, unit, r, c):
+        self.grid_units[r][c] = unit
+        self.unit_counts[unit.name] += 1
+        self.total_player_attack += unit.attack_power
+        self.occupied_cells.add((r, c))
+        self.bitboard.set(unit.name, r, c)
+        if self.debug_checks: self.verify_board_counters()
+
+    def _remove_unit(self, r, c):
+        unit = self.grid_units[r][c]
+        self.grid_units[r][c] = None
+        self.unit_counts[unit.name] -= 1
+        self.total_player_attack -= unit.attack_power
+        self.occupied_cells.discard((r, c))
+        self.bitboard.clear(unit.name, r, c)
+        if self.debug_checks: self.verify_board_counters()
+
+    def verify_board_counters(self):
+        counts = {name: 0 for name in PLAYER_UNIT_SPECS}
+        attack = 0
+        occupied = set()
+        for r in range(self.grid_size):
+            for c in range(self.grid_size):
+                unit = self.grid_units[r][c]
+                if unit:
+                    counts[unit.name] += 1
+                    attack += unit.attack_power
+                    occupied.add((r, c))
+        if counts != self.unit_counts or attack != self.total_player_attack or occupied != self.occupied_cells:
+            raise AssertionError(f"Board counters out of sync: counts {self.unit_counts} vs {counts}, "
+                                 f"attack {self.total_player_attack} vs {attack}, occupied {sorted(self.occupied_cells)} vs {sorted(occupied)}")
+        if Bitboard.from_grid(self.grid_units) != self.bitboard:
+            raise AssertionError(f"Bitboard out of sync: {self.bitboard.masks} vs {Bitboard.from_grid(self.grid_units).masks}")
+
     def _regenerate_player_accumulation(self):
         if self.current_round > 1:
             for unit_name in PLAYER_UNIT_SPECS:
@@ -45,6 +132,7 @@ class GameLogic:
         self.units_placed_this_round_count = 0 
         self.boss.decrement_cooldowns()
         self.units_destroyed_this_round_by_boss = 0
+        self.episode_placements.append([])
         if self.current_round > 1:
             self._regenerate_player_accumulation()
         self.action_log.append(f"--- Round {self.current_round} ---")
@@ -68,9 +156,10 @@ class GameLogic:
 
         unit_class = PLAYER_UNIT_SPECS[unit_name_to_place]["class"]
         unit_instance = unit_class(position=(r,c))
-        self.grid_units[r][c] = unit_instance
+        self._add_unit(unit_instance, r, c)
         self.player_current_accumulation[unit_name_to_place] -= 1
         self.units_placed_this_round_count += 1
+        self.episode_placements[-1].append((unit_name_to_place, r, c))
         self.action_log.append(f"Placed {unit_instance.name} at ({r},{c}). Stock: {self.player_current_accumulation[unit_name_to_place]}. Placed: {self.units_placed_this_round_count}.")
         return True, f"Placed {unit_instance.name}."
 
@@ -80,10 +169,11 @@ class GameLogic:
 
     def process_player_attack(self):
         self.game_phase = "PLAYER_ATTACK"
-        total_player_damage = 0
+        self._player_attack_round = self.current_round
+        total_player_damage = self.total_player_attack
         current_log = ["Player attacks:"]
 
-        active_units = any(self.grid_units[r][c] for r in range(self.grid_size) for c in range(self.grid_size))
+        active_units = bool(self.occupied_cells)
         if not active_units and self.current_round > 0 :
             current_log.append("No player units on board to attack.")
             self.action_log.extend(current_log)
@@ -91,12 +181,10 @@ class GameLogic:
             next_state_dict = get_game_state_for_dqn(self)
             return "boss_turn", "No player units. Boss's turn.", 0, next_state_dict, 0, False
 
-        for r_idx in range(self.grid_size):
-            for c_idx in range(self.grid_size):
-                unit = self.grid_units[r_idx][c_idx]
-                if unit and unit.attack_power > 0:
-                    total_player_damage += unit.attack_power
-                    current_log.append(f"- {unit.name} ({r_idx},{c_idx}) deals {unit.attack_power} damage.")
+        for r_idx, c_idx in sorted(self.occupied_cells): # log only, damage total is kept incrementally
+            unit = self.grid_units[r_idx][c_idx]
+            if unit.attack_power > 0:
+                current_log.append(f"- {unit.name} ({r_idx},{c_idx}) deals {unit.attack_power} damage.")
         
         boss_died = False
         if total_player_damage > 0:
@@ -133,7 +221,10 @@ class GameLogic:
         reward_for_boss_action = 0 # This reward is for actions taken by the boss in *this* phase
 
         current_state_dict_for_agent = get_game_state_for_dqn(self)
-        chosen_skill_key, skill_params_val, action_idx = self.boss.choose_action_by_agent(current_state_dict_for_agent, self.grid_units)
+        chosen_skill_key, skill_params_val, action_idx = self.boss.choose_action_by_agent(current_state_dict_for_agent, self.bitboard)
+        self.episode_boss_actions.append(chosen_skill_key)
+        if len(self.episode_boss_actions) == 1:
+            self.phase_order = PLAYER_FIRST if self._player_attack_round == self.current_round else BOSS_FIRST
         
         if action_idx is None and self.boss.agent is not None:
             pass
@@ -187,7 +278,7 @@ class GameLogic:
                     else:
                         reward_for_boss_action += 1  # Chỉ +1 khi tiêu diệt unit khác bằng đánh thường
                     units_killed += 1
-                    self.grid_units[r][c] = None
+                    self._remove_unit(r, c)
                     self.units_destroyed_this_round_by_boss+=1
                     current_log.append(f"  - {unit.name} destroyed!")
                 else:
@@ -201,74 +292,31 @@ class GameLogic:
             if actual_hit_coords_for_animation:
                 animation_triggers.append({"type": "normal_attack", "targets": actual_hit_coords_for_animation})
         elif chosen_skill_key == "horizontal_shot" or chosen_skill_key == "vertical_shot":
-            SHOT_INSTANCES = 4
-            damage_instances_left = SHOT_INSTANCES
             line_idx = skill_params_val.get("line_idx", 0)
             direction = skill_params_val.get("direction", None)
-            line_coords_ordered = []
             anim_type = chosen_skill_key
-            if chosen_skill_key == "horizontal_shot":
+            horizontal = chosen_skill_key == "horizontal_shot"
+            if horizontal:
                 current_log.append(f"- Bắn Ngang (4 charges) on row {line_idx} dir {direction}:")
-                if direction == "rtl":
-                    for c_idx in range(self.grid_size - 1, -1, -1): line_coords_ordered.append((line_idx, c_idx))
-                else:
-                    for c_idx in range(self.grid_size): line_coords_ordered.append((line_idx, c_idx))
             else:
                 current_log.append(f"- Bắn Dọc (4 charges) on column {line_idx} dir {direction}:")
-                if direction == "btt":
-                    for r_idx in range(self.grid_size - 1, -1, -1): line_coords_ordered.append((r_idx, line_idx))
-                else:
-                    for r_idx in range(self.grid_size): line_coords_ordered.append((r_idx, line_idx))
-            hit_at_least_one_target_in_line = False
-            for r, c in line_coords_ordered:
-                if damage_instances_left <= 0: break
-                unit_in_cell = self.grid_units[r][c]
-                if unit_in_cell:
-                    hit_at_least_one_target_in_line = True
-                    actual_hit_coords_for_animation.append((r,c))
-                    units_hit += 1
-                    if isinstance(unit_in_cell, Tank) and not is_unblockable:
-                        current_log.append(f"  - Beam reaches Tank {unit_in_cell.name} at ({r},{c}). HP: {unit_in_cell.current_hp}")
-                        hits_on_tank = 0
-                        while damage_instances_left > 0 and unit_in_cell.current_hp > 0:
-                            current_log.append(f"    - Tank takes 1 hit from charge. ({damage_instances_left-1} charges left)")
-                            unit_in_cell.take_damage(damage_per_hit_instance)
-                            reward_for_boss_action -= 10
-                            damage_instances_left -= 1
-                            hits_on_tank += 1
-                            if unit_in_cell.current_hp <= 0:
-                                current_log.append(f"    - Tank {unit_in_cell.name} destroyed after {hits_on_tank} hits!")
-                                reward_for_boss_action -= 20
-                                units_killed += 1
-                                self.grid_units[r][c] = None
-                                self.units_destroyed_this_round_by_boss += 1
-                                break
-                        if unit_in_cell and unit_in_cell.current_hp > 0: 
-                            current_log.append(f"    - Tank {unit_in_cell.name} survives. Skill exhausted on Tank.")
-                            damage_instances_left = 0                             
-                    else:
-                        current_log.append(f"  - Beam hits {unit_in_cell.name} at ({r},{c}) for 1 charge.")
-                        unit_name_hit = unit_in_cell.name
-                        if unit_in_cell.take_damage(damage_per_hit_instance):
-                            if unit_name_hit == "Tank":
-                                reward_for_boss_action -= 20
-                            else:
-                                reward_for_boss_action += 15  # Thưởng lớn khi tiêu diệt unit khác bằng skill diện rộng
-                            units_killed += 1
-                            self.grid_units[r][c] = None
-                            self.units_destroyed_this_round_by_boss += 1
-                            current_log.append(f"    - {unit_name_hit} destroyed!")
-                        else: 
-                            if unit_name_hit == "Tank":
-                                reward_for_boss_action -= 10
-                            else:
-                                reward_for_boss_action += 5  # Thưởng nhỏ khi gây sát thương unit khác bằng skill diện rộng
-                            current_log.append(f"    - {unit_name_hit} survives. Beam continues...")
-                        damage_instances_left -=1 
-                else:
-                    empty_targets += 1
-            if not hit_at_least_one_target_in_line:
-                reward_for_boss_action -= 2  # Phạt nhẹ khi bắn vào dòng/cột trống
+            # The outcome only depends on the line contents in beam order: encode them and look it up
+            shot_table = self.shot_table
+            line_coords_ordered = shot_table.line_coords(horizontal, line_idx, direction == ("rtl" if horizontal else "btt"))
+            outcome = shot_table.lookup(shot_table.encode(self.grid_units, line_coords_ordered))
+            for k, text in outcome.log:
+                r, c = line_coords_ordered[k]
+                current_log.append(text.format(pos=f"({r},{c})"))
+            for k in outcome.hits:
+                r, c = line_coords_ordered[k]
+                self.grid_units[r][c].current_hp = CELL_HP[outcome.new_cells[k]]
+                actual_hit_coords_for_animation.append((r,c))
+            for k in outcome.kills:
+                self._remove_unit(*line_coords_ordered[k])
+            units_hit += len(outcome.hits)
+            units_killed += len(outcome.kills)
+            self.units_destroyed_this_round_by_boss += len(outcome.kills)
+            reward_for_boss_action += outcome.reward
             if actual_hit_coords_for_animation: 
                 animation_triggers.append({"type": anim_type, "targets": actual_hit_coords_for_animation})
         elif chosen_skill_key == "ultimate":
@@ -290,7 +338,7 @@ class GameLogic:
                         else:
                             reward_for_boss_action += 25  # Thưởng rất lớn khi tiêu diệt unit khác bằng ultimate
                         units_killed += 1
-                        self.grid_units[r_target][c_target]=None
+                        self._remove_unit(r_target, c_target)
                         self.units_destroyed_this_round_by_boss+=1
                         current_log.append(f"    - {unit.name} destroyed!")
                     else:
@@ -331,7 +379,7 @@ class GameLogic:
         done = False
         status_ui = "round_end"
         msg_ui = "Boss turn finished."
-        player_units_left = any(self.grid_units[r][c] for r in range(self.grid_size) for c in range(self.grid_size))
+        player_units_left = bool(self.occupied_cells)
         if not player_units_left and self.units_destroyed_this_round_by_boss > 0:
             self.action_log.append("All player units destroyed by Boss this round!")
             reward_for_boss_action += 100 # Thưởng rất lớn khi quét sạch bàn cờ
@@ -0,0 +1,86 @@
+# game_state.py
+# Compact, fixed-layout game state shared by GameLogic, the agents and the logs.
+import numpy as np
+
+# Vector layout (same order the agents always used)
+STATE_FIELDS = ("boss_hp", "boss_rage", "cd_hshot", "cd_vshot", "cd_heal", "tank", "knight", "ad", "current_round")
+STATE_SIZE = len(STATE_FIELDS)
+COOLDOWN_KEYS = ("horizontal_shot", "vertical_shot", "heal")
+UNIT_KEYS = ("Tank", "Knight", "AD")
+_SCALAR_INDEX = {"boss_hp": 0, "boss_rage": 1, "current_round": 8}
+_DICT_KEYS = ("boss_hp", "boss_max_hp", "boss_rage", "skill_cooldowns", "unit_counts", "current_round")
+
+
+class GameState:
+    """Snapshot of the agent-visible state backed by one float32 array.
+
+    to_vector() returns the backing array itself (no copy). Read-only dict-style
+    access (state["boss_hp"], state["skill_cooldowns"]["heal"], ...) is kept for
+    the UI and the logs; to_dict() gives the nested dict used in the JSON logs.
+    """
+    __slots__ = ("vec", "boss_max_hp")
+
+    def __init__(self, vec, boss_max_hp):
+        self.vec = vec
+        self.boss_max_hp = boss_max_hp
+
+    @classmethod
+    def from_dict(cls, state_dict):
+        cds = state_dict["skill_cooldowns"]
+        counts = state_dict["unit_counts"]
+        vec = np.array([state_dict["boss_hp"], state_dict["boss_rage"],
+                        cds["horizontal_shot"], cds["vertical_shot"], cds["heal"],
+                        counts["Tank"], counts["Knight"], counts["AD"],
+                        state_dict["current_round"]], dtype=np.float32)
+        return cls(vec, state_dict.get("boss_max_hp"))
+
+    def to_vector(self):
+        return self.vec
+
+    def __getitem__(self, key):
+        if key in _SCALAR_INDEX:
+            return int(self.vec[_SCALAR_INDEX[key]])
+        if key == "skill_cooldowns":
+            return dict(zip(COOLDOWN_KEYS, map(int, self.vec[2:5])))
+        if key == "unit_counts":
+            return dict(zip(UNIT_KEYS, map(int, self.vec[5:8])))
+        if key == "boss_max_hp":
+            return self.boss_max_hp
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __contains__(self, key):
+        return key in _DICT_KEYS
+
+    def keys(self):
+        return _DICT_KEYS
+
+    def __iter__(self):
+        return iter(_DICT_KEYS)
+
+    def to_dict(self):
+        return {key: self[key] for key in _DICT_KEYS}
+
+    def __repr__(self):
+        return f"GameState({self.to_dict()})"
+
+
+def state_to_dict(state):
+    # Logs are JSON: accept both GameState and plain dicts (e.g. states read back from logs)
+    return state.to_dict() if isinstance(state, GameState) else state
+
+
+def get_game_state_for_dqn(game_logic_instance):
+    boss=game_logic_instance.boss
+    unit_counts=game_logic_instance.unit_counts # kept up to date by GameLogic, no grid scan
+    skills=boss.skills
+    vec=np.array([boss.current_hp, boss.current_rage,
+                  skills["horizontal_shot"]["cd_timer"], skills["vertical_shot"]["cd_timer"], skills["heal"]["cd_timer"],
+                  unit_counts["Tank"], unit_counts["Knight"], unit_counts["AD"],
+                  game_logic_instance.current_round], dtype=np.float32)
+    return GameState(vec, boss.max_hp)
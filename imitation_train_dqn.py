@@ -1,24 +1,32 @@
+# imitation_train_dqn.py
+# Offline training of the boss DQN from logged games: the log is read into arrays once,
+# then trained for a number of epochs on shuffled fixed-size mini-batches with a held-out
+# validation split and early stopping.
+#   td: Q-learning targets (reward + gamma * max Q(next_state)) on the logged transitions
+#   bc: behavior cloning, cross-entropy of the Q-values against the logged actions
+# Usage: python imitation_train_dqn.py [--source boss|episodes|player] [--mode td|bc] [--epochs 20] [--batch-size 256]
+import argparse
+import copy
 import json
-import os
+import time
+import numpy as np
+import torch
+import torch.nn.functional as F
 from agent_dqn import DQNAgent
+from agent_qtable import load_boss_action_log
+from episode_record import EPISODE_LOG, boss_transitions, read_records
+from experience_log import ExperienceLog, is_experience_log
+from game_state import GameState, STATE_SIZE
 
 PLAYER_ACTION_LOG = "Model/player_actions.csv"
+BOSS_ACTION_LOG = "Model/boss_actions.csv"
 DQN_MODEL_FILE = "Model/dqn_agent_imitation.pt"
-
-# Đọc dữ liệu hành động người chơi
-player_data = []
-with open(PLAYER_ACTION_LOG, 'r') as f:
-    for line in f:
-        entry = json.loads(line)
-        state = json.loads(entry['state'])
-        action = entry['action']
-        player_data.append((state, action))
+EVAL_CHUNK = 65536
 
 # Map action string về action index
 ACTION_MAP_AGENT = {
     0: "normal_attack", 1: "horizontal_shot", 2: "vertical_shot", 3: "heal", 4: "ultimate"
 }
-ACTION_STR_TO_IDX = {v: k for k, v in ACTION_MAP_AGENT.items()}
 
 def parse_action(action_str):
     for idx, name in ACTION_MAP_AGENT.items():
@@ -26,18 +34,137 @@ def parse_action(action_str):
             return idx
     return None
 
-# Khởi tạo DQN agent
-agent = DQNAgent(model_file=DQN_MODEL_FILE)
-agent.epsilon = 0.0  # Không exploration khi imitation
-
-# Huấn luyện DQN từ dữ liệu người chơi
-for i in range(len(player_data)-1):
-    state, action = player_data[i]
-    next_state, _ = player_data[i+1]
-    action_idx = parse_action(action)
-    if action_idx is not None:
-        # Gán reward = 1 cho imitation (hoặc có thể reward = 0)
-        agent.learn(state, action_idx, reward=1, next_state_dict=next_state, done=False)
-
-agent.save(DQN_MODEL_FILE)
-print(f"Imitation DQN model saved to {DQN_MODEL_FILE}")
\ No newline at end of file
+def load_player_pairs(path=PLAYER_ACTION_LOG):
+    """(states, actions, rewards, next_states, dones) of the player log: every row whose action
+    names a boss skill, with the following row's state as next_state and reward 1 (imitation)."""
+    if is_experience_log(path):
+        log = ExperienceLog(path)
+        states = np.asarray(log["state"])
+        code_to_action = np.array([-1 if parse_action(word) is None else parse_action(word) for word in log.meta["vocab"]["action"]] or [-1])
+        actions = code_to_action[np.asarray(log["action"])]
+    else:
+        rows = []
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    action_idx = parse_action(entry['action'])
+                    rows.append((json.loads(entry['state']), -1 if action_idx is None else action_idx))
+        states = np.array([GameState.from_dict(state).vec for state, _ in rows], dtype=np.float32).reshape(len(rows), STATE_SIZE)
+        actions = np.array([a for _, a in rows], dtype=np.int64)
+    keep = np.flatnonzero(actions[:-1] >= 0) # the last row has no next_state
+    return (states[keep], actions[keep].astype(np.int64), np.ones(len(keep)), states[keep + 1],
+            np.zeros(len(keep), dtype=bool))
+
+def evaluate(agent, mode, data, idx):
+    """(loss, accuracy) on the rows idx; accuracy is the argmax-Q agreement with the logged action."""
+    states, actions, rewards, next_states, dones = data
+    total_loss, correct = 0.0, 0
+    with torch.no_grad():
+        for start in range(0, len(idx), EVAL_CHUNK):
+            chunk = idx[start:start + EVAL_CHUNK]
+            logits = agent.policy_net(torch.as_tensor(states[chunk], dtype=torch.float32, device=agent.device))
+            labels = torch.as_tensor(actions[chunk], dtype=torch.int64, device=agent.device)
+            if mode == "bc":
+                loss = F.cross_entropy(logits, labels).item()
+            else:
+                loss = agent.td_loss(states[chunk], actions[chunk], rewards[chunk], next_states[chunk], dones[chunk])
+            total_loss += loss * len(chunk)
+            correct += int((logits.argmax(1) == labels).sum())
+    return total_loss / len(idx), correct / len(idx)
+
+def train(agent, data, mode="td", epochs=20, batch_size=256, val_fraction=0.1, patience=3, seed=0):
+    """Mini-batch epochs over data; restores the weights of the best validation epoch. Returns the history."""
+    states, actions, rewards, next_states, dones = data
+    rng = np.random.default_rng(seed)
+    n = len(actions)
+    perm = rng.permutation(n)
+    n_val = min(n - 1, max(1, int(n * val_fraction))) if val_fraction > 0 and n > 1 else 0
+    val_idx, train_idx = np.sort(perm[:n_val]), perm[n_val:]
+    batch_size = min(batch_size, len(train_idx))
+    print(f"{n} samples: {len(train_idx)} train, {n_val} validation. Mode {mode}, batch {batch_size}, {epochs} epochs.")
+    history = []
+    best_loss, best_state, bad_epochs = float("inf"), None, 0
+    for epoch in range(1, epochs + 1):
+        order = rng.permutation(train_idx)
+        num_batches = len(order) // batch_size # fixed-size batches, the remainder is reshuffled next epoch
+        start = time.perf_counter()
+        train_loss = 0.0
+        for b in range(num_batches):
+            batch = order[b * batch_size:(b + 1) * batch_size]
+            if mode == "bc":
+                train_loss += agent.train_bc_on_batch(states[batch], actions[batch])
+            else:
+                train_loss += agent.train_on_batch(states[batch], actions[batch], rewards[batch], next_states[batch], dones[batch])
+        elapsed = time.perf_counter() - start
+        samples_per_sec = num_batches * batch_size / elapsed if elapsed > 0 else 0.0
+        stats = {"epoch": epoch, "train_loss": train_loss / max(1, num_batches), "samples_per_sec": samples_per_sec}
+        log_str = f"Epoch {epoch}/{epochs}. Train loss: {stats['train_loss']:.4f}."
+        if n_val:
+            stats["val_loss"], stats["val_accuracy"] = evaluate(agent, mode, data, val_idx)
+            log_str += f" Val loss: {stats['val_loss']:.4f}. Val action match: {stats['val_accuracy'] * 100:.1f}%."
+        print(log_str + f" Speed: {samples_per_sec:.0f} samples/s")
+        history.append(stats)
+        if not n_val:
+            continue
+        if stats["val_loss"] < best_loss:
+            best_loss, best_state, bad_epochs = stats["val_loss"], copy.deepcopy(agent.policy_net.state_dict()), 0
+        else:
+            bad_epochs += 1
+            if bad_epochs >= patience:
+                print(f"Early stopping: no validation improvement for {patience} epochs.")
+                break
+    if best_state is not None:
+        agent.policy_net.load_state_dict(best_state)
+        if agent.target_net is not None:
+            agent.target_net.load_state_dict(best_state)
+        print(f"Restored the weights of the best validation loss ({best_loss:.4f}).")
+    return history
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline mini-batch training of the boss DQN from game logs.")
+    parser.add_argument("--source", choices=["boss", "episodes", "player"], default="boss",
+                        help="boss: the boss's own logged transitions; episodes: boss transitions re-simulated "
+                             "from episode records; player: imitate player_actions rows naming a boss skill (reward 1)")
+    parser.add_argument("--log", help="JSONL log, experience_log.py directory or episode records (default: the source's Model/ log)")
+    parser.add_argument("--mode", choices=["td", "bc"], default="td")
+    parser.add_argument("--epochs", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--lr", type=float, default=1e-3)
+    parser.add_argument("--val-fraction", type=float, default=0.1)
+    parser.add_argument("--patience", type=int, default=3, help="Epochs without validation improvement before stopping")
+    parser.add_argument("--target-update-every", type=int, default=0, help="Hard target network sync every N steps (0 = none, td only)")
+    parser.add_argument("--init-model", help="Start from these weights instead of a fresh network")
+    parser.add_argument("--out", default=DQN_MODEL_FILE)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.source == "player":
+        data = load_player_pairs(args.log or PLAYER_ACTION_LOG)
+    elif args.source == "boss":
+        data = load_boss_action_log(args.log or BOSS_ACTION_LOG)
+    else:
+        data = boss_transitions(read_records(args.log or EPISODE_LOG))
+    print(f"Loaded {len(data[1])} samples in {time.perf_counter() - start:.2f}s")
+    if len(data[1]) == 0 and args.source == "player":
+        # The game only logs select_*/place_* moves there, which carry no boss action
+        parser.error(f"no row of {args.log or PLAYER_ACTION_LOG} names a boss skill (player logs hold "
+                     "select_*/place_* moves); use --source boss or --source episodes")
+    if len(data[1]) == 0:
+        print("Nothing to train on.")
+        return
+
+    torch.manual_seed(args.seed)
+    agent = DQNAgent(model_file=args.out, lr=args.lr, batch_size=args.batch_size, epsilon=0.0, seed=args.seed,
+                     target_update="hard" if args.target_update_every > 0 else None,
+                     target_update_every=max(1, args.target_update_every))
+    if args.init_model:
+        agent.load(args.init_model)
+    train(agent, data, mode=args.mode, epochs=args.epochs, batch_size=args.batch_size,
+          val_fraction=args.val_fraction, patience=args.patience, seed=args.seed)
+    agent.save(args.out)
+    print(f"Imitation DQN model saved to {args.out}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# log_cursor.py
+# Read position in an append-only JSONL log, persisted next to it (<log>.cursor), so
+# periodic consumers (the imitation updates at game over) only stream rows appended
+# since their last pass. Parsing is a generator pipeline, nothing is read whole.
+import json
+import os
+
+CURSOR_SUFFIX = ".cursor"
+
+
+class LogCursor:
+    """Byte offset of the first unconsumed line of log_path.
+
+    lines() yields (start, end, line) for every complete line after the offset;
+    nothing moves until commit(offset), so a consumer that fails halfway re-reads
+    the same rows next time. A log that shrank or was replaced (different inode)
+    is read again from the start.
+    """
+    def __init__(self, log_path, cursor_path=None):
+        self.log_path = log_path
+        self.cursor_path = cursor_path or log_path + CURSOR_SUFFIX
+        self.offset = 0
+        self._inode = None
+        try:
+            with open(self.cursor_path) as f:
+                saved = json.load(f)
+            self.offset, self._inode = int(saved["offset"]), saved.get("inode")
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def lines(self):
+        try:
+            f = open(self.log_path, "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            st = os.fstat(f.fileno())
+            if st.st_size < self.offset or (self._inode is not None and self._inode != st.st_ino):
+                self.offset = 0 # truncated or rotated
+            self._inode = st.st_ino
+            f.seek(self.offset)
+            start = self.offset
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break # still being written, picked up next time
+                end = start + len(line)
+                yield start, end, line
+                start = end
+
+    def commit(self, offset):
+        self.offset = offset
+        tmp_path = self.cursor_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"offset": offset, "inode": self._inode}, f)
+        os.replace(tmp_path, self.cursor_path)
+
+
+def parse_jsonl(lines):
+    """(start, end, entry) for every (start, end, line) that holds a JSON object; skips blank/corrupt lines."""
+    for start, end, line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield start, end, json.loads(line)
+        except ValueError:
+            print(f"[LogCursor] Skipping malformed log line at byte {start}")
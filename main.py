@@ -15,16 +15,56 @@ from PyQt5.QtGui import QFont, QMovie, QPalette, QBrush, QPixmap
 
 from units import PLAYER_UNIT_SPECS
 from game_logic import GameLogic
-from agent_dqn import DQNAgent
-from agent_dqn import get_game_state_for_dqn
+from game_state import state_to_dict, get_game_state_for_dqn
+from episode_runner import random_player_policy
+from async_logger import AsyncLineLogger
+from log_cursor import LogCursor, parse_jsonl
+from experience_log import BOSS_ACTIONS
+from episode_record import EPISODE_LOG, episode_record, record_line
 
 AGENT_MODEL_FILE = "Model/dqn_agent.pt"
+POLICY_TABLE_FILE = "Model/dqn_policy.tbl" # built by compile_policy.py
 PLAYER_ACTION_LOG = "Model/player_actions.csv"
 BOSS_ACTION_LOG = "Model/boss_actions.csv"
 GAME_TRANSITION_LOG = "Model/game_transitions.csv"
+GAME_OVER_FLUSH_TIMEOUT = 0.05 # seconds handle_game_over waits for the log writer
+
+# Log lines are built on the logger thread; callers only capture the values and the timestamp
+def player_action_line(state_dict, action_name, round_num, timestamp):
+    return json.dumps({
+        'state': json.dumps(state_to_dict(state_dict)),
+        'action': action_name,
+        'round': round_num,
+        'timestamp': timestamp
+    })
+
+def boss_action_line(state, action, next_state, reward, done, round_num, timestamp):
+    return json.dumps({
+        'state': json.dumps(state_to_dict(state)),
+        'action': action,
+        'next_state': json.dumps(state_to_dict(next_state)),
+        'reward': reward,
+        'done': done,
+        'round': round_num,
+        'timestamp': timestamp
+    })
+
+def game_transition_line(state_before_player, player_action, state_after_player, boss_action, state_after_boss, reward_boss, reward_player, done, round_num, timestamp):
+    return json.dumps({
+        'state_before_player': json.dumps(state_to_dict(state_before_player)),
+        'player_action': player_action,
+        'state_after_player': json.dumps(state_to_dict(state_after_player)),
+        'boss_action': boss_action,
+        'state_after_boss': json.dumps(state_to_dict(state_after_boss)),
+        'reward_boss': reward_boss,
+        'reward_player': reward_player,
+        'done': done,
+        'round': round_num,
+        'timestamp': timestamp
+    })
 
 class TacticsGridWindow(QMainWindow):
-    def __init__(self, agent_to_use=None):
+    def __init__(self, agent_to_use=None, experience_store=None):
         super().__init__()
         self.setWindowTitle("Tactics Grid – Boss Assault (DQN RL)") # Updated window title
         self.setGeometry(100, 100, 900, 850)
@@ -34,6 +74,8 @@ class TacticsGridWindow(QMainWindow):
         
         # Pass the agent instance to GameLogic
         self.game = GameLogic(agent_instance=agent_to_use)
+        self.action_logger = AsyncLineLogger() # player/boss/transition logs, closed at exit
+        self.experience_store = experience_store # optional SQLite copy of the boss transitions (--experience-db)
         
         # Ensure the agent has a reference to boss skills if needed (e.g., for exploration strategy)
         if agent_to_use and hasattr(self.game.boss, 'skills') and hasattr(agent_to_use, 'boss_skills_ref') and not agent_to_use.boss_skills_ref:
@@ -227,46 +269,20 @@ class TacticsGridWindow(QMainWindow):
                 button.setStyleSheet("QPushButton { background-color:#555; border:1px solid #777; padding:5px; color:white;} QPushButton:hover { background-color:#666; } QPushButton:disabled { background-color:#444; color:#888; }")
 
     def log_player_action(self, state_dict, action_name, round_num):
-        # Ghi lại hành động người chơi vào file CSV
-        with open(PLAYER_ACTION_LOG, 'a') as f:
-            log_entry = {
-                'state': json.dumps(state_dict),
-                'action': action_name,
-                'round': round_num,
-                'timestamp': datetime.datetime.now().isoformat()
-            }
-            f.write(json.dumps(log_entry) + '\n')
+        # Ghi lại hành động người chơi vào file CSV (ghi ở luồng nền, không chặn UI)
+        self.action_logger.log(PLAYER_ACTION_LOG, player_action_line, state_dict, action_name, round_num,
+                               datetime.datetime.now().isoformat())
 
     def log_boss_action(self, state, action, next_state, reward, done, round_num):
-        import json, datetime
-        with open(BOSS_ACTION_LOG, 'a') as f:
-            log_entry = {
-                'state': json.dumps(state),
-                'action': action,
-                'next_state': json.dumps(next_state),
-                'reward': reward,
-                'done': done,
-                'round': round_num,
-                'timestamp': datetime.datetime.now().isoformat()
-            }
-            f.write(json.dumps(log_entry) + '\n')
+        if self.experience_store is not None and action in BOSS_ACTIONS:
+            self.experience_store.record(state, BOSS_ACTIONS.index(action), reward, next_state, done) # written at game over
+        self.action_logger.log(BOSS_ACTION_LOG, boss_action_line, state, action, next_state, reward, done, round_num,
+                               datetime.datetime.now().isoformat())
 
     def log_game_transition(self, state_before_player, player_action, state_after_player, boss_action, state_after_boss, reward_boss, reward_player, done, round_num):
-        import json, datetime
-        with open(GAME_TRANSITION_LOG, 'a') as f:
-            log_entry = {
-                'state_before_player': json.dumps(state_before_player),
-                'player_action': player_action,
-                'state_after_player': json.dumps(state_after_player),
-                'boss_action': boss_action,
-                'state_after_boss': json.dumps(state_after_boss),
-                'reward_boss': reward_boss,
-                'reward_player': reward_player,
-                'done': done,
-                'round': round_num,
-                'timestamp': datetime.datetime.now().isoformat()
-            }
-            f.write(json.dumps(log_entry) + '\n')
+        self.action_logger.log(GAME_TRANSITION_LOG, game_transition_line, state_before_player, player_action, state_after_player,
+                               boss_action, state_after_boss, reward_boss, reward_player, done, round_num,
+                               datetime.datetime.now().isoformat())
 
     def on_stock_unit_selected(self,unit_name):
         if self.is_fast_mode_training and self.game.game_phase=="PLACEMENT":
@@ -601,6 +617,8 @@ class TacticsGridWindow(QMainWindow):
             action_idx = results[7]
             if action_idx is not None and state_acted_on is not None:
                 self.game.boss.agent.learn(state_acted_on, action_idx, reward, next_state, done)
+                if hasattr(self.game.boss.agent, 'decay_epsilon'):
+                    self.game.boss.agent.decay_epsilon()
                 action_name = None
                 ACTION_MAP_AGENT = {0: "normal_attack", 1: "horizontal_shot", 2: "vertical_shot", 3: "heal", 4: "ultimate"}
                 if action_idx in ACTION_MAP_AGENT:
@@ -659,37 +677,7 @@ class TacticsGridWindow(QMainWindow):
         self.is_fast_mode_training = True
         self.game.game_phase = "PLACEMENT" # Ensure game state is correct for internal logic
         
-        num_to_place = self.game.get_max_units_to_place_this_round()
-        placed_count = 0
-        
-        # Filter available unit types (those with stock) and shuffle them
-        available_types = [utype for utype, count in self.game.player_current_accumulation.items() if count > 0]
-        random.shuffle(available_types)
-
-        for _ in range(num_to_place):
-            if not self.game.can_place_more_units_this_round() or not available_types:
-                break # Stop if placement limit reached or no units left to place
-            
-            unit_type = random.choice(available_types) # Choose a random available unit type
-
-            if self.game.player_current_accumulation[unit_type] > 0:
-                empty_cells = [(r,c) for r in range(self.game.grid_size) for c in range(self.game.grid_size) if self.game.grid_units[r][c] is None]
-                if empty_cells:
-                    r_place,c_place = random.choice(empty_cells)
-                    success,_ = self.game.place_unit_from_stock(unit_type,r_place,c_place)
-                    if success:
-                        placed_count+=1
-                        # If a unit type's stock becomes 0, remove it from available_types list
-                        if self.game.player_current_accumulation[unit_type]==0:
-                            if unit_type in available_types:
-                                available_types.remove(unit_type)
-            
-            # If no available types are left but we still need to place units,
-            # refresh available_types from current stock.
-            if not available_types and placed_count < num_to_place:
-                available_types = [utype for utype,count in self.game.player_current_accumulation.items() if count>0]
-                if not available_types: break # If still no units, break
-                else: random.shuffle(available_types) # Shuffle for next attempts
+        random_player_policy(self.game)
 
         results_pa = self.game.end_placement_phase() # Process player attack phase
         self.is_fast_mode_training = False # Exit fast mode (though immediately re-entered for boss turn)
@@ -722,6 +710,8 @@ class TacticsGridWindow(QMainWindow):
             action_idx = results[7]
             if action_idx is not None and state_acted_on is not None:
                 self.game.boss.agent.learn(state_acted_on, action_idx, reward, next_state, done)
+                if hasattr(self.game.boss.agent, 'decay_epsilon'):
+                    self.game.boss.agent.decay_epsilon()
                 # Log action của boss
                 action_name = None
                 ACTION_MAP_AGENT = {0: "normal_attack", 1: "horizontal_shot", 2: "vertical_shot", 3: "heal", 4: "ultimate"}
@@ -783,18 +773,10 @@ class TacticsGridWindow(QMainWindow):
         # KHÔNG gọi boss đánh trước ở mỗi round mới nữa
 
     def imitation_update_from_player_actions(self):
-        # Boss agent học từ file player_actions.csv
+        # Boss agent học từ file player_actions.csv (chỉ các dòng mới từ lần trước)
         if not hasattr(self.game.boss, 'agent') or not hasattr(self.game.boss.agent, 'learn'):
             return
         try:
-            with open(PLAYER_ACTION_LOG, 'r') as f:
-                lines = f.readlines()
-            player_data = []
-            for line in lines:
-                entry = json.loads(line)
-                state = json.loads(entry['state'])
-                action = entry['action']
-                player_data.append((state, action))
             # Map action string về action index
             ACTION_MAP_AGENT = {
                 0: "normal_attack", 1: "horizontal_shot", 2: "vertical_shot", 3: "heal", 4: "ultimate"
@@ -804,47 +786,62 @@ class TacticsGridWindow(QMainWindow):
                     if action_str.startswith(name):
                         return idx
                 return None
+            cursor = LogCursor(PLAYER_ACTION_LOG)
             learn_count = 0
-            for i in range(len(player_data)-1):
-                state, action = player_data[i]
-                next_state, _ = player_data[i+1]
-                action_idx = parse_action(action)
-                if action_idx is not None:
-                    self.game.boss.agent.learn(state, action_idx, reward=1, next_state_dict=next_state, done=False)
-                    learn_count += 1
-            msg = f"[Imitation] Agent updated from {learn_count} player actions in file {PLAYER_ACTION_LOG}"
+            previous = None # (state, action, start offset) of the row waiting for its next_state
+            for start, _end, entry in parse_jsonl(cursor.lines()):
+                state = json.loads(entry['state'])
+                if previous is not None:
+                    prev_state, prev_action, _ = previous
+                    action_idx = parse_action(prev_action)
+                    if action_idx is not None:
+                        self.game.boss.agent.learn(prev_state, action_idx, reward=1, next_state_dict=state, done=False)
+                        learn_count += 1
+                previous = (state, entry['action'], start)
+            if previous is not None:
+                cursor.commit(previous[2]) # the last row pairs with the first row of the next pass
+            msg = f"[Imitation] Agent updated from {learn_count} new player actions in file {PLAYER_ACTION_LOG}"
             print(msg)
             self.log_message(msg)
         except Exception as e:
             print(f"[Imitation] Error updating from player actions: {e}")
+        finally:
+            self.end_agent_episode()
 
     def imitation_update_from_boss_actions(self):
-        # Boss agent học lại từ log hành động của chính mình (boss_actions.csv)
+        # Boss agent học lại từ log hành động của chính mình (boss_actions.csv), chỉ các dòng mới
         if not hasattr(self.game.boss, 'agent') or not hasattr(self.game.boss.agent, 'learn'):
             return
         try:
-            with open(BOSS_ACTION_LOG, 'r') as f:
-                lines = f.readlines()
+            # Map action_name về action_idx
+            ACTION_MAP_AGENT = {0: "normal_attack", 1: "horizontal_shot", 2: "vertical_shot", 3: "heal", 4: "ultimate"}
+            ACTION_STR_TO_IDX = {v: k for k, v in ACTION_MAP_AGENT.items()}
+            cursor = LogCursor(BOSS_ACTION_LOG)
             learn_count = 0
-            for line in lines:
-                entry = json.loads(line)
+            consumed = None
+            for _start, end, entry in parse_jsonl(cursor.lines()):
                 state = json.loads(entry['state'])
-                action_name = entry['action']
                 next_state = json.loads(entry['next_state'])
-                reward = entry['reward']
-                done = entry['done']
-                # Map action_name về action_idx
-                ACTION_MAP_AGENT = {0: "normal_attack", 1: "horizontal_shot", 2: "vertical_shot", 3: "heal", 4: "ultimate"}
-                ACTION_STR_TO_IDX = {v: k for k, v in ACTION_MAP_AGENT.items()}
-                action_idx = ACTION_STR_TO_IDX.get(action_name, None)
+                action_idx = ACTION_STR_TO_IDX.get(entry['action'], None)
                 if action_idx is not None:
-                    self.game.boss.agent.learn(state, action_idx, reward, next_state, done)
+                    self.game.boss.agent.learn(state, action_idx, entry['reward'], next_state, entry['done'])
                     learn_count += 1
-            msg = f"[Imitation] Agent updated from {learn_count} boss actions in file {BOSS_ACTION_LOG}"
+                consumed = end
+            if consumed is not None:
+                cursor.commit(consumed)
+            msg = f"[Imitation] Agent updated from {learn_count} new boss actions in file {BOSS_ACTION_LOG}"
             print(msg)
             self.log_message(msg)
         except Exception as e:
             print(f"[Imitation] Error updating from boss actions: {e}")
+        finally:
+            self.end_agent_episode()
+
+    def end_agent_episode(self):
+        # Closes the agent's pending n-step returns after a game and after every imitation pass,
+        # so game and imitation rows never share a return and nothing carries into the next game
+        if hasattr(self.game.boss.agent, 'end_episode'):
+            self.game.boss.agent.end_episode()
 
     def handle_game_over(self, message):
         if not self.is_fast_mode_training : # Only show QMessageBox if not in fast training
@@ -853,6 +850,15 @@ class TacticsGridWindow(QMainWindow):
         self.set_controls_for_phase("GAME_OVER") # Disable controls
         self.reset_all_round_animations()
         self.update_all_ui_displays()
+        self.end_agent_episode()
+        # Seed + placements + boss actions: enough to re-simulate the whole game (episode_record.py)
+        self.action_logger.log(EPISODE_LOG, record_line, episode_record(self.game, timestamp=datetime.datetime.now().isoformat()))
+        # The imitation updates read the logs back. Give the writer thread a moment to catch
+        # up, but never stall the UI on disk I/O: rows still queued stay past the log cursors
+        # (a half-written line included) and are learned at the next game over instead
+        self.action_logger.flush(timeout=GAME_OVER_FLUSH_TIMEOUT)
+        if self.experience_store is not None:
+            self.experience_store.end_episode() # one transaction per game
         # Boss học từ player_actions mỗi khi kết thúc ván
         self.imitation_update_from_player_actions()
         # Boss học từ boss_actions mỗi khi kết thúc ván
@@ -869,13 +875,26 @@ class TacticsGridWindow(QMainWindow):
 
 def main():
     app = QApplication(sys.argv)
-    dqn_agent = DQNAgent(model_file=AGENT_MODEL_FILE)
-    if os.path.exists(AGENT_MODEL_FILE):
-        dqn_agent.load()
-    window = TacticsGridWindow(agent_to_use=dqn_agent)
+    if "--policy-table" in sys.argv:
+        # Frozen boss from the compiled table: no torch, no online learning
+        from policy_table_agent import PolicyTableAgent
+        dqn_agent = PolicyTableAgent(POLICY_TABLE_FILE)
+    else:
+        from agent_dqn import DQNAgent
+        dqn_agent = DQNAgent(model_file=AGENT_MODEL_FILE, inference="numpy") # lowest per-decision latency for interactive play
+        if os.path.exists(AGENT_MODEL_FILE):
+            dqn_agent.load()
+    experience_store = None
+    if "--experience-db" in sys.argv:
+        from experience_store import ExperienceStore, EXPERIENCE_DB_FILE
+        experience_store = ExperienceStore(EXPERIENCE_DB_FILE)
+    window = TacticsGridWindow(agent_to_use=dqn_agent, experience_store=experience_store)
     window.show()
     window.start_new_game_ui()
-    sys.exit(app.exec_())
+    exit_code = app.exec_()
+    if experience_store is not None:
+        experience_store.close() # the unfinished game's transitions
+    sys.exit(exit_code)
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,71 @@
+# policy_table_agent.py
+# Frozen boss agent serving decisions from a table compiled by compile_policy.py.
+# Imports no torch: a lookup in a memory-mapped uint8 array per decision.
+import numpy as np
+from array_file import read_arrays
+from state_space import StateSpace
+from game_state import GameState
+from game_constants import ACTION_KEYS
+from targeting import skill_params_for_board, board_types, select_targets
+
+DEFAULT_POLICY_FILE = "Model/dqn_policy.tbl"
+
+
+class PolicyTableAgent:
+    """Boss agent for play against a frozen policy (no learn/save: the game skips online updates).
+
+    choose_action / choose_actions_batch match DQNAgent's. States outside the
+    compiled space (should not happen with the standard rules) fall back to a
+    uniformly random available action and are counted in self.misses.
+    """
+    def __init__(self, policy_file=DEFAULT_POLICY_FILE, seed=None):
+        arrays, meta = read_arrays(policy_file)
+        self.space = StateSpace.from_description(meta["state_space"])
+        self.policy = arrays["policy"]
+        self.q_table = arrays.get("q") # only if compiled with --with-q
+        self.meta = meta
+        self.rng = np.random.default_rng(seed)
+        self.epsilon = 0.0
+        self.misses = 0
+
+    def _state_vec(self, state):
+        if isinstance(state, GameState):
+            return state.vec
+        if isinstance(state, np.ndarray):
+            return state
+        return GameState.from_dict(state).vec
+
+    def choose_action(self, state_dict, available_skill_keys, grid_units_for_targeting, rng=None):
+        # Misses draw from self.rng, targets from rng when given (the game's targeting stream)
+        mask = np.array([key in available_skill_keys for key in ACTION_KEYS])
+        if not mask.any():
+            return None, [], None
+        idx = self.space.index(self._state_vec(state_dict))
+        action_idx = int(self.policy[idx]) if idx >= 0 else -1
+        if action_idx < 0 or not mask[action_idx]:
+            self.misses += 1
+            action_idx = int(self.rng.choice(np.flatnonzero(mask)))
+        chosen_skill_key = ACTION_KEYS[action_idx]
+        return chosen_skill_key, skill_params_for_board(chosen_skill_key, grid_units_for_targeting,
+                                                          self.rng if rng is None else rng), action_idx
+
+    def choose_actions_batch(self, states, available, boards=None):
+        if not isinstance(states, np.ndarray):
+            states = np.stack([self._state_vec(state) for state in states])
+        if not isinstance(available, np.ndarray):
+            available = np.array([[key in keys for key in ACTION_KEYS] for keys in available], dtype=bool)
+        idx = self.space.index_batch(states)
+        action_idx = np.where(idx >= 0, self.policy[np.maximum(idx, 0)], -1).astype(np.int64)
+        valid = action_idx >= 0
+        valid[valid] = available[valid, action_idx[valid]]
+        missed = ~valid & available.any(axis=1)
+        if missed.any():
+            self.misses += int(missed.sum())
+            random_keys = np.where(available[missed], self.rng.random(available[missed].shape), -1.0)
+            action_idx[missed] = random_keys.argmax(axis=1)
+        action_idx[~available.any(axis=1)] = -1
+        if boards is None:
+            return action_idx, None
+        if not isinstance(boards, np.ndarray):
+            boards = np.stack([board_types(board) for board in boards])
+        return action_idx, select_targets(boards, self.space.grid_size, action_idx, self.rng)
@@ -0,0 +1,198 @@
+# replay_buffer.py
+# Replay memory backed by preallocated NumPy arrays (ring buffer).
+from collections import deque
+import numpy as np
+
+
+class ReplayBuffer:
+    """Fixed-capacity ring buffer of (state, action, reward, next_state, done, discount).
+
+    Inserts are O(1) (the oldest transition is overwritten once full) and
+    sampling draws a batch of indices in one vectorized call. States are kept
+    in state_dtype (the game features are small non-negative ints, so uint8)
+    and only converted to float32 for the sampled batch. discount is the factor
+    applied to max Q(next_state) in the target: gamma ** n, or 0 at done.
+    """
+    def __init__(self, capacity, state_size, state_dtype=np.uint8, rng=None):
+        self.capacity = int(capacity)
+        self.state_size = state_size
+        self.rng = rng if rng is not None else np.random.default_rng()
+        self.states = np.zeros((self.capacity, state_size), dtype=state_dtype)
+        self.next_states = np.zeros((self.capacity, state_size), dtype=state_dtype)
+        self.actions = np.zeros(self.capacity, dtype=np.uint8)
+        self.rewards = np.zeros(self.capacity, dtype=np.float32)
+        self.dones = np.zeros(self.capacity, dtype=np.bool_)
+        self.discounts = np.zeros(self.capacity, dtype=np.float32)
+        self.pos = 0 # next slot to write
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state, done, discount):
+        i = self.pos
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state
+        self.dones[i] = done
+        self.discounts[i] = discount
+        self.pos = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+        return i
+
+    def add_batch(self, states, actions, rewards, next_states, dones, discounts):
+        n = len(actions)
+        if n > self.capacity: # only the newest capacity rows survive anyway
+            states, actions, rewards, next_states, dones, discounts = (
+                x[-self.capacity:] for x in (states, actions, rewards, next_states, dones, discounts))
+            n = self.capacity
+        idx = (self.pos + np.arange(n)) % self.capacity
+        self.states[idx] = states
+        self.actions[idx] = actions
+        self.rewards[idx] = rewards
+        self.next_states[idx] = next_states
+        self.dones[idx] = dones
+        self.discounts[idx] = discounts
+        self.pos = int((self.pos + n) % self.capacity)
+        self.size = min(self.size + n, self.capacity)
+        return idx
+
+    def sample_indices(self, batch_size):
+        return self.rng.integers(0, self.size, size=batch_size)
+
+    def get(self, idx):
+        """Batch at idx as (states, actions, rewards, next_states, dones, discounts) ready for torch."""
+        return (self.states[idx].astype(np.float32),
+                self.actions[idx].astype(np.int64),
+                self.rewards[idx],
+                self.next_states[idx].astype(np.float32),
+                self.dones[idx].astype(np.float32),
+                self.discounts[idx])
+
+    def sample(self, batch_size):
+        return self.get(self.sample_indices(batch_size))
+
+
+class NStepAccumulator:
+    """Folds 1-step transitions into n-step ones at insert time.
+
+    push() returns the n-step transitions that became complete, as tuples
+    (state, action, discounted_return, bootstrap_state, done, discount).
+    The return stops at done (discount 0). flush() closes an episode that
+    ended without done (e.g. round limit): the pending transitions bootstrap
+    from the last next_state with gamma ** steps_taken.
+    """
+    def __init__(self, n_step, gamma):
+        self.n_step = n_step
+        self.gamma = gamma
+        self.pending = deque()
+
+    def push(self, state, action, reward, next_state, done):
+        self.pending.append((state, action, reward, next_state, done))
+        if done:
+            return self.flush()
+        if len(self.pending) == self.n_step:
+            return [self._pop_oldest()]
+        return []
+
+    def flush(self):
+        out = []
+        while self.pending:
+            out.append(self._pop_oldest())
+        return out
+
+    def _pop_oldest(self):
+        ret, k = 0.0, 0
+        for (_s, _a, reward, _ns, _d) in self.pending:
+            ret += (self.gamma ** k) * reward
+            k += 1
+        _s, _a, _r, last_next_state, last_done = self.pending[-1]
+        state, action = self.pending[0][0], self.pending[0][1]
+        self.pending.popleft()
+        discount = 0.0 if last_done else self.gamma ** k
+        return state, action, ret, last_next_state, last_done, discount
+
+
+class SumTree:
+    """Binary sum-tree over capacity leaves stored in one flat array.
+
+    Node i has children 2i and 2i+1, the root is node 1 and holds the total.
+    update() and find() walk one level per step for a whole batch at once,
+    so both are O(log n) per element.
+    """
+    def __init__(self, capacity):
+        self.capacity = int(capacity)
+        self.leaf_offset = 1 << max(0, (self.capacity - 1).bit_length())
+        self.depth = self.leaf_offset.bit_length() - 1
+        self.tree = np.zeros(2 * self.leaf_offset, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def leaves(self, idx):
+        return self.tree[np.asarray(idx) + self.leaf_offset]
+
+    def update(self, idx, values):
+        nodes = np.asarray(idx) + self.leaf_offset
+        self.tree[nodes] = values
+        for _ in range(self.depth):
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2 * nodes] + self.tree[2 * nodes + 1]
+
+    def find(self, values):
+        """Leaf index for each prefix-sum value in [0, total)."""
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = 2 * nodes
+            left_sum = self.tree[left]
+            go_right = values >= left_sum
+            values = np.where(go_right, values - left_sum, values)
+            nodes = np.where(go_right, left + 1, left)
+        return nodes - self.leaf_offset
+
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """Proportional prioritized replay (Schaul et al.) on top of ReplayBuffer.
+
+    New transitions get the current max priority; update_priorities() sets
+    p = (|td_error| + eps) ** alpha. importance_weights() returns
+    (N * P(i)) ** -beta normalized by the batch max, with beta annealed to 1.
+    """
+    def __init__(self, capacity, state_size, state_dtype=np.uint8, rng=None, alpha=0.6, beta=0.4, beta_increment=1e-5, eps=1e-3):
+        super().__init__(capacity, state_size, state_dtype=state_dtype, rng=rng)
+        self.alpha = alpha
+        self.beta = beta
+        self.beta_increment = beta_increment
+        self.eps = eps
+        self.max_priority = 1.0
+        self.tree = SumTree(self.capacity)
+
+    def add(self, state, action, reward, next_state, done, discount):
+        i = super().add(state, action, reward, next_state, done, discount)
+        self.tree.update([i], self.max_priority ** self.alpha)
+        return i
+
+    def add_batch(self, states, actions, rewards, next_states, dones, discounts):
+        idx = super().add_batch(states, actions, rewards, next_states, dones, discounts)
+        self.tree.update(idx, self.max_priority ** self.alpha)
+        return idx
+
+    def sample_indices(self, batch_size):
+        # Stratified: one uniform draw inside each of batch_size equal slices of the total
+        total = self.tree.total()
+        bounds = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+        idx = self.tree.find(np.minimum(bounds, np.nextafter(total, 0)))
+        return np.minimum(idx, self.size - 1)
+
+    def importance_weights(self, idx):
+        probs = self.tree.leaves(idx) / self.tree.total()
+        weights = (self.size * np.maximum(probs, 1e-12)) ** (-self.beta)
+        self.beta = min(1.0, self.beta + self.beta_increment)
+        return (weights / weights.max()).astype(np.float32)
+
+    def update_priorities(self, idx, td_errors):
+        priorities = np.abs(td_errors) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(idx, priorities ** self.alpha)
@@ -0,0 +1,118 @@
+# rollout_workers.py
+# Actor/learner support: worker processes play episodes with a recent copy of the
+# DQNNet weights and stream the boss transitions back to the learner process.
+import multiprocessing as mp
+import queue
+import random
+import numpy as np
+import torch
+from agent_dqn import DQNAgent
+from episode_runner import EpisodeRunner
+from episode_record import episode_record
+
+
+def _rollout_worker(worker_id, seed, shared_weights, weights_version, shared_epsilon, transition_queue, stop_event):
+    torch.set_num_threads(1) # One core per worker, the learner owns the rest
+    torch.manual_seed(seed)
+    agent = DQNAgent(device="cpu", seed=seed)
+    runner = EpisodeRunner(agent=agent, seed=seed)
+    weight_params = list(agent.policy_net.parameters())
+    local_version = -1
+
+    while not stop_event.is_set():
+        if weights_version.value != local_version:
+            with shared_weights.get_lock():
+                flat = torch.from_numpy(np.frombuffer(shared_weights.get_obj(), dtype=np.float32).copy())
+                local_version = weights_version.value
+            torch.nn.utils.vector_to_parameters(flat, weight_params)
+            agent.weights_version += 1
+        agent.epsilon = shared_epsilon.value
+
+        transitions = []
+        def collect(state_dict, action_idx, reward, next_state_dict, done):
+            transitions.append((agent._state_to_vec(state_dict), action_idx, reward, agent._state_to_vec(next_state_dict), done))
+        episode_reward, boss_won = runner.run_episode(on_boss_transition=collect)
+
+        if transitions:
+            states, actions, rewards, next_states, dones = zip(*transitions)
+            batch = (np.stack(states), np.array(actions, dtype=np.int64), np.array(rewards, dtype=np.float32),
+                     np.stack(next_states), np.array(dones, dtype=bool))
+        else:
+            batch = None
+        while not stop_event.is_set():
+            try:
+                transition_queue.put((worker_id, batch, episode_reward, boss_won, episode_record(runner.game)), timeout=0.5)
+                break
+            except queue.Full:
+                continue
+    transition_queue.cancel_join_thread() # Don't block exit on undelivered episodes
+
+
+class RolloutWorkerPool:
+    """Pool of rollout processes feeding one learner.
+
+    The learner calls publish_weights(agent) to push new policy weights, and
+    get_episode() to receive (transitions, episode_reward, boss_won, record) where
+    transitions is (states, actions, rewards, next_states, dones) arrays or None
+    and record the episode_record.py record of the episode.
+    """
+    def __init__(self, agent, num_workers, queue_size=None, seed=None):
+        self.num_workers = num_workers
+        self._ctx = mp.get_context("spawn") # Safe with torch on every platform
+        num_params = sum(p.numel() for p in agent.policy_net.parameters())
+        self._shared_weights = self._ctx.Array('f', num_params)
+        self._weights_version = self._ctx.Value('i', 0)
+        self._shared_epsilon = self._ctx.Value('d', agent.epsilon)
+        self._queue = self._ctx.Queue(maxsize=queue_size or 4 * num_workers)
+        self._stop_event = self._ctx.Event()
+        self._seed = seed if seed is not None else random.randrange(2**31)
+        self._processes = []
+        self.publish_weights(agent)
+
+    def start(self):
+        for worker_id in range(self.num_workers):
+            p = self._ctx.Process(target=_rollout_worker, daemon=True,
+                                  args=(worker_id, self._seed + worker_id, self._shared_weights, self._weights_version,
+                                        self._shared_epsilon, self._queue, self._stop_event))
+            p.start()
+            self._processes.append(p)
+        return self
+
+    def publish_weights(self, agent):
+        flat = torch.nn.utils.parameters_to_vector(agent.policy_net.parameters()).detach().cpu().numpy()
+        with self._shared_weights.get_lock():
+            np.frombuffer(self._shared_weights.get_obj(), dtype=np.float32)[:] = flat
+            self._weights_version.value += 1
+        self._shared_epsilon.value = agent.epsilon
+
+    def set_epsilon(self, epsilon):
+        self._shared_epsilon.value = epsilon
+
+    def get_episode(self):
+        while True:
+            try:
+                _worker_id, transitions, episode_reward, boss_won, record = self._queue.get(timeout=1.0)
+                return transitions, episode_reward, boss_won, record
+            except queue.Empty:
+                if self._processes and not any(p.is_alive() for p in self._processes):
+                    raise RuntimeError("All rollout workers have exited.")
+
+    def stop(self):
+        self._stop_event.set()
+        # Drain so workers blocked on put() can see the stop event
+        try:
+            while True:
+                self._queue.get_nowait()
+        except queue.Empty:
+            pass
+        for p in self._processes:
+            p.join(timeout=5)
+            if p.is_alive():
+                p.terminate()
+        self._processes = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
@@ -0,0 +1,131 @@
+# shot_table.py
+# Precomputed outcomes of horizontal/vertical shots.
+# A shot only depends on what sits in its line, read in beam order. Each cell is one
+# of a few states (empty, or unit type + current HP), so a line is a base-S number
+# and every outcome (new cell states, hits, kills, reward, log lines) can be looked up.
+from collections import namedtuple
+from functools import lru_cache
+import numpy as np
+from units import PLAYER_UNIT_SPECS
+
+SHOT_INSTANCES = 4 # charges per shot
+MAX_TABLE_ENTRIES = 200000 # S ** grid_size above this is resolved lazily (memoized) instead
+MAX_MEMO_ENTRIES = 65536 # most recently used line outcomes kept by a lazy table
+
+# Cell states: 0 = empty, then (unit name, hp) for every unit type and hp 1..max_hp
+CELL_STATES = [None] + [(name, hp) for name, spec in PLAYER_UNIT_SPECS.items()
+                        for hp in range(1, spec["class"]().max_hp + 1)]
+NUM_CELL_STATES = len(CELL_STATES)
+CELL_CODE = {state: code for code, state in enumerate(CELL_STATES) if state}
+CELL_HP = [state[1] if state else 0 for state in CELL_STATES]
+
+# hits/kills: beam positions (0 = first cell reached); log: (position, text with a {pos} placeholder)
+ShotOutcome = namedtuple("ShotOutcome", ["new_cells", "hits", "kills", "reward", "log"])
+
+
+def simulate_shot(cells, damage=1, charges=SHOT_INSTANCES):
+    """Reference resolution of one shot, same rule as the old GameLogic walk.
+
+    cells: beam-ordered cell codes. Tanks absorb charges until destroyed or the
+    shot is exhausted; any other unit takes one charge and lets the beam through.
+    """
+    new_cells = list(cells)
+    hits, kills, log = [], [], []
+    reward = 0
+    for k, code in enumerate(cells):
+        if charges <= 0: break
+        if not code: continue
+        name, hp = CELL_STATES[code]
+        hits.append(k)
+        if name == "Tank":
+            log.append((k, f"  - Beam reaches Tank {name} at {{pos}}. HP: {hp}"))
+            hits_on_tank = 0
+            while charges > 0 and hp > 0:
+                log.append((k, f"    - Tank takes 1 hit from charge. ({charges-1} charges left)"))
+                hp = max(hp - damage, 0)
+                reward -= 10
+                charges -= 1
+                hits_on_tank += 1
+                if hp <= 0:
+                    log.append((k, f"    - Tank {name} destroyed after {hits_on_tank} hits!"))
+                    reward -= 20
+                    kills.append(k)
+                    break
+            if hp > 0:
+                log.append((k, f"    - Tank {name} survives. Skill exhausted on Tank."))
+                charges = 0
+        else:
+            log.append((k, f"  - Beam hits {name} at {{pos}} for 1 charge."))
+            hp = max(hp - damage, 0)
+            if hp <= 0:
+                reward += 15 # Thưởng lớn khi tiêu diệt unit khác bằng skill diện rộng
+                kills.append(k)
+                log.append((k, f"    - {name} destroyed!"))
+            else:
+                reward += 5
+                log.append((k, f"    - {name} survives. Beam continues..."))
+            charges -= 1
+        new_cells[k] = CELL_CODE[(name, hp)] if hp > 0 else 0
+    if not hits:
+        reward -= 2 # Phạt nhẹ khi bắn vào dòng/cột trống
+    return ShotOutcome(tuple(new_cells), tuple(hits), tuple(kills), reward, tuple(log))
+
+
+class ShotTable:
+    """All shot outcomes for one grid size, indexed by the encoded line.
+
+    lookup(code) gives a ShotOutcome for the scalar GameLogic. For the batched
+    engine, new_codes (N, G), rewards (N,) and num_kills (N,) hold the same
+    outcomes as arrays (only when the table is dense, i.e. S ** G is small).
+    """
+    def __init__(self, grid_size, damage=1, charges=SHOT_INSTANCES):
+        self.grid_size = grid_size
+        self.damage = damage
+        self.charges = charges
+        self.powers = [NUM_CELL_STATES ** k for k in range(grid_size)]
+        self.num_entries = NUM_CELL_STATES ** grid_size
+        self.dense = self.num_entries <= MAX_TABLE_ENTRIES
+        if self.dense:
+            self.outcomes = [simulate_shot(self.decode(code), damage, charges) for code in range(self.num_entries)]
+            self.new_codes = np.array([o.new_cells for o in self.outcomes], dtype=np.uint8)
+            self.rewards = np.array([o.reward for o in self.outcomes], dtype=np.int16)
+            self.num_kills = np.array([len(o.kills) for o in self.outcomes], dtype=np.int8)
+        else:
+            # Bounded: the number of distinct lines of a big grid is practically unlimited
+            self._lazy_outcome = lru_cache(maxsize=MAX_MEMO_ENTRIES)(
+                lambda code: simulate_shot(self.decode(code), damage, charges))
+
+    def decode(self, code):
+        cells = []
+        for _ in range(self.grid_size):
+            code, cell = divmod(code, NUM_CELL_STATES)
+            cells.append(cell)
+        return cells
+
+    def line_coords(self, horizontal, line_idx, reverse):
+        return _line_coords(self.grid_size, horizontal, line_idx, reverse)
+
+    def encode(self, grid_units, coords):
+        code = 0
+        for (r, c), power in zip(coords, self.powers):
+            unit = grid_units[r][c]
+            if unit:
+                code += CELL_CODE[(unit.name, unit.current_hp)] * power
+        return code
+
+    def lookup(self, code):
+        if self.dense:
+            return self.outcomes[code]
+        return self._lazy_outcome(code)
+
+
+@lru_cache(maxsize=None)
+def _line_coords(grid_size, horizontal, line_idx, reverse):
+    steps = range(grid_size - 1, -1, -1) if reverse else range(grid_size)
+    return tuple((line_idx, k) if horizontal else (k, line_idx) for k in steps)
+
+
+@lru_cache(maxsize=None)
+def get_shot_table(grid_size, damage=1, charges=SHOT_INSTANCES):
+    # Built once per process and shared by every GameLogic / BatchedGameEngine
+    return ShotTable(grid_size, damage, charges)
@@ -0,0 +1,115 @@
+# state_space.py
+# Dense integer index over every state the boss can face when it has to pick a skill.
+# Every STATE_FIELDS feature is a small bounded int, and the unit counts are further
+# bounded by the placement rules, so all decision states fit in a flat array.
+import numpy as np
+from boss import Boss
+from units import PLAYER_UNIT_SPECS
+from game_state import STATE_SIZE, COOLDOWN_KEYS
+
+
+class StateSpace:
+    """Mixed-radix index over the reachable boss decision states.
+
+    index = combo_id(round, Tank, Knight, AD) * inner_size + inner(hp, rage, cd_h, cd_v, cd_heal).
+    Only (round, unit counts) combos allowed by the placement rules get a combo id:
+    each type can have been placed at most max_accumulation + (round - 1) times, and
+    the board holds at most min(grid cells, units placeable so far). Cooldowns are
+    ticked at round start, so at decision time each is below its skill's cd.
+    States outside the space index to -1.
+    """
+    def __init__(self, grid_size=4, max_rounds=9, max_units_round_1=7, max_units_later_rounds=2):
+        boss = Boss()
+        self.grid_size = grid_size
+        self.max_rounds = max_rounds
+        self.max_units_round_1 = max_units_round_1
+        self.max_units_later_rounds = max_units_later_rounds
+        self.ultimate_rage_cost = boss.skills["ultimate"]["rage_cost"]
+        # Radix of each inner feature, in STATE_FIELDS order
+        self.inner_radix = np.array([boss.max_hp + 1, boss.max_rage + 1] +
+                                    [max(1, boss.skills[k]["cd"]) for k in COOLDOWN_KEYS], dtype=np.int64)
+        self.inner_size = int(np.prod(self.inner_radix))
+        self.inner_strides = np.array([int(np.prod(self.inner_radix[i + 1:])) for i in range(len(self.inner_radix))], dtype=np.int64)
+        self._radix = tuple(int(r) for r in self.inner_radix) # plain ints for the scalar index()
+        self._strides = tuple(int(s) for s in self.inner_strides)
+
+        max_stock = [spec["max_accumulation"] for spec in PLAYER_UNIT_SPECS.values()]
+        max_count = [m + max_rounds - 1 for m in max_stock]
+        combos = []
+        self.combo_ids = np.full((max_rounds + 1,) + tuple(c + 1 for c in max_count), -1, dtype=np.int32)
+        for rnd in range(1, max_rounds + 1):
+            board_cap = min(grid_size * grid_size, max_units_round_1 + max_units_later_rounds * (rnd - 1))
+            for counts in np.ndindex(*(m + rnd for m in max_stock)): # count_t <= max_t + rnd - 1
+                if sum(counts) <= board_cap:
+                    self.combo_ids[(rnd,) + counts] = len(combos)
+                    combos.append((rnd,) + counts)
+        self.combos = np.array(combos, dtype=np.int16) # (num_combos, 4): round, Tank, Knight, AD
+        self.size = len(combos) * self.inner_size
+        # First index of every (round, Tank, Knight, AD) combo, a plain dict for the scalar index()
+        self._combo_offsets = {(int(c[0]), int(c[1]), int(c[2]), int(c[3])): i * self.inner_size for i, c in enumerate(combos)}
+        # Exclusive upper bound of every feature in STATE_FIELDS order, for index_batch()
+        self._bounds = self._radix + tuple(c + 1 for c in max_count) + (max_rounds + 1,)
+
+    @classmethod
+    def from_description(cls, described):
+        """Rebuild the space a table was compiled for (describe() output); raises if it no longer matches the game."""
+        space = cls(grid_size=described["grid_size"], max_rounds=described["max_rounds"],
+                    max_units_round_1=described["max_units_round_1"],
+                    max_units_later_rounds=described["max_units_later_rounds"])
+        if space.describe() != described:
+            raise ValueError(f"state space {described} does not match the current game rules")
+        return space
+
+    def describe(self):
+        # JSON-friendly, stored with compiled tables to check they match the game
+        return {"grid_size": self.grid_size, "max_rounds": self.max_rounds,
+                "max_units_round_1": self.max_units_round_1, "max_units_later_rounds": self.max_units_later_rounds,
+                "inner_radix": self.inner_radix.tolist(), "num_combos": len(self.combos), "size": self.size}
+
+    def index(self, state_vec):
+        """Index of one 9-feature state vector (GameState.vec or a tuple of ints), -1 if outside the space."""
+        if not isinstance(state_vec, tuple):
+            state_vec = tuple(int(x) for x in state_vec)
+        hp, rage, cd_h, cd_v, cd_heal, tank, knight, ad, rnd = state_vec
+        base = self._combo_offsets.get((rnd, tank, knight, ad))
+        r_hp, r_rage, r_h, r_v, r_heal = self._radix
+        if base is None or not (0 <= hp < r_hp and 0 <= rage < r_rage and 0 <= cd_h < r_h
+                                and 0 <= cd_v < r_v and 0 <= cd_heal < r_heal):
+            return -1
+        s_hp, s_rage, s_h, s_v, _ = self._strides
+        return base + hp * s_hp + rage * s_rage + cd_h * s_h + cd_v * s_v + cd_heal
+
+    def index_batch(self, states):
+        """(B,) indices of a (B, STATE_SIZE) array, -1 outside the space."""
+        columns = np.ascontiguousarray(np.asarray(states).T, dtype=np.int32) # one row per feature
+        # Per-feature bound checks; as uint32 negative values wrap to huge ones, so one compare does both sides
+        valid = np.ones(columns.shape[1], dtype=bool)
+        for column, bound in zip(columns.view(np.uint32), self._bounds):
+            valid &= column < bound
+        columns = np.where(valid, columns, 0)
+        hp, rage, cd_h, cd_v, cd_heal, tank, knight, ad, rnd = columns
+        combo = self.combo_ids[rnd, tank, knight, ad].astype(np.int64)
+        valid &= combo >= 0
+        inner = hp * self._strides[0] + rage * self._strides[1] + cd_h * self._strides[2] + cd_v * self._strides[3] + cd_heal
+        return np.where(valid, combo * self.inner_size + inner, -1)
+
+    def states(self, start, stop):
+        """(stop - start, STATE_SIZE) float32 state vectors of indices start..stop-1."""
+        return self.states_at(np.arange(start, stop, dtype=np.int64))
+
+    def states_at(self, idx):
+        """(len(idx), STATE_SIZE) float32 state vectors of the given indices."""
+        idx = np.asarray(idx, dtype=np.int64)
+        combo, inner = np.divmod(idx, self.inner_size)
+        out = np.empty((len(idx), STATE_SIZE), dtype=np.float32)
+        out[:, :5] = (inner[:, None] // self.inner_strides) % self.inner_radix
+        out[:, 8] = self.combos[combo, 0]
+        out[:, 5:8] = self.combos[combo, 1:]
+        return out
+
+    def available_actions(self, states):
+        """(B, 5) availability mask implied by the state (Boss.get_available_skills_keys order)."""
+        mask = np.ones((len(states), 5), dtype=bool)
+        mask[:, 1:4] = states[:, 2:5] == 0
+        mask[:, 4] = states[:, 1] >= self.ultimate_rage_cost
+        return mask
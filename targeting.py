@@ -0,0 +1,181 @@
+# targeting.py
+# Boss targeting for a whole batch of boards at once, shared by both agents, the
+# fallback AI and the batched environments.
+# Boards are (B, N) arrays of unit type ids in BatchedGameEngine's layout (flat cell
+# r * grid_size + c, 0 = empty); a single GameLogic board uses skill_params_for_board().
+# Every random draw comes from the np.random.Generator passed in.
+import numpy as np
+from bitboard import Bitboard, as_bitboard, iter_bits
+from game_constants import (UNIT_TYPE_NAMES, UNIT_TYPE_IDS, NORMAL_ATTACK,
+                            HORIZONTAL_SHOT, VERTICAL_SHOT, ULTIMATE, ULTIMATE_MAX_TARGETS)
+
+# Normal attack goes for ADs first, then Knights, then Tanks
+_ATTACK_PRIORITY = np.array([{"": 0, "Tank": 1, "Knight": 2, "AD": 3}[name] for name in UNIT_TYPE_NAMES], dtype=np.int8)
+# Shots aim at the line with the most units that don't absorb the beam
+_SHOT_WORTHY = np.array([name in ("AD", "Knight") for name in UNIT_TYPE_NAMES], dtype=bool)
+# Same rules as unit-name groups for the single-board path
+_PRIORITY_GROUPS = tuple((name,) for name in sorted(UNIT_TYPE_IDS, key=lambda n: -_ATTACK_PRIORITY[UNIT_TYPE_IDS[n]]))
+_SHOT_WORTHY_NAMES = tuple(name for name in UNIT_TYPE_IDS if _SHOT_WORTHY[UNIT_TYPE_IDS[name]])
+
+
+def board_types(board):
+    """(N,) unit type ids of one board (a Bitboard, a grid_units matrix or already a type row)."""
+    if isinstance(board, np.ndarray):
+        return board
+    board = as_bitboard(board)
+    types = np.zeros(board.grid_size * board.grid_size, dtype=np.int8)
+    for name, mask in board.masks.items():
+        types[list(iter_bits(mask))] = UNIT_TYPE_IDS[name]
+    return types
+
+
+def type_bitboards(types, grid_size):
+    """Bitboard of every (N,) type row of types (B, N), the inverse of board_types()."""
+    types = np.asarray(types)
+    cells = np.arange(types.shape[1])
+    # One mask per board and unit type; object dtype keeps Python ints for grids past 64 cells
+    weights = (1 << cells).astype(np.int64) if len(cells) < 63 else np.array([1 << int(c) for c in cells], dtype=object)
+    masks = {name: np.where(types == type_id, weights, 0).sum(axis=1).tolist() for name, type_id in UNIT_TYPE_IDS.items()}
+    return [Bitboard(grid_size, {name: masks[name][b] for name in UNIT_TYPE_IDS}) for b in range(len(types))]
+
+
+def _random_pick(candidates, rng):
+    # One uniformly random True column per row, -1 for rows without any
+    keys = np.where(candidates, rng.random(candidates.shape), -1.0)
+    return np.where(candidates.any(axis=1), keys.argmax(axis=1), -1)
+
+
+def normal_attack_targets(types, rng, prioritize=True):
+    """(B,) target cell: a random unit of the highest priority type present (any unit if not prioritize)."""
+    if prioritize:
+        tier = _ATTACK_PRIORITY[types]
+        candidates = (tier > 0) & (tier == tier.max(axis=1, keepdims=True))
+    else:
+        candidates = types > 0
+    return _random_pick(candidates, rng)
+
+
+def shot_targets(types, grid_size, horizontal, rng, best_line=True):
+    """(line, reverse) per board.
+
+    best_line picks the first row/column with the most ADs + Knights (the old
+    strict '>' scan), otherwise the line is uniform. The direction is always a coin flip.
+    """
+    B = len(types)
+    if best_line:
+        worthy = _SHOT_WORTHY[types].reshape(B, grid_size, grid_size)
+        line = worthy.sum(axis=2 if horizontal else 1).argmax(axis=1)
+    else:
+        line = rng.integers(0, grid_size, size=B)
+    reverse = rng.random(B) < 0.5
+    return line, reverse
+
+
+def ultimate_targets(types, rng, max_targets=ULTIMATE_MAX_TARGETS):
+    """(B, max_targets) cells: every unit in random order, topped up with random empty cells (-1 padding)."""
+    keys = rng.random(types.shape) + (types == 0) # units sort into [0, 1), empty cells into [1, 2)
+    cells = np.argsort(keys, axis=1)[:, :max_targets]
+    if cells.shape[1] < max_targets:
+        cells = np.pad(cells, ((0, 0), (0, max_targets - cells.shape[1])), constant_values=-1)
+    return cells
+
+
+def select_targets(types, grid_size, actions, rng, heuristic=True):
+    """Targets for every board's action, in BatchedGameEngine.boss_step format.
+
+    Only the boards using a skill get targets drawn for it. heuristic=False
+    gives the fallback AI's rules (any unit for normal attack, random shot line).
+    """
+    types = np.asarray(types)
+    actions = np.asarray(actions)
+    B = len(types)
+    targets = {}
+    is_normal = actions == NORMAL_ATTACK
+    if is_normal.any():
+        targets["cell"] = np.full(B, -1, dtype=np.int64)
+        targets["cell"][is_normal] = normal_attack_targets(types[is_normal], rng, prioritize=heuristic)
+    for action, horizontal in ((HORIZONTAL_SHOT, True), (VERTICAL_SHOT, False)):
+        is_shot = actions == action
+        if is_shot.any():
+            if "line" not in targets:
+                targets["line"] = np.zeros(B, dtype=np.int64)
+                targets["reverse"] = np.zeros(B, dtype=bool)
+            line, reverse = shot_targets(types[is_shot], grid_size, horizontal, rng, best_line=heuristic)
+            targets["line"][is_shot] = line
+            targets["reverse"][is_shot] = reverse
+    is_ult = actions == ULTIMATE
+    if is_ult.any():
+        targets["ultimate"] = np.full((B, ULTIMATE_MAX_TARGETS), -1, dtype=np.int64)
+        targets["ultimate"][is_ult] = ultimate_targets(types[is_ult], rng)
+    return targets
+
+
+def to_skill_params(skill_key, targets, i, grid_size):
+    """Board i of select_targets() output in GameLogic's skill_params format."""
+    if skill_key == "normal_attack":
+        cell = int(targets["cell"][i])
+        return [divmod(cell, grid_size)] if cell >= 0 else []
+    if skill_key in ("horizontal_shot", "vertical_shot"):
+        reverse = bool(targets["reverse"][i])
+        if skill_key == "horizontal_shot":
+            direction = "rtl" if reverse else "ltr"
+        else:
+            direction = "btt" if reverse else "ttb"
+        return {"line_idx": int(targets["line"][i]), "direction": direction}
+    if skill_key == "ultimate":
+        return [divmod(int(cell), grid_size) for cell in targets["ultimate"][i] if cell >= 0]
+    return {}
+
+
+def empty_targets(num_boards):
+    """select_targets()-format arrays with no target on any board, for set_skill_params()."""
+    return {"cell": np.full(num_boards, -1, dtype=np.int64), "line": np.zeros(num_boards, dtype=np.int64),
+            "reverse": np.zeros(num_boards, dtype=bool),
+            "ultimate": np.full((num_boards, ULTIMATE_MAX_TARGETS), -1, dtype=np.int64)}
+
+
+def set_skill_params(targets, i, skill_key, skill_params, grid_size):
+    """Writes one board's skill_params into targets (the inverse of to_skill_params)."""
+    if skill_key == "normal_attack":
+        targets["cell"][i] = skill_params[0][0] * grid_size + skill_params[0][1] if skill_params else -1
+    elif skill_key in ("horizontal_shot", "vertical_shot"):
+        targets["line"][i] = skill_params["line_idx"]
+        targets["reverse"][i] = skill_params["direction"] in ("rtl", "btt")
+    elif skill_key == "ultimate":
+        targets["ultimate"][i, :len(skill_params)] = [r * grid_size + c for r, c in skill_params]
+
+
+def skill_params_for_board(skill_key, board, rng, heuristic=True):
+    """Same rules as select_targets() for one GameLogic board, in skill_params format.
+
+    Works on the Bitboard directly (popcounts and bit iteration) since NumPy
+    overhead dominates at batch size 1.
+    """
+    board = as_bitboard(board)
+    G = board.grid_size
+    if skill_key == "normal_attack":
+        for names in (_PRIORITY_GROUPS if heuristic else (tuple(board.masks),)):
+            cells = board.cells(board.mask_of(*names))
+            if cells:
+                return [cells[int(rng.integers(len(cells)))]]
+        return []
+    if skill_key in ("horizontal_shot", "vertical_shot"):
+        horizontal = skill_key == "horizontal_shot"
+        if heuristic:
+            worthy = board.mask_of(*_SHOT_WORTHY_NAMES)
+            counts = board.row_counts(worthy) if horizontal else board.col_counts(worthy)
+            line = counts.index(max(counts))
+        else:
+            line = int(rng.integers(G))
+        reverse = rng.random() < 0.5
+        if horizontal:
+            return {"line_idx": line, "direction": "rtl" if reverse else "ltr"}
+        return {"line_idx": line, "direction": "btt" if reverse else "ttb"}
+    if skill_key == "ultimate":
+        units = board.cells(board.occupied)
+        targets = [units[i] for i in rng.permutation(len(units))[:ULTIMATE_MAX_TARGETS]]
+        if len(targets) < ULTIMATE_MAX_TARGETS:
+            empty = board.cells(board.empty)
+            targets += [empty[i] for i in rng.permutation(len(empty))[:ULTIMATE_MAX_TARGETS - len(targets)]]
+        return targets
+    return {}
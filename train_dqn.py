@@ -1,84 +1,178 @@
-import sys
 import os
 import csv
-from PyQt5.QtWidgets import QApplication
-from agent_dqn import DQNAgent, get_game_state_for_dqn
-from main import TacticsGridWindow
+import time
+import argparse
+from collections import deque
+from agent_dqn import DQNAgent
+from episode_runner import EpisodeRunner
+from episode_record import episode_record, record_line
 
 NUM_EPISODES_TO_TRAIN = 200000
 SAVE_AGENT_EVERY_N_EPISODES = 5000
+SYNC_WORKER_WEIGHTS_EVERY_N_EPISODES = 10
 TRAINING_STATS_FILE = "Model/training_stats_dqn.csv"
+TRAINING_STATS_COLUMNS = ['Episode', 'AvgReward', 'WinRate_Boss', 'Epsilon', 'EpisodesToThreshold', 'TargetMode']
+WIN_RATE_THRESHOLD = 95.0 # % boss win rate counted as "converged"
+THRESHOLD_WINDOW = 1000 # episodes in the rolling win rate checked against the threshold
 DQN_MODEL_FILE = "Model/dqn_agent.pt"
 
-def run_training_loop_dqn(window, agent, num_episodes):
-    window.is_fast_mode_training = True
-    all_episode_rewards = []
-    recent_outcomes = []
-    file_exists = os.path.isfile(TRAINING_STATS_FILE)
-    with open(TRAINING_STATS_FILE, 'a', newline='') as csvfile:
-        csv_writer = csv.writer(csvfile)
-        if not file_exists:
-            csv_writer.writerow(['Episode', 'AvgReward', 'WinRate_Boss', 'Epsilon'])
+class UpdateSchedule:
+    """Gradient work per environment step, independent of how transitions are collected.
+
+    Every boss transition decays epsilon once; every train_every transitions the
+    agent does gradient_steps updates on batches of batch_size.
+    """
+    def __init__(self, agent, train_every=1, gradient_steps=1, batch_size=None):
+        self.agent = agent
+        self.train_every = max(1, train_every)
+        self.gradient_steps = gradient_steps
+        self.batch_size = batch_size or agent.batch_size
+        self.env_steps = 0
+        self.gradient_updates = 0
+
+    def on_transition(self):
+        self.env_steps += 1
+        self.agent.decay_epsilon()
+        if self.env_steps % self.train_every == 0 and len(self.agent.memory) >= self.batch_size:
+            self.agent.replay(num_steps=self.gradient_steps, batch_size=self.batch_size)
+            self.gradient_updates += self.gradient_steps
+
+def _local_episodes(runner, agent, schedule, num_episodes, store=None, episode_log=None):
+    def on_boss_transition(state_dict, action_idx, reward, next_state_dict, done):
+        agent.remember_states(state_dict, action_idx, reward, next_state_dict, done)
+        schedule.on_transition()
+        if store is not None:
+            store.record(state_dict, action_idx, reward, next_state_dict, done)
+    for _ in range(num_episodes):
+        result = runner.run_episode(on_boss_transition=on_boss_transition)
+        agent.end_episode()
+        if store is not None:
+            store.end_episode() # one transaction per episode
+        if episode_log is not None:
+            episode_log.write(record_line(episode_record(runner.game)) + "\n")
+        yield result
+
+def _worker_episodes(agent, schedule, num_episodes, num_workers, store=None, episode_log=None):
+    # Actor/learner: workers play, this process does every gradient step
+    from rollout_workers import RolloutWorkerPool
+    with RolloutWorkerPool(agent, num_workers) as pool:
         for e in range(num_episodes):
-            window.current_episode_count = e + 1
-            current_game_state_dict = window.game.start_new_game()
-            episode_reward = 0
-            for game_round_num in range(window.game.max_rounds + 2):
-                is_game_over, _ = window.game.check_game_over_conditions()
-                if is_game_over:
-                    break
-                # Player turn (random)
-                state_dict_after_player, reward_player_phase, done_player_phase = window.execute_player_turn_for_training()
-                episode_reward += reward_player_phase
-                if done_player_phase:
-                    break
-                # Boss turn (DQN agent)
-                current_state_dict_for_boss_action = state_dict_after_player
-                boss_turn_results = window.execute_boss_turn_for_training()
-                status_ui_boss_turn, _msg_ui, _anim, next_state_dict_after_boss, reward_for_boss_this_action, done_after_boss, state_dict_boss_acted_on, action_idx_boss_took = boss_turn_results
-                episode_reward += reward_for_boss_this_action
-                # DQN update
-                if action_idx_boss_took is not None and state_dict_boss_acted_on is not None:
-                    agent.learn(state_dict_boss_acted_on, action_idx_boss_took, reward_for_boss_this_action, next_state_dict_after_boss, done_after_boss)
-                if done_after_boss:
-                    break
-                status_nr, msg_nr, next_state_dict_new_round = window.execute_next_round_for_training()
-                if status_nr == "game_over":
-                    break
-            boss_won_episode = False
-            final_is_game_over, final_message = window.game.check_game_over_conditions()
-            if final_is_game_over:
-                if window.game.boss.current_hp <= 0:
-                    boss_won_episode = False
-                else:
-                    boss_won_episode = True
+            transitions, episode_reward, boss_won, record = pool.get_episode()
+            if transitions is not None:
+                for state_vec, action_idx, reward, next_state_vec, done in zip(*transitions):
+                    agent.remember(state_vec, int(action_idx), float(reward), next_state_vec, bool(done))
+                    schedule.on_transition()
+                    if store is not None:
+                        store.record(state_vec, action_idx, reward, next_state_vec, done)
+            agent.end_episode()
+            if store is not None:
+                store.end_episode()
+            if episode_log is not None:
+                episode_log.write(record_line(record) + "\n")
+            if (e + 1) % SYNC_WORKER_WEIGHTS_EVERY_N_EPISODES == 0:
+                pool.publish_weights(agent)
             else:
-                boss_won_episode = False
+                pool.set_epsilon(agent.epsilon)
+            yield episode_reward, boss_won
+
+def _read_header(path):
+    if not os.path.isfile(path):
+        return None
+    with open(path, newline='') as f:
+        return next(csv.reader(f), None)
+
+def _open_stats_csv(path):
+    # A stats file with another header (the old 4-column one) is history: leave it untouched
+    # and append this run to a sibling file for the current columns instead
+    header = _read_header(path)
+    if header is not None and header != TRAINING_STATS_COLUMNS:
+        root, ext = os.path.splitext(path)
+        path = f"{root}_{len(TRAINING_STATS_COLUMNS)}col{ext}"
+        print(f"Stats go to {path} (the existing stats file has other columns)")
+        header = _read_header(path)
+    csvfile = open(path, 'a', newline='')
+    if header is None:
+        csv.writer(csvfile).writerow(TRAINING_STATS_COLUMNS)
+    return csvfile
+
+def run_training_loop_dqn(runner, agent, num_episodes, num_workers=0, schedule=None, win_rate_threshold=WIN_RATE_THRESHOLD, experience_store=None, episode_log=None):
+    # episode_log: open text file that gets one episode_record.py line per episode
+    schedule = schedule or UpdateSchedule(agent)
+    all_episode_rewards = []
+    recent_outcomes = deque(maxlen=SAVE_AGENT_EVERY_N_EPISODES)
+    threshold_window = deque(maxlen=THRESHOLD_WINDOW)
+    episodes_to_threshold = None
+    target_mode = agent.describe_target_mode()
+    if num_workers > 0:
+        episodes = _worker_episodes(agent, schedule, num_episodes, num_workers, store=experience_store, episode_log=episode_log)
+    else:
+        episodes = _local_episodes(runner, agent, schedule, num_episodes, store=experience_store, episode_log=episode_log)
+    start_time = time.perf_counter()
+    with _open_stats_csv(TRAINING_STATS_FILE) as csvfile:
+        csv_writer = csv.writer(csvfile)
+        for e, (episode_reward, boss_won_episode) in enumerate(episodes):
             all_episode_rewards.append(episode_reward)
             recent_outcomes.append(1 if boss_won_episode else 0)
-            if len(recent_outcomes) > SAVE_AGENT_EVERY_N_EPISODES:
-                recent_outcomes.pop(0)
+            threshold_window.append(1 if boss_won_episode else 0)
+            if episodes_to_threshold is None and len(threshold_window) == THRESHOLD_WINDOW and \
+               sum(threshold_window) * 100 / THRESHOLD_WINDOW >= win_rate_threshold:
+                episodes_to_threshold = e + 1
+                print(f"Reached {win_rate_threshold:.1f}% boss win rate (last {THRESHOLD_WINDOW}) after {episodes_to_threshold} episodes ({target_mode}).")
             if (e + 1) % SAVE_AGENT_EVERY_N_EPISODES == 0:
                 avg_reward = sum(all_episode_rewards[-SAVE_AGENT_EVERY_N_EPISODES:]) / len(all_episode_rewards[-SAVE_AGENT_EVERY_N_EPISODES:])
                 win_rate_boss = sum(recent_outcomes) / len(recent_outcomes) * 100 if recent_outcomes else 0
-                log_str = f"Ep {e+1}/{num_episodes}. Avg Reward (last {SAVE_AGENT_EVERY_N_EPISODES}): {avg_reward:.2f}. Win Rate (Boss): {win_rate_boss:.1f}%. Epsilon: {agent.epsilon:.4f}"
+                episodes_per_sec = (e + 1) / (time.perf_counter() - start_time)
+                log_str = f"Ep {e+1}/{num_episodes}. Avg Reward (last {SAVE_AGENT_EVERY_N_EPISODES}): {avg_reward:.2f}. Win Rate (Boss): {win_rate_boss:.1f}%. Epsilon: {agent.epsilon:.4f}. Updates: {schedule.gradient_updates}/{schedule.env_steps} steps. Speed: {episodes_per_sec:.1f} ep/s"
                 print(log_str)
-                csv_writer.writerow([e + 1, f"{avg_reward:.2f}", f"{win_rate_boss:.1f}", f"{agent.epsilon:.4f}"])
+                csv_writer.writerow([e + 1, f"{avg_reward:.2f}", f"{win_rate_boss:.1f}", f"{agent.epsilon:.4f}",
+                                     episodes_to_threshold if episodes_to_threshold is not None else '', target_mode])
                 csvfile.flush()
                 agent.save(DQN_MODEL_FILE)
-    window.is_fast_mode_training = False
+    elapsed = time.perf_counter() - start_time
     agent.save(DQN_MODEL_FILE)
-    print(f"Training finished. DQN model saved to {DQN_MODEL_FILE}")
+    print(f"Training finished in {elapsed:.1f}s ({num_episodes / elapsed if elapsed > 0 else 0:.1f} ep/s). DQN model saved to {DQN_MODEL_FILE}")
 
 def main():
-    app = QApplication(sys.argv)
-    dqn_agent = DQNAgent(model_file=DQN_MODEL_FILE)
-    window = TacticsGridWindow(agent_to_use=dqn_agent)
-    window.show()
-    print("Starting DQN training loop...")
-    run_training_loop_dqn(window, dqn_agent, NUM_EPISODES_TO_TRAIN)
-    print(f"Training finished. DQN model saved to {DQN_MODEL_FILE}")
-    app.quit()
+    parser = argparse.ArgumentParser(description="Train the boss DQN agent (headless).")
+    parser.add_argument("--episodes", type=int, default=NUM_EPISODES_TO_TRAIN)
+    parser.add_argument("--workers", type=int, default=0, help="Rollout worker processes (0 = play in the learner process)")
+    parser.add_argument("--prioritized", action="store_true", help="Use prioritized experience replay (sum-tree)")
+    parser.add_argument("--train-every", type=int, default=1, help="Do a round of gradient updates every K boss transitions")
+    parser.add_argument("--gradient-steps", type=int, default=1, help="Gradient updates per round")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--target-update", choices=["none", "hard", "soft"], default="none", help="Frozen target network sync mode")
+    parser.add_argument("--target-update-every", type=int, default=1000, help="Gradient steps between hard target syncs")
+    parser.add_argument("--tau", type=float, default=0.005, help="Polyak factor for soft target syncs")
+    parser.add_argument("--double-dqn", action="store_true", help="Double-DQN targets (implies a target network)")
+    parser.add_argument("--n-step", type=int, default=1, help="n-step returns in replay")
+    parser.add_argument("--inference", choices=["torch", "numpy"], default="torch", help="Q-value path used by choose_action")
+    parser.add_argument("--win-rate-threshold", type=float, default=WIN_RATE_THRESHOLD, help="Boss win rate %% recorded as EpisodesToThreshold")
+    parser.add_argument("--experience-db", help="Also store every boss transition in this SQLite file (experience_store.py)")
+    parser.add_argument("--episode-log", help="Append a compact replayable record of every episode to this file (episode_record.py)")
+    args = parser.parse_args()
+
+    dqn_agent = DQNAgent(model_file=DQN_MODEL_FILE, prioritized_replay=args.prioritized, batch_size=args.batch_size,
+                         target_update=None if args.target_update == "none" else args.target_update,
+                         target_update_every=args.target_update_every, tau=args.tau, double_dqn=args.double_dqn,
+                         n_step=args.n_step, inference=args.inference)
+    runner = EpisodeRunner(agent=dqn_agent)
+    schedule = UpdateSchedule(dqn_agent, train_every=args.train_every, gradient_steps=args.gradient_steps)
+    mode = f"{args.workers} rollout workers" if args.workers > 0 else "single process"
+    print(f"Starting DQN training loop (headless, {mode})...")
+    experience_store = None
+    if args.experience_db:
+        from experience_store import ExperienceStore
+        experience_store = ExperienceStore(args.experience_db, source="train_dqn")
+    episode_log = open(args.episode_log, "a") if args.episode_log else None
+    try:
+        run_training_loop_dqn(runner, dqn_agent, args.episodes, num_workers=args.workers, schedule=schedule,
+                              win_rate_threshold=args.win_rate_threshold, experience_store=experience_store,
+                              episode_log=episode_log)
+    finally:
+        if experience_store is not None:
+            experience_store.close()
+        if episode_log is not None:
+            episode_log.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()